@@ -40,6 +40,9 @@ def create_app(config_class=Config):
     from backend.api.maintenance import maintenance_bp
     from backend.api.reports import reports_bp
     from backend.api.automation import automation_bp
+    from backend.api.sync import sync_bp
+    from backend.api.search import search_bp
+    from backend.api.imports import imports_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(work_orders_bp, url_prefix='/api/work-orders')
@@ -48,6 +51,9 @@ def create_app(config_class=Config):
     app.register_blueprint(rcm_bp, url_prefix='/api/rcm')
     app.register_blueprint(reports_bp, url_prefix='/api/reports')
     app.register_blueprint(automation_bp, url_prefix='/api/optimization')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(imports_bp, url_prefix='/api/imports')
 
     #add jwt callbacks
     @jwt.invalid_token_loader
@@ -64,13 +70,30 @@ def create_app(config_class=Config):
         from backend.models.work_order import WorkOrder
         from backend.models.maintenance_log import MaintenanceLog
         from backend.models.failure import Failure, FailureImage
-        from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance
+        from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance, RCMRevision
+        from backend.models.sync import SyncTombstone
+        from backend.models.table_version import TableVersion
+        from backend.models.maintenance_due_state import MaintenanceDueState
+        from backend.models.import_job import ImportJob
+        from backend.models.reliability_rollup import ReliabilityDaily, MachineHoursDaily
+        from backend.models.dashboard_summary import DashboardSummary
         
         try:
             db.create_all()
             print("Database tables created successfully!")
         except Exception as e:
             print(f"Error creating database tables: {e}")
+        
+        # Add columns and indexes declared after the tables were first created
+        from backend.schema import upgrade_schema
+        try:
+            upgrade_schema()
+        except Exception as e:
+            print(f"Error upgrading database schema: {e}")
+    
+    # Register CLI commands (upgrade-db, check-query-plans)
+    from backend.commands import register_commands
+    register_commands(app)
     """
         # Create database tables
     with app.app_context():
@@ -0,0 +1,108 @@
+"""
+Role based access for API routes
+"""
+# The user's role is put in the JWT at login, so routes can be authorized
+# without loading the User row. The row itself is only loaded when a route
+# asks for it, and then at most once per request (cached on flask.g).
+#
+# When AUTH_ROLE_CACHE_TTL is set (seconds), the role is instead read from a
+# small in-process cache that is refreshed from the database. That makes a
+# role change take effect before the token expires, without a query per request.
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, jsonify, current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import event
+from backend.models.user import User
+
+class RoleCache:
+    """Bounded user_id -> role cache with a time to live per entry"""
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, ttl):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            role, stored_at = entry
+            if time.monotonic() - stored_at > ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return role
+
+    def set(self, user_id, role):
+        with self._lock:
+            self._entries[user_id] = (role, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+role_cache = RoleCache()
+
+@event.listens_for(User.role, 'set')
+def _invalidate_role_on_change(target, value, oldvalue, initiator):
+    if target.id is not None and value != oldvalue:
+        role_cache.invalidate(str(target.id))
+
+@event.listens_for(User, 'after_update')
+def _invalidate_role_on_update(mapper, connection, target):
+    role_cache.invalidate(str(target.id))
+
+def current_user():
+    """The User row for the request's token, loaded at most once per request"""
+    if 'current_user' not in g:
+        g.current_user = User.query.get(get_jwt_identity())
+    return g.current_user
+
+def current_role():
+    """The role of the request's user, without a database query when possible"""
+    if 'current_role' in g:
+        return g.current_role
+
+    user_id = get_jwt_identity()
+    ttl = current_app.config.get('AUTH_ROLE_CACHE_TTL', 0)
+    role = None
+
+    if ttl:
+        role = role_cache.get(user_id, ttl)
+        if role is None:
+            user = current_user()
+            role = user.role if user else None
+            if role is not None:
+                role_cache.set(user_id, role)
+    else:
+        role = get_jwt().get('role')
+        if role is None:
+            # Tokens issued before the role claim was added
+            user = current_user()
+            role = user.role if user else None
+
+    g.current_role = role
+    return role
+
+def require_role(*roles, message="Unauthorized"):
+    """Only let users with one of the given roles call the route, 403 otherwise"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if current_role() not in roles:
+                return jsonify(message=message), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -17,7 +17,8 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     if user and user.check_password(password):
-        access_token = create_access_token(identity=str(user.id))
+        # The role claim lets routes authorize without loading the user (see backend/api/access.py)
+        access_token = create_access_token(identity=str(user.id), additional_claims={'role': user.role})
         return jsonify(access_token=access_token, role=user.role, username=user.username), 200
     return jsonify(message="Invalid credentials"), 401
 
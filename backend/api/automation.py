@@ -3,6 +3,7 @@ API endpoints for maintenance automation
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from backend.api.access import require_role
 from backend.models.user import User
 from backend.models.machine import Component
 from backend.models.maintenance_settings import OptimizationResult, MaintenanceSettings, IntervalAdjustmentHistory
@@ -21,15 +22,9 @@ automation_bp = Blueprint('automation', __name__)
 
 @automation_bp.route('/analyze-component/<int:component_id>', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def analyze_component(component_id):
     """Analyze a specific component for maintenance interval optimization"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Check if user has permission
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
-    
     # Check if component exists
     component = Component.query.get(component_id)
     if not component:
@@ -60,14 +55,10 @@ def analyze_component(component_id):
 
 @automation_bp.route('/apply-optimization/<int:analysis_id>', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def apply_optimization(analysis_id):
     """Apply optimization results to maintenance schedules"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Check if user has permission
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
     
     # Get the optimization result
     optimization = OptimizationResult.query.get(analysis_id)
@@ -101,15 +92,9 @@ def apply_optimization(analysis_id):
 
 @automation_bp.route('/adjustment-history/<int:component_id>', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def get_adjustment_history(component_id):
     """Get the history of interval adjustments for a component"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Check if user has permission
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
-    
     # Get component
     component = Component.query.get(component_id)
     if not component:
@@ -227,14 +212,10 @@ def get_adjustment_history(component_id):
 
 @automation_bp.route('/settings/component/<int:component_id>', methods=['GET', 'POST'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def component_settings(component_id):
     """Get or update maintenance settings for a component"""
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only admins and supervisors can view and change settings
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
     
     # Check if component exists
     component = Component.query.get(component_id)
@@ -338,15 +319,9 @@ def component_settings(component_id):
 
 @automation_bp.route('/generate-updated-work-orders', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def generate_updated_work_orders():
     """Generate new work orders based on updated maintenance intervals"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only admins and supervisors can generate work orders
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
-    
     # Generate work orders
     generated_orders = IntervalAdjustmentService.generate_updated_work_orders()
     
@@ -358,15 +333,9 @@ def generate_updated_work_orders():
 
 @automation_bp.route('/validate-optimization-effectiveness', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin', message="Not authorized")
 def validate_optimization_effectiveness():
     """Analyze the effectiveness of previously applied optimizations"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only admins and supervisors can view effectiveness metrics
-    if user.role not in ['admin', 'supervisor']:
-        return jsonify(message="Not authorized"), 403
-    
     # Get days parameter
     days = request.args.get('days', 90, type=int)
     
@@ -377,14 +346,9 @@ def validate_optimization_effectiveness():
 
 @automation_bp.route('/scheduler-status', methods=['GET'])
 @jwt_required()
+@require_role('admin', message="Not authorized")
 def get_scheduler_status():
     """Get the current status of the maintenance scheduler"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify(message="Not authorized"), 403
-    
     is_running = maintenance_scheduler.running
     analysis_method = 'kaplan_meier' if maintenance_scheduler.use_kaplan_meier else 'weibull'
     
@@ -410,14 +374,9 @@ def get_scheduler_status():
 
 @automation_bp.route('/scheduler/start', methods=['POST'])
 @jwt_required()
+@require_role('admin', message="Not authorized")
 def start_scheduler():
     """Start the maintenance scheduler"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify(message="Not authorized"), 403
-    
     if maintenance_scheduler.running:
         return jsonify(success=False, message="Scheduler is already running")
     
@@ -427,14 +386,9 @@ def start_scheduler():
 
 @automation_bp.route('/scheduler/stop', methods=['POST'])
 @jwt_required()
+@require_role('admin', message="Not authorized")
 def stop_scheduler():
     """Stop the maintenance scheduler"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify(message="Not authorized"), 403
-    
     if not maintenance_scheduler.running:
         return jsonify(success=False, message="Scheduler is not running")
     
@@ -0,0 +1,47 @@
+"""
+Conditional GET for read-heavy endpoints
+"""
+# The ETag is a hash of the request URL and the change counters of the tables
+# the response is built from (see models/table_version.py). When the client
+# already has that version, the route is not called at all and a 304 is sent.
+import hashlib
+from functools import wraps
+from flask import request, make_response
+from flask_jwt_extended import get_jwt_identity
+from backend.models.table_version import get_table_versions
+
+def compute_etag(table_names, vary_on_user=False):
+    """ETag for the current request given the tables its response reads"""
+    versions = get_table_versions(table_names)
+    parts = [request.full_path]
+    if vary_on_user:
+        parts.append(f"user={get_jwt_identity()}")
+    parts.extend(f"{name}={versions[name]}" for name in sorted(versions))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def conditional_get(*table_names, vary_on_user=False):
+    """
+    Answer with 304 Not Modified when If-None-Match matches the tables' version
+
+    Args:
+        table_names: Tables the response is built from
+        vary_on_user: Set when the response depends on who is asking
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(table_names, vary_on_user)
+
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            # Let clients keep the copy but always revalidate it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
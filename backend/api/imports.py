@@ -0,0 +1,97 @@
+"""
+Background import job routes
+"""
+import hashlib
+import os
+import uuid
+from flask import Blueprint, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.utils import secure_filename
+from backend.api.access import current_role
+from backend.database import db
+from backend.models.import_job import ImportJob
+from backend.services.import_jobs import import_jobs, upload_folder, combined_hash
+
+imports_bp = Blueprint('imports', __name__)
+
+MAX_LISTED_JOBS = 50
+
+# Bytes read at a time while hashing an upload
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def save_upload(file):
+    """
+    Save an uploaded import file and hash its content
+
+    Every upload gets its own file, even when the content was uploaded before:
+    a stored copy can be deleted by a job finishing at any moment, and
+    repeated imports are caught by the result cache through the hash instead.
+
+    Returns:
+        (file_path, content_hash)
+    """
+    folder = upload_folder()
+    upload_id = uuid.uuid4()
+    temp_path = os.path.join(folder, f"{upload_id}.part")
+    digest = hashlib.sha256()
+    with open(temp_path, 'wb') as out:
+        for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+
+    extension = os.path.splitext(secure_filename(file.filename))[1].lower()
+    file_path = os.path.join(folder, f"{upload_id}{extension}")
+    os.replace(temp_path, file_path)
+    return file_path, digest.hexdigest()
+
+def submit_batch_import(kind, params, files):
+    """Save several uploaded files and queue one job importing all of them, returns the ImportJob"""
+    saved = [save_upload(file) for file in files]
+    return import_jobs.submit(
+        kind,
+        {**params, 'file_paths': [path for path, _ in saved], 'file_names': [file.filename for file in files]},
+        created_by=int(get_jwt_identity()),
+        content_hash=combined_hash([content_hash for _, content_hash in saved]),
+        original_filename=', '.join(file.filename for file in files)[:255]
+    )
+
+def import_job_accepted(job):
+    """202 response pointing the client at the job to poll"""
+    status_url = url_for('imports.get_import_job', job_id=job.id)
+    response = jsonify(message="Import started", job_id=job.id, status=job.status, status_url=status_url)
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+def _job_dict(job):
+    data = job.to_dict()
+    # Counters of a running job live in memory until it finishes
+    live = import_jobs.progress(job.id)
+    if live is not None and job.status in ('queued', 'running'):
+        data.update(live)
+    return data
+
+def _can_see(job):
+    return job.created_by == int(get_jwt_identity()) or current_role() == 'admin'
+
+@imports_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+def get_import_job(job_id):
+    """Status, progress and outcome of an import job"""
+    job = db.session.get(ImportJob, job_id)
+    if not job or not _can_see(job):
+        return jsonify(message="Import job not found"), 404
+    
+    return jsonify(job=_job_dict(job))
+
+@imports_bp.route('/', methods=['GET'])
+@imports_bp.route('', methods=['GET'])
+@jwt_required()
+def list_import_jobs():
+    """The user's most recent import jobs, everyone's for admins"""
+    query = ImportJob.query
+    if current_role() != 'admin':
+        query = query.filter(ImportJob.created_by == int(get_jwt_identity()))
+    jobs = query.order_by(ImportJob.created_at.desc()).limit(MAX_LISTED_JOBS).all()
+    
+    return jsonify(jobs=[_job_dict(job) for job in jobs])
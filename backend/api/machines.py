@@ -3,10 +3,15 @@ Machine and hierarchy management
 """
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from backend.api.access import require_role
+from backend.api.conditional import conditional_get
+from backend.api.imports import save_upload, submit_batch_import, import_job_accepted
 from backend.models.machine import Machine, Subsystem, Component
-from backend.models.user import User
+from backend.models.maintenance_log import MaintenanceLog
 from backend.database import db
 from backend.services.technical_id_service import TechnicalIDService
+from backend.services.hour_threshold_engine import HourThresholdEngine
+from backend.services.import_jobs import import_jobs
 import os
 import uuid
 import qrcode
@@ -21,6 +26,7 @@ machines_bp = Blueprint('machines', __name__)
 # Machine endpoints
 @machines_bp.route('/', methods=['GET'])
 @jwt_required()
+@conditional_get('machine', 'subsystem')
 def get_machines():
     machines = Machine.query.all()
     
@@ -43,14 +49,8 @@ def get_machines():
 
 @machines_bp.route('/', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_machine():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can create machines
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     data = request.get_json()
     
     # Validate technical ID
@@ -170,14 +170,8 @@ def get_subsystems(machine_id):
 
 @machines_bp.route('/<int:machine_id>/subsystems', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_subsystem(machine_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can create subsystems
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     machine = Machine.query.get(machine_id)
     if not machine:
         return jsonify(message="Machine not found"), 404
@@ -272,14 +266,8 @@ def get_components(subsystem_id):
 
 @machines_bp.route('/subsystems/<int:subsystem_id>/components', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_component(subsystem_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can add components
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     subsystem = Subsystem.query.get(subsystem_id)
     if not subsystem:
         return jsonify(message="Subsystem not found"), 404
@@ -382,6 +370,7 @@ def update_machine_hours(machine_id):
         return jsonify(message="Hour counter value is required"), 400
     
     # Update the hour counter
+    previous_hours = machine.hour_counter
     machine.hour_counter = float(hour_counter)
     
     # Log the update as a maintenance activity
@@ -396,11 +385,15 @@ def update_machine_hours(machine_id):
     )
     
     db.session.add(maintenance_log)
+    
+    # Orders for the hour intervals passed since the previous reading, committed with the reading
+    work_orders = HourThresholdEngine.process_reading(machine, previous_hours, machine.hour_counter)
     db.session.commit()
     
     return jsonify(
         message="Machine hour counter updated successfully",
-        hour_counter=machine.hour_counter
+        hour_counter=machine.hour_counter,
+        work_orders_created=[{'id': wo.id, 'title': wo.title} for wo in work_orders]
     )
 @machines_bp.route('/upload-structure', methods=['OPTIONS'])
 def options_upload_structure():
@@ -412,25 +405,19 @@ def options_upload_structure():
 
 @machines_bp.route('/upload-structure', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def upload_technical_structure():
-    from werkzeug.utils import secure_filename
-    
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can import structure
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     if 'file' not in request.files:
         return jsonify(message="No file part"), 400
     
-    file = request.files['file']
-    if file.filename == '':
+    # Several files, or all structure sheets of one, are imported together as a batch
+    files = request.files.getlist('file')
+    file = files[0]
+    if any(f.filename == '' for f in files):
         return jsonify(message="No selected file"), 400
     
     # Check file type
-    if not file.filename.endswith(('.xlsx', '.xls')):
+    if not all(f.filename.endswith(('.xlsx', '.xls')) for f in files):
         return jsonify(message="Invalid file format, only Excel files are allowed"), 400
     
     # Get import mode
@@ -447,63 +434,31 @@ def upload_technical_structure():
         if not equipment:
             return jsonify(message="Equipment not found"), 404
     
-    # Add the unique filename generation here
-    import uuid
-    unique_id = str(uuid.uuid4())
-    original_filename = file.filename
-    unique_filename = f"{unique_id}_{secure_filename(original_filename)}"
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    
-    # Save file with the unique name
-    file.save(file_path)
-    
-    try:
-        # Import the services
-        from backend.services.import_service import import_technical_structure_park, import_technical_structure_equipment
-        
-        # Process the file based on import mode
-        if import_mode == 'park':
-            # Import entire machine park
-            result = import_technical_structure_park(file_path)
-        else:
-            # Import components for specific equipment
-            result = import_technical_structure_equipment(file_path, equipment_id)
-        
-        # Try to remove the temporary file but don't fail if it's locked
-        try:
-            os.remove(file_path)
-        except PermissionError:
-            # If we can't delete the file now, don't throw an error
-            print(f"Note: Could not immediately delete file {file_path} - it may be deleted later")
-        
-        if result['success']:
-            return jsonify(
-                message=result['message'],
-                imported=result['stats']
-            ), 201
-        else:
-            return jsonify(message=result['message']), 400
-        
-    except Exception as e:
-        # Enhanced error logging
-        print(f"ERROR in upload_technical_structure: {str(e)}")
-        print(f"ERROR type: {type(e).__name__}")
-        
-        import traceback
-        print("ERROR traceback:")
-        print(traceback.format_exc())
-        
-        # Try to remove file but don't worry if it fails
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except:
-            pass
-        
-        return jsonify(message=f"Error processing file: {str(e)}"), 500
+    # 'sync' also updates the names and descriptions of items that already exist
+    sync = request.form.get('sync') in ('true', '1')
+    params = {'import_mode': import_mode, 'equipment_id': equipment.id if import_mode == 'equipment' else None,
+              'sync': sync}
+    
+    if len(files) > 1 or request.form.get('all_sheets') in ('true', '1'):
+        job = submit_batch_import('technical_structure_batch', params, files)
+        return import_job_accepted(job)
+    
+    file_path, content_hash = save_upload(file)
+    
+    # Runs in the background, the client polls the job for the outcome
+    job = import_jobs.submit(
+        'technical_structure',
+        params,
+        created_by=int(get_jwt_identity()),
+        file_path=file_path,
+        content_hash=content_hash,
+        original_filename=file.filename
+    )
+    return import_job_accepted(job)
     
 @machines_bp.route('/<int:machine_id>/hierarchy', methods=['GET'])
 @jwt_required()
+@conditional_get('machine', 'subsystem', 'component')
 def get_machine_hierarchy(machine_id):
     """Get complete hierarchy for a machine including all subsystems and components"""
     machine = Machine.query.get(machine_id)
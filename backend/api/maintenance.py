@@ -9,6 +9,7 @@ from backend.models.machine import Machine, Component
 from backend.models.user import User
 from backend.models.work_order import WorkOrder
 from backend.database import db
+from backend.services.due_state import DueStateService
 from datetime import datetime, timezone
 import os
 import uuid
@@ -207,4 +208,15 @@ def get_maintenance_logs():
             'failures': failure_data
         })
     
-    return jsonify(maintenance_logs=logs)
\ No newline at end of file
+    return jsonify(maintenance_logs=logs)
+@maintenance_bp.route('/upcoming', methods=['GET'])
+@jwt_required()
+def get_upcoming_maintenance():
+    """RCM maintenance actions due within the next days or operating hours"""
+    days = request.args.get('days', 30, type=int)
+    hours = request.args.get('hours', 50, type=float)
+    machine_id = request.args.get('machine_id', type=int)
+    
+    upcoming = DueStateService.upcoming(days=days, hours=hours, machine_id=machine_id)
+    
+    return jsonify(upcoming=upcoming)
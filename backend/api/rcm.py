@@ -1,14 +1,18 @@
 #backend/api/rcm.py - Updated with Units as first step
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance
-from backend.models.user import User
-from backend.models.machine import Machine
+from backend.api.access import require_role
+from backend.api.conditional import conditional_get
+from backend.api.imports import save_upload, submit_batch_import, import_job_accepted
+from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMMaintenance
 from backend.database import db
-import os
-from werkzeug.utils import secure_filename
+from backend.services.rcm_analysis import RCMAnalysisService
+from backend.services.import_jobs import import_jobs
+import logging
 from flask import current_app
 
+logger = logging.getLogger(__name__)
+
 rcm_bp = Blueprint('rcm', __name__)
 
 # Get all RCM units
@@ -41,14 +45,8 @@ def get_units():
 # Create new RCM unit
 @rcm_bp.route('/units', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_unit():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can create RCM data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     data = request.get_json()
     
     unit = RCMUnit(
@@ -91,14 +89,8 @@ def get_functions_for_unit(unit_id):
 # Create new function for a unit
 @rcm_bp.route('/units/<int:unit_id>/functions', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_function_for_unit(unit_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can create RCM data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     unit = RCMUnit.query.get(unit_id)
     if not unit:
         return jsonify(message="Unit not found"), 404
@@ -121,207 +113,44 @@ def create_function_for_unit(unit_id):
 # Get complete RCM analysis
 @rcm_bp.route('/analysis', methods=['GET'])
 @jwt_required()
+@conditional_get('rcm_unit', 'rcm_function', 'rcm_functional_failure', 'rcm_failure_mode',
+                 'rcm_failure_effect', 'rcm_maintenance', 'machine')
 def get_rcm_analysis():
     """Get complete RCM analysis"""
     # Optional filter by equipment
     equipment_id = request.args.get('equipment_id', type=int)
     
-    query = RCMUnit.query
+    # Served from the snapshot of the current RCM revision, built only after a change
+    snapshot = RCMAnalysisService.get_snapshot(equipment_id)
     
-    if equipment_id:
-        query = query.filter_by(equipment_id=equipment_id)
-        
-    units = query.all()
-    
-    # Get equipment name if ID is provided
-    equipment_name = None
-    if equipment_id:
-        machine = Machine.query.get(equipment_id)
-        if machine:
-            equipment_name = machine.name
-    
-    result = []
-    
-    for unit in units:
-        unit_data = {
-            'id': unit.id,
-            'name': unit.name,
-            'description': unit.description,
-            'equipment_id': unit.equipment_id,
-            'equipment_name': equipment_name,
-            'technical_id': unit.technical_id,
-            'functions': []
-        }
-        
-        for function in unit.functions:
-            function_data = {
-                'id': function.id,
-                'name': function.name,
-                'description': function.description,
-                'technical_id': function.technical_id,
-                'unit_id': function.unit_id,
-                'functional_failures': []
-            }
-            
-            for failure in function.functional_failures:
-                failure_data = {
-                    'id': failure.id,
-                    'name': failure.name,
-                    'description': failure.description,
-                    'failure_modes': []
-                }
-                
-                for mode in failure.failure_modes:
-                    mode_data = {
-                        'id': mode.id,
-                        'name': mode.name,
-                        'description': mode.description,
-                        'failure_type': mode.failure_type,
-                        'detection_method': mode.detection_method,
-                        'effects': [],
-                        'maintenance_actions': []
-                    }
-                    
-                    # Get effects
-                    for effect in mode.effects:
-                        effect_data = {
-                            'id': effect.id,
-                            'description': effect.description,
-                            'severity': effect.severity,
-                            'safety_impact': effect.safety_impact,
-                            'environmental_impact': effect.environmental_impact, 
-                            'operational_impact': effect.operational_impact,
-                            'economic_impact': effect.economic_impact
-                        }
-                        mode_data['effects'].append(effect_data)
-                    
-                    # Get maintenance actions
-                    maintenance_actions = RCMMaintenance.query.filter_by(failure_mode_id=mode.id).all()
-                    for action in maintenance_actions:
-                        action_data = {
-                            'id': action.id,
-                            'title': action.title,
-                            'description': action.description,
-                            'maintenance_type': action.maintenance_type,
-                            'interval_days': action.interval_days,
-                            'interval_hours': action.interval_hours,
-                            'maintenance_strategy': action.maintenance_strategy
-                        }
-                        mode_data['maintenance_actions'].append(action_data)
-                    
-                    failure_data['failure_modes'].append(mode_data)
-                
-                function_data['functional_failures'].append(failure_data)
-            
-            unit_data['functions'].append(function_data)
-        
-        result.append(unit_data)
+    if current_app.config.get('RCM_SNAPSHOT_GZIP') and 'gzip' in request.accept_encodings:
+        response = current_app.response_class(snapshot.gzipped(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(snapshot.body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
     
-    return jsonify(rcm_analysis=result)
+    return response
 
 # Import RCM data (for bulk upload)
 @rcm_bp.route('/import', methods=['POST'])
 @jwt_required()
+@require_role('admin')
 def import_rcm_data():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only admins can import RCM data
-    if user.role != 'admin':
-        return jsonify(message="Unauthorized"), 403
-    
-    data = request.get_json()
-    
-    try:
-        # Process units and their nested data
-        for unit_data in data.get('units', []):
-            unit = RCMUnit(
-                name=unit_data.get('name'),
-                description=unit_data.get('description'),
-                equipment_id=unit_data.get('equipment_id'),
-                technical_id=unit_data.get('technical_id', '')
-            )
-            db.session.add(unit)
-            db.session.flush()  # Get ID without committing
-            
-            # Process functions for this unit
-            for function_data in unit_data.get('functions', []):
-                function = RCMFunction(
-                    name=function_data.get('name'),
-                    description=function_data.get('description'),
-                    equipment_id=unit_data.get('equipment_id'),
-                    unit_id=unit.id,
-                    technical_id=function_data.get('technical_id', '')
-                )
-                db.session.add(function)
-                db.session.flush()
-                
-                # Process functional failures
-                for failure_data in function_data.get('functional_failures', []):
-                    failure = RCMFunctionalFailure(
-                        name=failure_data.get('name'),
-                        description=failure_data.get('description'),
-                        function_id=function.id
-                    )
-                    db.session.add(failure)
-                    db.session.flush()
-                    
-                    # Process failure modes
-                    for mode_data in failure_data.get('failure_modes', []):
-                        mode = RCMFailureMode(
-                            name=mode_data.get('name'),
-                            description=mode_data.get('description'),
-                            failure_type=mode_data.get('failure_type'),
-                            detection_method=mode_data.get('detection_method'),
-                            functional_failure_id=failure.id
-                        )
-                        db.session.add(mode)
-                        db.session.flush()
-                        
-                        # Process effects
-                        for effect_data in mode_data.get('effects', []):
-                            effect = RCMFailureEffect(
-                                description=effect_data.get('description'),
-                                severity=effect_data.get('severity'),
-                                failure_mode_id=mode.id,
-                                safety_impact=effect_data.get('safety_impact'),
-                                environmental_impact=effect_data.get('environmental_impact'),
-                                operational_impact=effect_data.get('operational_impact'),
-                                economic_impact=effect_data.get('economic_impact')
-                            )
-                            db.session.add(effect)
-                        
-                        # Process maintenance actions
-                        for action_data in mode_data.get('maintenance_actions', []):
-                            action = RCMMaintenance(
-                                title=action_data.get('title'),
-                                description=action_data.get('description'),
-                                maintenance_type=action_data.get('maintenance_type'),
-                                interval_days=action_data.get('interval_days'),
-                                interval_hours=action_data.get('interval_hours'),
-                                failure_mode_id=mode.id,
-                                maintenance_strategy=action_data.get('maintenance_strategy')
-                            )
-                            db.session.add(action)
-        
-        db.session.commit()
-        return jsonify(message="RCM data imported successfully"), 201
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify(message=f"Import failed: {str(e)}"), 500
+    data = request.get_json(silent=True) or {}
+    units = data.get('units', [])
+    if not isinstance(units, list):
+        return jsonify(message="units must be a list"), 400
+    
+    # Runs in the background, the client polls the job for the outcome
+    job = import_jobs.submit('rcm_json', {'units': units}, created_by=int(get_jwt_identity()))
+    return import_job_accepted(job)
 
 # Generate work orders from RCM analysis
 @rcm_bp.route('/generate-work-orders', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def generate_work_orders():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can generate work orders
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     data = request.get_json()
     equipment_id = data.get('equipment_id')
     
@@ -359,6 +188,7 @@ def generate_work_orders():
         
         return jsonify(
             message=f"Generated {len(work_orders)} work orders from RCM analysis",
+            stats=WorkOrderGenerator.last_run_stats.get('generate_from_rcm'),
             work_orders=[{
                 'id': wo.id,
                 'title': wo.title,
@@ -537,20 +367,16 @@ def debug_rcm_detailed(equipment_id):
 # Add file upload endpoint
 @rcm_bp.route('/upload-excel', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def upload_excel():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can import RCM data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     if 'file' not in request.files:
         return jsonify(message="No file part"), 400
         
-    file = request.files['file']
+    # Several files, or all RCM sheets of one, are imported together as a batch
+    files = request.files.getlist('file')
+    file = files[0]
     
-    if file.filename == '':
+    if any(f.filename == '' for f in files):
         return jsonify(message="No selected file"), 400
         
     equipment_id = request.form.get('equipment_id')
@@ -562,35 +388,29 @@ def upload_excel():
     except ValueError:
         return jsonify(message="Invalid equipment ID"), 400
     
+    # 'append' adds the sheet to the machine's analysis, 'sync' updates the analysis to match it
+    mode = request.form.get('mode', 'append')
+    if mode not in ('append', 'sync'):
+        return jsonify(message="Mode must be 'append' or 'sync'"), 400
+    
+    if len(files) > 1 or request.form.get('all_sheets') in ('true', '1'):
+        if not all(allowed_file(f.filename) for f in files):
+            return jsonify(message="Invalid file format"), 400
+        job = submit_batch_import('rcm_excel_batch', {'equipment_id': equipment_id, 'sync': mode == 'sync'}, files)
+        return import_job_accepted(job)
+    
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        file_path, content_hash = save_upload(file)
         
-        try:
-            from backend.services.import_service import RCMImportService
-            
-            result = RCMImportService.import_from_excel(file_path, equipment_id)
-            
-            # Optionally delete the file after import
-            os.remove(file_path)
-            
-            # If import was not successful, return the error message
-            if not result.get('success', False):
-                return jsonify(message=result.get('message', 'Import failed')), 400
-                
-            return jsonify(
-                message="Excel file imported successfully",
-                imported=result.get('imported', {})
-            ), 201
-            
-        except Exception as e:
-            # Clean up file in case of error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
-            logger.error(f"Error importing RCM file: {str(e)}", exc_info=True)
-            return jsonify(message=f"Error importing file: {str(e)}"), 500
+        # Runs in the background, the client polls the job for the outcome
+        job = import_jobs.submit(
+            'rcm_excel', {'equipment_id': equipment_id, 'sync': mode == 'sync'},
+            created_by=int(get_jwt_identity()),
+            file_path=file_path,
+            content_hash=content_hash,
+            original_filename=file.filename
+        )
+        return import_job_accepted(job)
     
     return jsonify(message="Invalid file format"), 400
 
@@ -599,14 +419,9 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in {'xlsx', 'xls'}
 @rcm_bp.route('/test-create/<int:equipment_id>', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def test_create_rcm(equipment_id):
     """Test endpoint to create sample RCM data"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     try:
         # Create a test unit
         unit = RCMUnit(
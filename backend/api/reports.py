@@ -2,9 +2,10 @@
 Reporting routes
 """
 from flask import Blueprint, request, jsonify, send_file
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from backend.models.user import User
+from flask_jwt_extended import jwt_required
+from backend.api.access import require_role, current_user
 from backend.services.statistics import MaintenanceStatistics
+from backend.services.dashboard_summary import DashboardSummaryService
 from backend.services.export_service import ExportService
 from backend.services.reporting import ReportGenerator
 from datetime import datetime, timedelta, timezone
@@ -15,14 +16,8 @@ reports_bp = Blueprint('reports', __name__)
 
 @reports_bp.route('/failure-rates', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def get_failure_rates():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can access reports
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -32,20 +27,14 @@ def get_failure_rates():
     start_date = datetime.fromisoformat(start_date_str) if start_date_str else None
     end_date = datetime.fromisoformat(end_date_str) if end_date_str else None
     
-    failure_rates = MaintenanceStatistics.get_failure_rates(machine_id, start_date, end_date)
+    failure_rates = MaintenanceStatistics.get_failure_rates(machine_id=machine_id, start_date=start_date, end_date=end_date)
     
     return jsonify(failure_rates=failure_rates)
 
 @reports_bp.route('/uptime', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def get_uptime_statistics():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can access reports
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -61,14 +50,8 @@ def get_uptime_statistics():
 
 @reports_bp.route('/mtbf-mttr', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def get_mtbf_mttr():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can access reports
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -78,20 +61,23 @@ def get_mtbf_mttr():
     start_date = datetime.fromisoformat(start_date_str) if start_date_str else None
     end_date = datetime.fromisoformat(end_date_str) if end_date_str else None
     
-    mtbf_mttr = MaintenanceStatistics.get_mtbf_mttr(machine_id, start_date, end_date)
+    # Per 'machine' (default), 'subsystem' or 'component', with an optional rolling MTBF over trend_days
+    level = request.args.get('level', 'machine')
+    trend_days = request.args.get('trend_days', type=int)
+    if trend_days is not None and trend_days <= 0:
+        return jsonify(message="trend_days must be a positive number of days"), 400
+    
+    try:
+        mtbf_mttr = MaintenanceStatistics.get_mtbf_mttr(machine_id, start_date, end_date, level=level, trend_window_days=trend_days)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
     
     return jsonify(mtbf_mttr_statistics=mtbf_mttr)
 
 @reports_bp.route('/work-orders', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def get_work_order_statistics():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can access reports
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -105,16 +91,44 @@ def get_work_order_statistics():
     
     return jsonify(work_order_statistics=work_order_stats)
 
+@reports_bp.route('/timeseries', methods=['GET'])
+@jwt_required()
+@require_role('supervisor', 'admin')
+def get_timeseries():
+    # Failures, downtime, work orders and operating hours per day/week/month for each machine, subsystem or component
+    level = request.args.get('level', 'machine')
+    granularity = request.args.get('granularity', 'week')
+    metrics_str = request.args.get('metrics')
+    metrics = [m.strip() for m in metrics_str.split(',') if m.strip()] if metrics_str else None
+    
+    try:
+        start_date = datetime.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+        end_date = datetime.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify(message="start_date and end_date must be ISO dates"), 400
+    if start_date and end_date and start_date > end_date:
+        return jsonify(message="start_date must be before end_date"), 400
+    
+    try:
+        timeseries = MaintenanceStatistics.get_timeseries(
+            level=level,
+            granularity=granularity,
+            metrics=metrics,
+            machine_id=request.args.get('machine_id', type=int),
+            subsystem_id=request.args.get('subsystem_id', type=int),
+            component_id=request.args.get('component_id', type=int),
+            start_date=start_date,
+            end_date=end_date
+        )
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    
+    return jsonify(timeseries=timeseries)
+
 @reports_bp.route('/generate-pdf', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def generate_pdf_report():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can generate reports
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     data = request.get_json()
     report_type = data.get('report_type')
     machine_id = data.get('machine_id')
@@ -135,58 +149,35 @@ def generate_pdf_report():
         component_id,
         start_date,
         end_date,
-        user.username
+        current_user().username
     )
     
 @reports_bp.route('/dashboard-summary', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def get_dashboard_summary():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can access dashboard summary
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
-    # Get summary statistics for dashboard
-    # Last 30 days by default
+    # Last 30 days, read from the summary row that writes keep up to date
+    summary = DashboardSummaryService.current()
     end_date = datetime.now(timezone.utc)
-    start_date = end_date - timedelta(days=30)
-    
-    # Get work order counts by status
-    work_order_stats = MaintenanceStatistics.generate_work_order_statistics(None, start_date, end_date)
-    
-    # Calculate totals
-    total_work_orders = sum(stat['total_work_orders'] for stat in work_order_stats)
-    open_work_orders = sum(stat['by_status'].get('open', 0) for stat in work_order_stats)
-    in_progress_work_orders = sum(stat['by_status'].get('in_progress', 0) for stat in work_order_stats)
-    completed_work_orders = sum(stat['by_status'].get('completed', 0) for stat in work_order_stats)
-    
-    # Get failure counts
-    failure_rates = MaintenanceStatistics.get_failure_rates(None, start_date, end_date)
-    total_failures = sum(rate['failure_count'] for rate in failure_rates)
-    
-    # Get uptime statistics
-    uptime_stats = MaintenanceStatistics.get_uptime_statistics(None, start_date, end_date)
-    avg_uptime_percentage = sum(stat['uptime_percentage'] for stat in uptime_stats) / len(uptime_stats) if uptime_stats else 0
+    start_date = end_date - timedelta(days=summary.period_days)
     
     dashboard_summary = {
         'period': {
             'start_date': start_date.isoformat(),
             'end_date': end_date.isoformat(),
-            'days': 30
+            'days': summary.period_days
         },
         'work_orders': {
-            'total': total_work_orders,
-            'open': open_work_orders,
-            'in_progress': in_progress_work_orders,
-            'completed': completed_work_orders
+            'total': summary.work_orders_total,
+            'open': summary.work_orders_open,
+            'in_progress': summary.work_orders_in_progress,
+            'completed': summary.work_orders_completed
         },
         'failures': {
-            'total': total_failures
+            'total': summary.failures_total
         },
         'uptime': {
-            'average_percentage': round(avg_uptime_percentage, 2)
+            'average_percentage': summary.average_uptime_percentage
         }
     }
     
@@ -194,14 +185,8 @@ def get_dashboard_summary():
 # For excel
 @reports_bp.route('/export/work-orders', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def export_work_orders():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can export data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -227,14 +212,8 @@ def export_work_orders():
 
 @reports_bp.route('/export/maintenance-logs', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def export_maintenance_logs():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can export data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -260,14 +239,8 @@ def export_maintenance_logs():
 
 @reports_bp.route('/export/statistics', methods=['GET'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def export_statistics():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can export data
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     # Get filter parameters
     machine_id = request.args.get('machine_id', type=int)
     start_date_str = request.args.get('start_date')
@@ -0,0 +1,66 @@
+"""
+Full-text search routes
+"""
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from backend.api.access import current_role
+from backend.models.machine import Machine
+from backend.services import search_index
+from datetime import datetime
+
+search_bp = Blueprint('search', __name__)
+
+MAX_RESULTS = 100
+
+@search_bp.route('/', methods=['GET'])
+@search_bp.route('', methods=['GET'])
+@jwt_required()
+def search():
+    """
+    Search work orders, maintenance logs and failures
+
+    Query parameters: q, machine_id, type (work_order, maintenance_log, failure, comma
+    separated), kind (work order type, maintenance type or failure severity),
+    start_date, end_date, limit. Workers only find work orders assigned to them.
+    """
+    if not search_index.search_index_enabled:
+        return jsonify(message="Search is not available on this server"), 503
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(message="Missing search query"), 400
+    
+    entity_types = None
+    if request.args.get('type'):
+        entity_types = [t.strip() for t in request.args.get('type').split(',') if t.strip()]
+        unknown = [t for t in entity_types if t not in search_index.ENTITY_CODES]
+        if unknown:
+            return jsonify(message=f"Unknown type: {', '.join(unknown)}"), 400
+    
+    try:
+        start_date = datetime.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+        end_date = datetime.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify(message="Invalid date format"), 400
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_RESULTS))
+    
+    results = search_index.search(
+        query,
+        machine_id=request.args.get('machine_id', type=int),
+        entity_types=entity_types,
+        kind=request.args.get('kind'),
+        start_date=start_date,
+        end_date=end_date,
+        limit=limit,
+        # Workers only see their own work orders, like the work order list
+        assigned_to=int(get_jwt_identity()) if current_role() == 'worker' else None
+    )
+    
+    # Machine names in one query for the whole page
+    machine_ids = {r['machine_id'] for r in results if r['machine_id'] is not None}
+    names = {m.id: m.name for m in Machine.query.filter(Machine.id.in_(machine_ids)).all()} if machine_ids else {}
+    for result in results:
+        result['machine_name'] = names.get(result['machine_id'])
+    
+    return jsonify(query=query, results=results), 200
@@ -0,0 +1,153 @@
+"""
+Delta sync for the mobile app
+"""
+# The app keeps a local copy of the machine hierarchy and work orders. Instead
+# of downloading everything on each refresh it sends back the token from its
+# last sync and only receives the rows changed or deleted since then.
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import or_
+from backend.api.access import current_role
+from backend.models.machine import Machine, Subsystem, Component
+from backend.models.work_order import WorkOrder
+from backend.models.sync import SyncTombstone
+
+sync_bp = Blueprint('sync', __name__)
+
+# Rows committed by a request that started just before the previous sync can
+# carry an updated_at older than its token. Re-sending a few seconds of changes
+# covers that; the client upserts by id, so duplicates are harmless.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+@sync_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_changes():
+    # Taken before querying so nothing committed during the request is skipped next time
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    since = None
+    token = request.args.get('since')
+    if token:
+        try:
+            since = _decode_token(token) - SYNC_OVERLAP
+        except ValueError:
+            return jsonify(message="Invalid sync token"), 400
+
+    work_order_query = WorkOrder.query
+    tombstone_query = SyncTombstone.query.filter(SyncTombstone.user_id.is_(None))
+    if current_role() == 'worker':
+        user_id = int(get_jwt_identity())
+        work_order_query = work_order_query.filter(WorkOrder.assigned_to == user_id)
+        # Plus the orders reassigned away from this worker
+        tombstone_query = SyncTombstone.query.filter(or_(SyncTombstone.user_id.is_(None), SyncTombstone.user_id == user_id))
+
+    changes = {
+        'machines': [_serialize_machine(m) for m in _changed(Machine.query, Machine, since)],
+        'subsystems': [_serialize_subsystem(s) for s in _changed(Subsystem.query, Subsystem, since)],
+        'components': [_serialize_component(c) for c in _changed(Component.query, Component, since)],
+        'work_orders': [_serialize_work_order(wo) for wo in _changed(work_order_query, WorkOrder, since)]
+    }
+
+    deleted = {'machines': [], 'subsystems': [], 'components': [], 'work_orders': []}
+    if since is not None:
+        tombstones = tombstone_query.filter(SyncTombstone.deleted_at >= since).all()
+        for tombstone in tombstones:
+            deleted[f"{tombstone.entity_type}s"].append(tombstone.entity_id)
+        # A row reassigned back, or an id reused after a delete, is current again
+        for entity_type, rows in changes.items():
+            current = {row['id'] for row in rows}
+            deleted[entity_type] = sorted(set(deleted[entity_type]) - current)
+
+    return jsonify({
+        'full': since is None,
+        'changes': changes,
+        'deleted': deleted,
+        'next_token': _encode_token(now)
+    }), 200
+
+def _changed(query, model, since):
+    """Rows of the model changed since the given time, or all rows for a full sync"""
+    if since is not None:
+        # Rows from before the updated_at column existed have NULL and were sent in the first full sync
+        query = query.filter(model.updated_at >= since)
+    return query.order_by(model.id).all()
+
+def _encode_token(timestamp):
+    """Opaque sync token for a naive UTC timestamp"""
+    return base64.urlsafe_b64encode(timestamp.isoformat().encode()).decode()
+
+def _decode_token(token):
+    """Timestamp from a sync token, raises ValueError when malformed"""
+    try:
+        timestamp = datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    # Stored timestamps are naive UTC in SQLite
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _serialize_machine(machine):
+    return {
+        'id': machine.id,
+        'name': machine.name,
+        'technical_id': machine.technical_id,
+        'location': machine.location,
+        'description': machine.description,
+        'hour_counter': machine.hour_counter,
+        'qr_code': machine.qr_code,
+        'last_maintenance': _isoformat(machine.last_maintenance),
+        'updated_at': _isoformat(machine.updated_at)
+    }
+
+def _serialize_subsystem(subsystem):
+    return {
+        'id': subsystem.id,
+        'name': subsystem.name,
+        'technical_id': subsystem.technical_id,
+        'description': subsystem.description,
+        'machine_id': subsystem.machine_id,
+        'updated_at': _isoformat(subsystem.updated_at)
+    }
+
+def _serialize_component(component):
+    return {
+        'id': component.id,
+        'name': component.name,
+        'technical_id': component.technical_id,
+        'location': component.location,
+        'description': component.description,
+        'function': component.function,
+        'subsystem_id': component.subsystem_id,
+        'machine_id': component.machine_id,
+        'updated_at': _isoformat(component.updated_at)
+    }
+
+def _serialize_work_order(work_order):
+    return {
+        'id': work_order.id,
+        'title': work_order.title,
+        'description': work_order.description,
+        'status': work_order.status,
+        'priority': work_order.priority,
+        'type': work_order.type,
+        'frequency': work_order.frequency,
+        'category': work_order.category,
+        'due_date': _isoformat(work_order.due_date),
+        'created_at': _isoformat(work_order.created_at),
+        'machine_id': work_order.machine_id,
+        'subsystem_id': work_order.subsystem_id,
+        'component_id': work_order.component_id,
+        'assigned_to': work_order.assigned_to,
+        'downtime_hours': work_order.downtime_hours,
+        'tool_requirements': work_order.tool_requirements,
+        'reason': work_order.reason,
+        'generation_source': work_order.generation_source,
+        'updated_at': _isoformat(work_order.updated_at)
+    }
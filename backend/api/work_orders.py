@@ -3,81 +3,158 @@ Work order routes
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from backend.api.access import require_role, current_role
+from backend.api.conditional import conditional_get
 from backend.models.work_order import WorkOrder
 from backend.models.machine import Machine,Subsystem, Component
 from backend.models.user import User
+from backend.models.sync import record_unassigned
 from backend.database import db
-from datetime import datetime, timedelta
+from backend.services.due_state import DueStateService
+from backend.services.reliability_rollup import ReliabilityRollupService
+from backend.services import search_index
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta, timezone
+import base64
+import binascii
 
 work_orders_bp = Blueprint('work_orders', __name__)
 
+# Page sizes for the cursor based listing
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Largest number of patches accepted by the batch endpoint
+MAX_BATCH_SIZE = 500
+
+# Fields a patch may change, workers may only change the status
+EDITABLE_FIELDS = {'title', 'description', 'due_date', 'status', 'priority', 'category', 'assigned_to'}
+WORKER_EDITABLE_FIELDS = {'status'}
+
 @work_orders_bp.route('/test', methods=['GET'])
 def test_endpoint():
     return jsonify({"message": "This is a test endpoint that works without authentication"}), 200
 
 @work_orders_bp.route('/', methods=['GET'])
 @jwt_required()
+@conditional_get('work_order', 'machine', 'subsystem', 'component', 'user', vary_on_user=True)
 def get_work_orders():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
     
     # Filter parameters
     status = request.args.get('status')
     machine_id = request.args.get('machine_id')
     frequency = request.args.get('frequency')
     
-    query = WorkOrder.query
+    # Pagination parameters, paging is only used when the client asks for it
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    paginate = cursor is not None or limit is not None
+    
+    # Load the related names in the same query instead of one lookup per row
+    assigned_user = aliased(User)
+    query = db.session.query(
+        WorkOrder,
+        Machine.name.label('machine_name'),
+        Subsystem.name.label('subsystem_name'),
+        Component.name.label('component_name'),
+        assigned_user.username.label('assigned_to_name')
+    ).join(
+        Machine, WorkOrder.machine_id == Machine.id
+    ).outerjoin(
+        Subsystem, WorkOrder.subsystem_id == Subsystem.id
+    ).outerjoin(
+        Component, WorkOrder.component_id == Component.id
+    ).outerjoin(
+        assigned_user, WorkOrder.assigned_to == assigned_user.id
+    )
     
     if status:
         query = query.filter(WorkOrder.status == status)
     if machine_id:
         query = query.filter(WorkOrder.machine_id == machine_id)
     if frequency:
-        frequency = query.filter(WorkOrder.frequency == frequency) 
+        query = query.filter(WorkOrder.frequency == frequency)
     
     # If user is a worker, only show assigned work orders... no need
-    if user.role == 'worker':
+    if current_role() == 'worker':
         query = query.filter(WorkOrder.assigned_to == current_user_id)
     
-    work_orders = query.all()
+    if not paginate:
+        results = query.all()
+        return jsonify(work_orders=[_serialize_work_order_row(row) for row in results])
+    
+    # Keyset pagination on (created_at, id), newest first
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
     
-    result = []
-    for wo in work_orders:
-        machine = Machine.query.get(wo.machine_id)
-        subsystem = Subsystem.query.get(wo.subsystem_id) if wo.subsystem_id else None
-        component = Component.query.get(wo.component_id) if wo.component_id else None
-        assigned_user = User.query.get(wo.assigned_to) if wo.assigned_to else None          #Might not be needed
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify(message="Invalid cursor"), 400
         
-        result.append({
-            'id': wo.id,
-            'title': wo.title,
-            'description': wo.description,
-            'status': wo.status,
-            'priority': wo.priority,
-            'type': wo.type,
-            'category': wo.category,
-            'created_at': wo.created_at.isoformat(),
-            'due_date': wo.due_date.isoformat(),
-            'machine': machine.name,
-            'subsystem': subsystem.name if subsystem else None,
-            'component': component.name if component else None,
-            'assigned_to': assigned_user.username if assigned_user else None,               # might not be needed
-            'tool_requirements': wo.tool_requirements,
-            'reason': wo.reason
-        })
-    
-    return jsonify(work_orders=result)
+        query = query.filter(or_(
+            WorkOrder.created_at < cursor_created_at,
+            and_(WorkOrder.created_at == cursor_created_at, WorkOrder.id < cursor_id)
+        ))
+    
+    query = query.order_by(WorkOrder.created_at.desc(), WorkOrder.id.desc())
+    
+    # Fetch one extra row to know if there is a next page
+    results = query.limit(limit + 1).all()
+    has_more = len(results) > limit
+    results = results[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = results[-1][0]
+        next_cursor = _encode_cursor(last.created_at, last.id)
+    
+    return jsonify(
+        work_orders=[_serialize_work_order_row(row) for row in results],
+        next_cursor=next_cursor
+    )
+
+def _serialize_work_order_row(row):
+    """Convert a (WorkOrder, names...) row from get_work_orders to a dictionary"""
+    wo = row[0]
+    return {
+        'id': wo.id,
+        'title': wo.title,
+        'description': wo.description,
+        'status': wo.status,
+        'priority': wo.priority,
+        'type': wo.type,
+        'category': wo.category,
+        'created_at': wo.created_at.isoformat(),
+        'due_date': wo.due_date.isoformat(),
+        'machine': row.machine_name,
+        'subsystem': row.subsystem_name,
+        'component': row.component_name,
+        'assigned_to': row.assigned_to_name,               # might not be needed
+        'tool_requirements': wo.tool_requirements,
+        'reason': wo.reason
+    }
+
+def _encode_cursor(created_at, work_order_id):
+    """Encode the position of the last returned row as an opaque token"""
+    raw = f"{created_at.isoformat()}|{work_order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    """Decode a token from _encode_cursor, raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, work_order_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(work_order_id)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
 
 @work_orders_bp.route('/', methods=['POST'])
 @jwt_required()
+@require_role('supervisor', 'admin')
 def create_work_order():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    # Only supervisors and admins can create work orders                        unsure if needed
-    if user.role not in ['supervisor', 'admin']:
-        return jsonify(message="Unauthorized"), 403
-    
     data = request.get_json()
     
     machine = Machine.query.get(data.get('machine_id'))
@@ -132,20 +209,20 @@ def create_work_order():
 @jwt_required()
 def update_work_order(work_order_id):
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    role = current_role()
     
     work_order = WorkOrder.query.get(work_order_id)
     if not work_order:
         return jsonify(message="Work order not found"), 404
     
     # Workers can only update status
-    if user.role == 'worker' and user.id != work_order.assigned_to:
+    if role == 'worker' and int(current_user_id) != work_order.assigned_to:
         return jsonify(message="Unauthorized"), 403
     
     data = request.get_json()
     
     # Workers can only update status
-    if user.role == 'worker':
+    if role == 'worker':
         if 'status' in data:
             work_order.status = data.get('status')
     else:  # Supervisors and admins can update everything
@@ -169,6 +246,127 @@ def update_work_order(work_order_id):
     
     return jsonify(message="Work order updated successfully"), 200
 
+@work_orders_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_update_work_orders():
+    """
+    Apply a list of patches in one transaction
+
+    Body: {"updates": [{"id": 1, "status": "completed"}, {"id": 2, "assigned_to": "ola"}, ...]}
+    Each patch takes the same fields as PUT /<id>. Either every patch is applied or,
+    if any of them is invalid, none is, and the per-item results say which failed.
+    """
+    current_user_id = int(get_jwt_identity())
+    role = current_role()
+    
+    data = request.get_json(silent=True) or {}
+    patches = data.get('updates')
+    if not isinstance(patches, list) or not patches:
+        return jsonify(message="updates must be a non-empty list"), 400
+    if len(patches) > MAX_BATCH_SIZE:
+        return jsonify(message=f"At most {MAX_BATCH_SIZE} updates per batch"), 400
+    
+    allowed_fields = WORKER_EDITABLE_FIELDS if role == 'worker' else EDITABLE_FIELDS
+    
+    # One query for all the orders and one for all the assignees
+    ids = {patch.get('id') for patch in patches if isinstance(patch, dict) and isinstance(patch.get('id'), int)}
+    work_orders = {wo.id: wo for wo in WorkOrder.query.filter(WorkOrder.id.in_(ids)).all()} if ids else {}
+    
+    usernames = {patch['assigned_to'] for patch in patches
+                 if isinstance(patch, dict) and patch.get('assigned_to')}
+    users = {u.username: u.id for u in User.query.filter(User.username.in_(usernames)).all()} if usernames else {}
+    
+    results = []
+    rows = []
+    seen = set()
+    for index, patch in enumerate(patches):
+        if not isinstance(patch, dict) or not isinstance(patch.get('id'), int):
+            results.append({'index': index, 'id': None, 'ok': False, 'message': "Missing work order id"})
+            continue
+        
+        work_order_id = patch['id']
+        error = None
+        work_order = work_orders.get(work_order_id)
+        fields = set(patch) - {'id'}
+        
+        if work_order_id in seen:
+            error = "Work order appears more than once in the batch"
+        elif not work_order:
+            error = "Work order not found"
+        elif role == 'worker' and current_user_id != work_order.assigned_to:
+            error = "Unauthorized"
+        elif not fields:
+            error = "Nothing to update"
+        elif fields - allowed_fields:
+            error = f"Fields not allowed: {', '.join(sorted(fields - allowed_fields))}"
+        
+        row = {'id': work_order_id}
+        if error is None:
+            for field in fields:
+                value = patch[field]
+                if field == 'due_date':
+                    try:
+                        value = datetime.fromisoformat(value)
+                    except (TypeError, ValueError):
+                        error = "Invalid due_date"
+                        break
+                elif field == 'assigned_to':
+                    # Unassign with an empty value, like PUT /<id>
+                    if value and value not in users:
+                        error = "Assigned user not found"
+                        break
+                    value = users.get(value) if value else None
+                row[field] = value
+        
+        seen.add(work_order_id)
+        results.append({'index': index, 'id': work_order_id, 'ok': error is None, 'message': error})
+        if error is None:
+            rows.append(row)
+    
+    if len(rows) != len(patches):
+        return jsonify(message="No work orders were updated", results=results), 400
+    
+    # Bulk UPDATE by primary key, grouped into one executemany per set of fields
+    # Bulk updates skip the mapper events, so record RCM actions completed by the batch here
+    completed = {}
+    for row in rows:
+        work_order = work_orders[row['id']]
+        if row.get('status') == 'completed' and work_order.status != 'completed' and work_order.rcm_maintenance_id:
+            completed[work_order.rcm_maintenance_id] = work_order.machine_id
+    
+    status_changed = [row['id'] for row in rows if 'status' in row and row['status'] != work_orders[row['id']].status]
+    
+    # The search index is kept by the same events, re-index orders whose indexed text changed
+    reindexed = [row['id'] for row in rows
+                 if any(row[field] != getattr(work_orders[row['id']], field)
+                        for field in search_index.WORK_ORDER_INDEXED_FIELDS & set(row))]
+    
+    # Tell the previous assignees' devices to drop orders given to someone else
+    reassigned = {row['id']: work_orders[row['id']].assigned_to for row in rows
+                  if 'assigned_to' in row and row['assigned_to'] != work_orders[row['id']].assigned_to}
+    
+    db.session.execute(update(WorkOrder), rows)
+    record_unassigned(db.session.connection(), reassigned)
+    
+    # Status counts and MTBF/MTTR in the reliability rollups depend on the status
+    if status_changed:
+        ReliabilityRollupService.refresh_work_orders(work_order_ids=status_changed)
+    
+    if reindexed:
+        search_index.reindex_work_orders(db.session.connection(), reindexed)
+    
+    if completed:
+        now = datetime.now(timezone.utc)
+        hours = dict(db.session.query(Machine.id, Machine.hour_counter).filter(Machine.id.in_(set(completed.values()))).all())
+        DueStateService.refresh(
+            maintenance_ids=list(completed),
+            performed={maintenance_id: (now, hours.get(machine_id)) for maintenance_id, machine_id in completed.items()}
+        )
+    
+    db.session.commit()
+    
+    return jsonify(message=f"{len(rows)} work order(s) updated", results=results), 200
+
 @staticmethod
 def generate_from_rcm(equipment_id):
     """Generate work orders based on RCM analysis"""
@@ -0,0 +1,102 @@
+"""
+Flask CLI commands, run with: flask --app server <command>
+"""
+import sys
+import click
+from backend.database import db
+
+def register_commands(app):
+    """Attach the maintenance commands to the app"""
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Create missing tables, columns and indexes in the configured database"""
+        from backend.schema import upgrade_schema
+
+        db.create_all()
+        result = upgrade_schema()
+        click.echo(f"Columns added: {', '.join(result['columns_added']) or 'none'}")
+        click.echo(f"Indexes created: {', '.join(result['indexes_created']) or 'none'}")
+        if result['search_index_created']:
+            click.echo("Search index created")
+        if result['due_states_computed']:
+            click.echo(f"Due state computed for {result['due_states_computed']} maintenance actions")
+        if result['rollup_rows_computed']:
+            click.echo(f"Reliability rollups computed: {result['rollup_rows_computed']} rows")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Refill the full-text search index from the work orders, logs and failures"""
+        from backend.services.search_index import ensure_search_index, rebuild_search_index
+
+        ensure_search_index()
+        click.echo(f"Indexed {rebuild_search_index()} rows")
+
+    @app.cli.command('rebuild-due-state')
+    def rebuild_due_state_command():
+        """Recompute the maintenance due state of every RCM action"""
+        from backend.services.due_state import DueStateService
+
+        click.echo(f"Due state computed for {DueStateService.rebuild()} maintenance actions")
+
+    @app.cli.command('rebuild-reliability-rollups')
+    def rebuild_reliability_rollups_command():
+        """Recompute the daily reliability rollups from the logs, failures and work orders"""
+        from backend.services.reliability_rollup import ReliabilityRollupService
+
+        click.echo(f"Reliability rollups computed: {ReliabilityRollupService.rebuild()} rows")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans():
+        """Fail if a statistics or generator query does a full scan of a hot table"""
+        from backend import create_app
+        from backend.config import Config
+        from backend.services.query_plan_audit import run_query_plan_audit
+
+        # Run against a scratch in-memory database so the generators can't touch real data
+        class AuditConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+        audit_app = create_app(AuditConfig)
+        with audit_app.app_context():
+            report = run_query_plan_audit()
+
+        failed = False
+        for entry in report:
+            if entry['error']:
+                # Only plan regressions fail the check, the call error is shown for information
+                click.echo(f"WARN  {entry['name']} raised: {entry['error']}")
+            if entry['regressions']:
+                failed = True
+                click.echo(f"FAIL  {entry['name']}")
+                for regression in entry['regressions']:
+                    click.echo(f"      {' '.join(regression['statement'].split())}")
+                    for line in regression['plan']:
+                        click.echo(f"        {line}")
+            else:
+                click.echo(f"OK    {entry['name']} ({entry['queries']} queries)")
+
+        sys.exit(1 if failed else 0)
+
+    @app.cli.command('benchmark-rcm-analysis')
+    def benchmark_rcm_analysis():
+        """Fail if the RCM analysis tree needs more queries as it grows"""
+        from backend import create_app
+        from backend.config import Config
+        from backend.services.rcm_analysis_benchmark import run_rcm_analysis_benchmark
+
+        class BenchmarkConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+        benchmark_app = create_app(BenchmarkConfig)
+        with benchmark_app.app_context():
+            report = run_rcm_analysis_benchmark()
+
+        for entry in report:
+            click.echo(f"{entry['nodes']:>6} nodes  {entry['queries']:>3} queries  {entry['duration_ms']:>8.1f} ms")
+
+        counts = {entry['queries'] for entry in report}
+        if len(counts) > 1:
+            click.echo("FAIL  query count grows with the size of the tree")
+            sys.exit(1)
+        click.echo("OK    query count is constant")
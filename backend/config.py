@@ -16,4 +16,8 @@ class Config:
     JWT_HEADER_TYPE = "Bearer"
     JWT_COOKIE_CSRF_PROTECT = False  # Disable CSRF protection for testing                         
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
\ No newline at end of file
+    AUTH_ROLE_CACHE_TTL = int(os.environ.get('AUTH_ROLE_CACHE_TTL', 0))  # Seconds, 0 = trust the role in the token
+    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    RCM_SNAPSHOT_GZIP = os.environ.get('RCM_SNAPSHOT_GZIP', '1') != '0'  # Send the cached RCM analysis gzip compressed when the client accepts it
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))  # Threads running background Excel imports
+    IMPORT_PARSE_PROCESSES = int(os.environ.get('IMPORT_PARSE_PROCESSES', 0)) or None  # Processes parsing the sheets of a batch import, None = one per CPU
@@ -0,0 +1,29 @@
+"""
+Materialised supervisor dashboard summary
+"""
+from backend.database import db
+from datetime import datetime, timezone
+
+class DashboardSummary(db.Model):
+    """
+    Fleet wide totals of the supervisor dashboard for the days up to `day`
+
+    A single row (id 1), recomputed from the daily reliability rollups when
+    a write touches a day inside the period and when the day rolls over.
+    Kept up to date by services/dashboard_summary.py.
+    """
+    __tablename__ = 'dashboard_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # Last day of the period, UTC
+    period_days = db.Column(db.Integer, nullable=False)
+    work_orders_total = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_open = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_in_progress = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_completed = db.Column(db.Integer, nullable=False, default=0)
+    failures_total = db.Column(db.Integer, nullable=False, default=0)
+    average_uptime_percentage = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<DashboardSummary {self.day}: {self.work_orders_total} work orders, {self.failures_total} failures>'
@@ -6,7 +6,7 @@ from datetime import datetime,timezone
 
 class Failure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    maintenance_log_id = db.Column(db.Integer, db.ForeignKey('maintenance_log.id'), nullable=False)
+    maintenance_log_id = db.Column(db.Integer, db.ForeignKey('maintenance_log.id'), nullable=False, index=True)
     description = db.Column(db.Text, nullable=False)
     severity = db.Column(db.String(20), nullable=False)  # 'minor', 'major', 'critical'
     images = db.relationship('FailureImage', backref='failure', lazy=True)
@@ -0,0 +1,50 @@
+"""
+Background import jobs
+"""
+import json
+from backend.database import db
+from datetime import datetime, timezone
+
+class ImportJob(db.Model):
+    """An uploaded file being imported in the background, with its progress and outcome"""
+    id = db.Column(db.String(36), primary_key=True)  # UUID, handed to the client for polling
+    kind = db.Column(db.String(50), nullable=False)  # 'rcm_excel', 'rcm_json', 'technical_structure'
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    params = db.Column(db.Text)  # JSON arguments for the importer
+    file_path = db.Column(db.String(500))
+    content_hash = db.Column(db.String(64))  # SHA-256 of the uploaded file
+    cache_key = db.Column(db.String(64), index=True)  # Hash of kind, file and params, see import_jobs
+    target_version = db.Column(db.String(100))  # Version of what was imported into, when the job finished
+    cached_from = db.Column(db.String(36))  # Job whose result was reused for an identical upload
+    original_filename = db.Column(db.String(255))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    rows_parsed = db.Column(db.Integer, default=0)
+    objects_created = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)  # JSON list of messages
+    result = db.Column(db.Text)  # JSON, what the importer returned
+    message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'original_filename': self.original_filename,
+            'content_hash': self.content_hash,
+            'cached_from': self.cached_from,
+            'created_by': self.created_by,
+            'rows_parsed': self.rows_parsed or 0,
+            'objects_created': self.objects_created or 0,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'result': json.loads(self.result) if self.result else None,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.kind} {self.status}>'
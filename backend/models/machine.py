@@ -19,6 +19,7 @@ class Machine(db.Model):
     expected_annual_usage = db.Column(db.Float, default=300)  # hours per year
     criticality_factor = db.Column(db.Float, default=1.0)  # 1-10 scale
     idle_degradation_factor = db.Column(db.Float, default=0.0)  # 0-1 scale
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)  # For mobile delta sync
     
     # Relationships
     subsystems = db.relationship('Subsystem', backref='machine', lazy=True)
@@ -36,6 +37,7 @@ class Subsystem(db.Model):
     name = db.Column(db.String(100), nullable=False)
     technical_id = db.Column(db.String(20), unique=True)  # e.g., "1077.01"
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)  # For mobile delta sync
     
     # Foreign key to machine
     machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), nullable=False)
@@ -59,6 +61,7 @@ class Component(db.Model):
     installation_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     maintenance_requirements = db.Column(db.Text)
     potential_failures = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)  # For mobile delta sync
     
     # Foreign keys
     subsystem_id = db.Column(db.Integer, db.ForeignKey('subsystem.id'), nullable=False)
@@ -0,0 +1,35 @@
+"""
+Materialised due state of RCM maintenance actions
+"""
+from backend.database import db
+from datetime import datetime, timezone
+
+class MaintenanceDueState(db.Model):
+    """
+    When an RCM maintenance action was last done and when it is due next
+
+    One row per action. An action belongs to one RCM unit, so it has a single
+    target: the machine, plus the subsystem/component the unit's technical ID
+    points at. Kept up to date by services/due_state.py.
+    """
+    __table_args__ = (
+        # "What is due before <date>", fleet wide and per machine
+        db.Index('ix_maintenance_due_state_next_due_at', 'next_due_at'),
+        db.Index('ix_maintenance_due_state_machine_next_due_at', 'machine_id', 'next_due_at'),
+        db.Index('ix_maintenance_due_state_machine_next_due_hours', 'machine_id', 'next_due_hours'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    rcm_maintenance_id = db.Column(db.Integer, db.ForeignKey('rcm_maintenance.id'), nullable=False, unique=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), nullable=False)
+    subsystem_id = db.Column(db.Integer, db.ForeignKey('subsystem.id'))
+    component_id = db.Column(db.Integer, db.ForeignKey('component.id'))
+    last_performed_at = db.Column(db.DateTime)
+    last_performed_hours = db.Column(db.Float)
+    next_due_at = db.Column(db.DateTime)      # Only for actions with interval_days
+    next_due_hours = db.Column(db.Float)      # Only for actions with interval_hours
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    
+    def __repr__(self):
+        return f'<MaintenanceDueState action {self.rcm_maintenance_id} due {self.next_due_at} / {self.next_due_hours}h>'
@@ -5,6 +5,15 @@ from backend.database import db
 from datetime import datetime,timezone
 
 class MaintenanceLog(db.Model):
+    # Indexes for the per machine/component history lookups used by statistics
+    __table_args__ = (
+        db.Index('ix_maintenance_log_component_timestamp', 'component_id', 'timestamp'),
+        db.Index('ix_maintenance_log_machine_timestamp', 'machine_id', 'timestamp'),
+        db.Index('ix_maintenance_log_subsystem_timestamp', 'subsystem_id', 'timestamp'),
+        # Logs written against a work order, when the order is completed or changed
+        db.Index('ix_maintenance_log_work_order', 'work_order_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime,default=lambda: datetime.now(timezone.utc))  #TIMEZONE UTC
     description = db.Column(db.Text, nullable=False)
@@ -8,7 +8,7 @@ class RCMUnit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
-    equipment_id = db.Column(db.Integer, db.ForeignKey('machine.id'))
+    equipment_id = db.Column(db.Integer, db.ForeignKey('machine.id'), index=True)
     technical_id = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     unit_id = db.Column(db.Integer, db.ForeignKey('rcm_unit.id'))
@@ -26,7 +26,7 @@ class RCMFunction(db.Model):
     equipment_id = db.Column(db.Integer, db.ForeignKey('machine.id'))
     technical_id = db.Column(db.String(50))  # For alignment with technical structure
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  #TIMEZONE UTC
-    unit_id = db.Column(db.Integer, db.ForeignKey('rcm_unit.id'))
+    unit_id = db.Column(db.Integer, db.ForeignKey('rcm_unit.id'), index=True)
     
     # Relationships
     functional_failures = db.relationship('RCMFunctionalFailure', backref='function', lazy=True)
@@ -39,7 +39,7 @@ class RCMFunctionalFailure(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
-    function_id = db.Column(db.Integer, db.ForeignKey('rcm_function.id'), nullable=False)
+    function_id = db.Column(db.Integer, db.ForeignKey('rcm_function.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  #TIMEZONE UTC
     
     # Relationships
@@ -55,7 +55,7 @@ class RCMFailureMode(db.Model):
     description = db.Column(db.Text)
     failure_type = db.Column(db.String(100))  # E.g., Electrical, Mechanical, etc.
     detection_method = db.Column(db.String(255))  # How the failure is detected
-    functional_failure_id = db.Column(db.Integer, db.ForeignKey('rcm_functional_failure.id'), nullable=False)
+    functional_failure_id = db.Column(db.Integer, db.ForeignKey('rcm_functional_failure.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  #TIMEZONE UTC
     
     # Relationships
@@ -69,7 +69,7 @@ class RCMFailureEffect(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.Text, nullable=False)
     severity = db.Column(db.String(50))  # Low, Medium, High, Critical
-    failure_mode_id = db.Column(db.Integer, db.ForeignKey('rcm_failure_mode.id'), nullable=False)
+    failure_mode_id = db.Column(db.Integer, db.ForeignKey('rcm_failure_mode.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  #TIMEZONE UTC
 
      # Add fields for consequences 
@@ -89,11 +89,19 @@ class RCMMaintenance(db.Model):
     maintenance_type = db.Column(db.String(100))  # Preventive, Predictive, Corrective
     interval_days = db.Column(db.Integer)  # Frequency in days
     interval_hours = db.Column(db.Float)   # Frequency in equipment hours
-    failure_mode_id = db.Column(db.Integer, db.ForeignKey('rcm_failure_mode.id'), nullable=False)
+    failure_mode_id = db.Column(db.Integer, db.ForeignKey('rcm_failure_mode.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  #TIMEZONE UTC
 
     # Added after changes
     maintenance_strategy = db.Column(db.String(100))  # The recommended strategy
     
     def __repr__(self):
-        return f'<RCMMaintenance {self.title}>'
\ No newline at end of file
+        return f'<RCMMaintenance {self.title}>'
+class RCMRevision(db.Model):
+    """Change counter of the RCM analysis of one machine, versions the analysis snapshots"""
+    # equipment_id 0 counts changes to any analysis, -1 is bumped to invalidate all of them
+    equipment_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<RCMRevision {self.equipment_id}: {self.revision}>'
@@ -0,0 +1,77 @@
+"""
+Daily reliability rollups
+"""
+from backend.database import db
+
+class ReliabilityDaily(db.Model):
+    """
+    Failure and work order totals of one day for one machine/subsystem/component
+
+    One row per (day, machine, subsystem, component) combination that had a
+    maintenance log or a work order that day; subsystem and component are
+    empty for rows booked on the machine itself. Failures are counted on the
+    day of their maintenance log, work orders on the day they were created.
+    Kept up to date by services/reliability_rollup.py.
+    """
+    __tablename__ = 'reliability_daily'
+    __table_args__ = (
+        # Date range per machine, subsystem and component, and fleet wide
+        db.Index('ix_reliability_daily_machine_day', 'machine_id', 'day'),
+        db.Index('ix_reliability_daily_subsystem_day', 'subsystem_id', 'day'),
+        db.Index('ix_reliability_daily_component_day', 'component_id', 'day'),
+        db.Index('ix_reliability_daily_day', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC
+    machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), nullable=False)
+    subsystem_id = db.Column(db.Integer, db.ForeignKey('subsystem.id'))
+    component_id = db.Column(db.Integer, db.ForeignKey('component.id'))
+
+    # Failures reported in the day's maintenance logs
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    failures_minor = db.Column(db.Integer, nullable=False, default=0)
+    failures_major = db.Column(db.Integer, nullable=False, default=0)
+    failures_critical = db.Column(db.Integer, nullable=False, default=0)
+
+    # Failures whose log belongs to a completed work order, for MTBF/MTTR.
+    # MTBF over a range only needs the count and the first and last failure,
+    # MTTR the repairs with downtime and their total.
+    repaired_failure_count = db.Column(db.Integer, nullable=False, default=0)
+    first_failure_at = db.Column(db.DateTime)
+    last_failure_at = db.Column(db.DateTime)
+    repair_count = db.Column(db.Integer, nullable=False, default=0)
+    repair_hours = db.Column(db.Float, nullable=False, default=0)
+
+    # Work orders created that day
+    work_orders_total = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_open = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_in_progress = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_completed = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_preventive = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_predictive = db.Column(db.Integer, nullable=False, default=0)
+    work_orders_corrective = db.Column(db.Integer, nullable=False, default=0)
+    downtime_hours = db.Column(db.Float, nullable=False, default=0)  # Of the completed ones
+
+    def __repr__(self):
+        return f'<ReliabilityDaily {self.day} machine {self.machine_id}: {self.failure_count} failures>'
+
+class MachineHoursDaily(db.Model):
+    """
+    Operating hours a machine's hour counter moved on by during one day
+
+    Built from the counter updates as they happen, there is no reading
+    history to recompute it from.
+    """
+    __tablename__ = 'machine_hours_daily'
+    __table_args__ = (
+        db.UniqueConstraint('machine_id', 'day', name='uq_machine_hours_daily_machine_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC
+    machine_id = db.Column(db.Integer, db.ForeignKey('machine.id'), nullable=False)
+    hours = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MachineHoursDaily {self.day} machine {self.machine_id}: {self.hours}h>'
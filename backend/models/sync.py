@@ -0,0 +1,66 @@
+"""
+Tombstones for mobile delta sync
+"""
+from backend.database import db
+from datetime import datetime, timezone
+from sqlalchemy import event, inspect, select
+from backend.models.machine import Machine, Subsystem, Component
+from backend.models.work_order import WorkOrder
+
+class SyncTombstone(db.Model):
+    """Records a deleted row so clients can drop it from their local copy"""
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # 'machine', 'subsystem', 'component', 'work_order'
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    # Set when the row still exists but left this user's copy, e.g. a work order assigned to someone else
+    user_id = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<SyncTombstone {self.entity_type} {self.entity_id}>'
+
+# Models tracked by the sync endpoint, entity_type -> model
+SYNCED_MODELS = {
+    'machine': Machine,
+    'subsystem': Subsystem,
+    'component': Component,
+    'work_order': WorkOrder
+}
+
+def _record_tombstone(entity_type):
+    def after_delete(mapper, connection, target):
+        connection.execute(SyncTombstone.__table__.insert().values(
+            entity_type=entity_type,
+            entity_id=target.id,
+            deleted_at=datetime.now(timezone.utc)
+        ))
+    return after_delete
+
+for _entity_type, _model in SYNCED_MODELS.items():
+    event.listen(_model, 'after_delete', _record_tombstone(_entity_type))
+
+def record_unassigned(connection, previous_assignees):
+    """Tombstones for work orders that left the copy of their previous assignee, {work_order_id: user_id}"""
+    rows = [
+        {'entity_type': 'work_order', 'entity_id': work_order_id, 'user_id': user_id,
+         'deleted_at': datetime.now(timezone.utc)}
+        for work_order_id, user_id in previous_assignees.items() if user_id is not None
+    ]
+    if rows:
+        connection.execute(SyncTombstone.__table__.insert(), rows)
+
+@event.listens_for(WorkOrder, 'before_update')
+def _work_order_reassigned(mapper, connection, target):
+    # Workers only sync their own orders, so the old assignee has to be told to drop it
+    history = inspect(target).attrs.assigned_to.history
+    if not history.has_changes():
+        return
+    if history.deleted:
+        previous = history.deleted[0]
+    else:
+        # Assigned while expired, the old value is only in the database
+        previous = connection.execute(
+            select(WorkOrder.assigned_to).where(WorkOrder.id == target.id)
+        ).scalar()
+    if previous != target.assigned_to:
+        record_unassigned(connection, {target.id: previous})
@@ -0,0 +1,61 @@
+"""
+Per-table change counters, used to version API responses
+"""
+# Every flush that inserts, updates or deletes rows bumps the counter of the
+# affected tables in the same transaction. A response built from a set of
+# tables is unchanged as long as their counters are, so it can be answered
+# with 304 Not Modified without querying or serialising the data again.
+from backend.database import db
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+class TableVersion(db.Model):
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}: {self.version}>'
+
+def bump_table_versions(connection, table_names):
+    """Increment the counters of the given tables, for writes that bypass the ORM"""
+    table = TableVersion.__table__
+    for table_name in sorted(set(table_names)):
+        result = connection.execute(
+            table.update()
+            .where(table.c.table_name == table_name)
+            .values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(table_name=table_name, version=1))
+
+def get_table_versions(table_names):
+    """Current counters for the given tables, 0 for tables never written"""
+    table = TableVersion.__table__
+    rows = db.session.execute(
+        select(table.c.table_name, table.c.version).where(table.c.table_name.in_(table_names))
+    ).all()
+    versions = dict.fromkeys(table_names, 0)
+    versions.update({name: version for name, version in rows})
+    return versions
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    tables = set()
+    for obj in list(session.new) + list(session.deleted):
+        tables.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tables.add(obj.__table__.name)
+    tables.discard(TableVersion.__tablename__)
+
+    if tables:
+        bump_table_versions(session.connection(), tables)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_dml_tables(orm_execute_state):
+    # query.update() / query.delete() and ORM bulk insert statements skip the flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = orm_execute_state.statement.table
+    if table.name != TableVersion.__tablename__:
+        bump_table_versions(orm_execute_state.session.connection(), [table.name])
@@ -5,10 +5,20 @@ from backend.database import db
 from datetime import datetime,timezone
 
 class WorkOrder(db.Model):
+    # Index for the "open order of this kind for this machine" lookups
+    __table_args__ = (
+        db.Index('ix_work_order_machine_status_source', 'machine_id', 'status', 'generation_source'),
+        # Fleet wide "open orders from this generator" prefetch
+        db.Index('ix_work_order_source_status', 'generation_source', 'status'),
+        # Orders of a machine created on a given day, for the reliability rollups
+        db.Index('ix_work_order_machine_created', 'machine_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # Vil jeg ha tidzone UTC?
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), index=True)  # For mobile delta sync
     due_date = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(20), default='open')  # 'open', 'in_progress', 'completed'
     priority = db.Column(db.String(20), default='normal')  # 'low', 'normal', 'high', 'critical'
@@ -27,6 +37,7 @@ class WorkOrder(db.Model):
     tool_requirements = db.Column(db.Text)
     reason = db.Column(db.Text)  # Why this work order was created
     generation_source = db.Column(db.String(50))  # How the work order was created 'hour_counter', 'calendar', 'deviation', 'rcm'
+    rcm_maintenance_id = db.Column(db.Integer, db.ForeignKey('rcm_maintenance.id'))  # The RCM action an 'rcm' order was generated from
     
     def __repr__(self):
         return f'<WorkOrder {self.id}: {self.title}>'
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Schema upgrades for existing databases
+"""
+# db.create_all() only creates missing tables, so columns and indexes added
+# to the models later on never reach a database that already has the tables.
+# upgrade_schema() fills that gap and is safe to run on every startup.
+import logging
+from sqlalchemy import inspect, text
+from backend.database import db
+
+logger = logging.getLogger(__name__)
+
+def ensure_indexes(engine=None):
+    """Create every index declared on the models that is missing in the database"""
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            index.create(bind=engine, checkfirst=True)
+            created.append(index.name)
+
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+
+    return created
+
+def ensure_columns(engine=None):
+    """Add model columns that are missing from existing tables"""
+    # SQLite can only add nullable columns without a non-constant default, so
+    # existing rows are backfilled afterwards from the column's Python default.
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+                default = column.default
+                if default is not None and (default.is_scalar or default.is_callable):
+                    value = default.arg if default.is_scalar else default.arg(None)
+                    connection.execute(
+                        table.update().where(column.is_(None)).values({column.name: value})
+                    )
+            added.append(f"{table.name}.{column.name}")
+
+    if added:
+        logger.info(f"Added columns: {', '.join(added)}")
+
+    return added
+
+def upgrade_schema(engine=None):
+    """Bring an existing database up to date with the models, idempotent"""
+    from backend.services.search_index import ensure_search_index
+    from backend.services.due_state import DueStateService
+    from backend.services.reliability_rollup import ReliabilityRollupService
+
+    return {
+        'columns_added': ensure_columns(engine),
+        'indexes_created': ensure_indexes(engine),
+        'search_index_created': ensure_search_index(engine),
+        'due_states_computed': DueStateService.ensure_populated(engine),
+        'rollup_rows_computed': ReliabilityRollupService.ensure_populated(engine)
+    }
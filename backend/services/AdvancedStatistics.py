@@ -55,7 +55,7 @@ class AdvancedStatistics:
             
         # Calculate operating hours using your existing methods
         machine = Machine.query.get(component.machine_id)
-        failure_rates = MaintenanceStatistics.get_failure_rates(machine.id, start_date, end_date)
+        failure_rates = MaintenanceStatistics.get_failure_rates(machine_id=machine.id, start_date=start_date, end_date=end_date)
         
         # Find the failure rate for this machine
         operating_hours = 0
@@ -224,7 +224,7 @@ class AdvancedStatistics:
             
         # Calculate operating hours using your existing methods
         machine = Machine.query.get(component.machine_id)
-        failure_rates = MaintenanceStatistics.get_failure_rates(machine.id, start_date, end_date)
+        failure_rates = MaintenanceStatistics.get_failure_rates(machine_id=machine.id, start_date=start_date, end_date=end_date)
         
         # Find the failure rate for this machine
         operating_hours = 0
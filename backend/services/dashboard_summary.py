@@ -0,0 +1,90 @@
+"""
+Supervisor dashboard summary, materialised on write
+"""
+# The dashboard used to run the work order, failure rate and uptime
+# statistics over the last 30 days on every page load. Their totals are now
+# kept in the single dashboard_summary row: whenever the reliability rollups
+# change for a day inside the period they are summed again (a handful of
+# rows per machine and day), and the endpoint only reads the row. A row
+# computed on an earlier day is recomputed on the first read after midnight.
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, func
+from backend.database import db
+from backend.models.reliability_rollup import ReliabilityDaily
+from backend.models.dashboard_summary import DashboardSummary
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_DAYS = 30
+SUMMARY_ID = 1
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+def period_start(day):
+    """First day of the period ending on the given day, both days included like the statistics"""
+    return day - timedelta(days=DASHBOARD_DAYS)
+
+class DashboardSummaryService:
+    @staticmethod
+    def affects(days, today=None):
+        """Whether a change on one of the given days shows on the dashboard"""
+        today = today or _today()
+        start = period_start(today)
+        return any(day is not None and start <= day <= today for day in days)
+
+    @staticmethod
+    def refresh(connection=None, today=None):
+        """Recompute the summary row from the rollups, returns its values"""
+        connection = connection if connection is not None else db.session.connection()
+        today = today or _today()
+        in_period = (ReliabilityDaily.day >= period_start(today), ReliabilityDaily.day <= today)
+
+        totals = connection.execute(
+            select(
+                func.coalesce(func.sum(ReliabilityDaily.work_orders_total), 0),
+                func.coalesce(func.sum(ReliabilityDaily.work_orders_open), 0),
+                func.coalesce(func.sum(ReliabilityDaily.work_orders_in_progress), 0),
+                func.coalesce(func.sum(ReliabilityDaily.work_orders_completed), 0),
+                func.coalesce(func.sum(ReliabilityDaily.failure_count), 0)
+            ).where(*in_period)
+        ).one()
+
+        # Uptime of the machines with completed orders in the period, averaged like get_uptime_statistics
+        downtimes = connection.execute(
+            select(func.sum(ReliabilityDaily.downtime_hours))
+            .where(*in_period)
+            .group_by(ReliabilityDaily.machine_id)
+            .having(func.sum(ReliabilityDaily.work_orders_completed) > 0)
+        ).scalars().all()
+        period_hours = DASHBOARD_DAYS * 24
+        uptimes = [round((period_hours - (downtime or 0)) / period_hours * 100, 2) for downtime in downtimes]
+
+        values = {
+            'day': today,
+            'period_days': DASHBOARD_DAYS,
+            'work_orders_total': totals[0],
+            'work_orders_open': totals[1],
+            'work_orders_in_progress': totals[2],
+            'work_orders_completed': totals[3],
+            'failures_total': totals[4],
+            'average_uptime_percentage': round(sum(uptimes) / len(uptimes), 2) if uptimes else 0,
+            'updated_at': datetime.now(timezone.utc)
+        }
+
+        table = DashboardSummary.__table__
+        result = connection.execute(table.update().where(table.c.id == SUMMARY_ID).values(values))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(id=SUMMARY_ID, **values))
+        return values
+
+    @staticmethod
+    def current():
+        """The summary row for today, recomputed first when it is missing or from an earlier day"""
+        summary = db.session.get(DashboardSummary, SUMMARY_ID)
+        if summary is None or summary.day != _today():
+            DashboardSummaryService.refresh()
+            db.session.commit()
+            summary = db.session.get(DashboardSummary, SUMMARY_ID)
+        return summary
@@ -0,0 +1,304 @@
+"""
+Incremental upkeep of the maintenance due state table
+"""
+# Instead of walking RCMMaintenance -> RCMFailureMode -> RCMFunctionalFailure
+# -> RCMFunction -> RCMUnit and comparing against work orders on every run,
+# the next due date/hours of each action are stored in maintenance_due_state
+# and updated when something that affects them changes:
+#   - an action is created, deleted or its interval changes
+#   - a maintenance log is written against an RCM work order
+#   - an RCM work order is completed
+# "What is due" then becomes a range scan on an index of that table.
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, select, func, and_, bindparam, inspect as sa_inspect
+from backend.database import db
+from backend.models.machine import Machine
+from backend.models.work_order import WorkOrder
+from backend.models.maintenance_log import MaintenanceLog
+from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMMaintenance
+from backend.models.maintenance_due_state import MaintenanceDueState
+
+logger = logging.getLogger(__name__)
+
+def _naive_utc(value):
+    """SQLite hands back naive UTC datetimes, compare everything in that form"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _action_rows(connection, maintenance_ids=None, machine_id=None):
+    query = select(
+        RCMMaintenance.id,
+        RCMMaintenance.interval_days,
+        RCMMaintenance.interval_hours,
+        RCMUnit.equipment_id,
+        RCMUnit.technical_id
+    ).join(
+        RCMFailureMode, RCMMaintenance.failure_mode_id == RCMFailureMode.id
+    ).join(
+        RCMFunctionalFailure, RCMFailureMode.functional_failure_id == RCMFunctionalFailure.id
+    ).join(
+        RCMFunction, RCMFunctionalFailure.function_id == RCMFunction.id
+    ).join(
+        RCMUnit, RCMFunction.unit_id == RCMUnit.id
+    )
+    if maintenance_ids is not None:
+        query = query.where(RCMMaintenance.id.in_(maintenance_ids))
+    if machine_id is not None:
+        query = query.where(RCMUnit.equipment_id == machine_id)
+    return connection.execute(query).all()
+
+def _last_performed_from_history(connection, maintenance_ids):
+    """maintenance_id -> (last log time, last hour reading) from logs on its work orders"""
+    if not maintenance_ids:
+        return {}
+    rows = connection.execute(
+        select(
+            WorkOrder.rcm_maintenance_id,
+            func.max(MaintenanceLog.timestamp),
+            func.max(MaintenanceLog.hour_counter)
+        ).join(
+            WorkOrder, MaintenanceLog.work_order_id == WorkOrder.id
+        ).where(
+            WorkOrder.rcm_maintenance_id.in_(maintenance_ids)
+        ).group_by(WorkOrder.rcm_maintenance_id)
+    ).all()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+class DueStateService:
+    @staticmethod
+    def refresh(connection=None, maintenance_ids=None, machine_id=None, performed=None):
+        """
+        Recompute the due state of a set of actions in a fixed number of queries
+
+        Args:
+            connection: Connection to write on, defaults to the session's
+            maintenance_ids: Actions to refresh, all actions when None
+            machine_id: Only the actions of this machine
+            performed: {maintenance_id: (performed_at, hour_counter)} for actions just done
+
+        Returns:
+            Number of due state rows written
+        """
+        from backend.services.work_order_generator import WorkOrderGenerator
+
+        connection = connection if connection is not None else db.session.connection()
+        performed = performed or {}
+        table = MaintenanceDueState.__table__
+        now = _naive_utc(datetime.now(timezone.utc))
+
+        actions = [a for a in _action_rows(connection, maintenance_ids, machine_id) if a.equipment_id]
+        action_ids = [a.id for a in actions]
+
+        # Actions that lost their place in the hierarchy don't have a target anymore
+        if maintenance_ids is not None:
+            orphaned = set(maintenance_ids) - set(action_ids)
+            if orphaned:
+                connection.execute(table.delete().where(table.c.rcm_maintenance_id.in_(orphaned)))
+        if not actions:
+            return 0
+
+        targets = WorkOrderGenerator._resolve_unit_targets(actions, connection=connection)
+        existing = {
+            row.rcm_maintenance_id: row
+            for row in connection.execute(select(table).where(table.c.rcm_maintenance_id.in_(action_ids))).all()
+        }
+        history = _last_performed_from_history(connection, [i for i in action_ids if i not in existing])
+
+        inserts = []
+        updates = []
+        for action in actions:
+            state = existing.get(action.id)
+            subsystem_id, component_id = targets.get(action.technical_id, (None, None))
+
+            if action.id in performed:
+                last_at, last_hours = performed[action.id]
+            elif state is not None:
+                last_at, last_hours = state.last_performed_at, state.last_performed_hours
+            else:
+                last_at, last_hours = history.get(action.id, (None, None))
+            last_at = _naive_utc(last_at)
+
+            # Never done: count the interval from when the action was first tracked
+            baseline_at = last_at or (state.created_at if state is not None else now)
+            values = {
+                'machine_id': action.equipment_id,
+                'subsystem_id': subsystem_id,
+                'component_id': component_id,
+                'last_performed_at': last_at,
+                'last_performed_hours': last_hours,
+                'next_due_at': baseline_at + timedelta(days=action.interval_days) if action.interval_days else None,
+                'next_due_hours': (last_hours or 0) + action.interval_hours if action.interval_hours else None,
+                'updated_at': now
+            }
+
+            if state is None:
+                inserts.append({'rcm_maintenance_id': action.id, 'created_at': now, **values})
+            else:
+                updates.append({'state_id': state.id, **values})
+
+        if inserts:
+            connection.execute(table.insert(), inserts)
+        if updates:
+            connection.execute(
+                table.update().where(table.c.id == bindparam('state_id')).values(
+                    {key: bindparam(key) for key in updates[0] if key != 'state_id'}
+                ),
+                updates
+            )
+        return len(inserts) + len(updates)
+
+    @staticmethod
+    def rebuild(machine_id=None, engine=None):
+        """Recompute every due state from the RCM hierarchy and maintenance history"""
+        engine = engine or db.engine
+        with engine.begin() as connection:
+            table = MaintenanceDueState.__table__
+            stale = table.delete()
+            if machine_id is not None:
+                stale = stale.where(table.c.machine_id == machine_id)
+            connection.execute(stale)
+            return DueStateService.refresh(connection, machine_id=machine_id)
+
+    @staticmethod
+    def ensure_populated(engine=None):
+        """Fill the table on databases that had RCM actions before it existed"""
+        engine = engine or db.engine
+        with engine.connect() as connection:
+            has_states = connection.execute(select(MaintenanceDueState.id).limit(1)).first() is not None
+            has_actions = connection.execute(select(RCMMaintenance.id).limit(1)).first() is not None
+        if has_states or not has_actions:
+            return 0
+        count = DueStateService.rebuild(engine=engine)
+        logger.info(f"Computed due state for {count} maintenance actions")
+        return count
+
+    @staticmethod
+    def due_query(due_before=None, maintenance_ids=None, machine_id=None):
+        """Query of (MaintenanceDueState, RCMMaintenance, Machine) for actions due by date before the given time"""
+        query = db.session.query(MaintenanceDueState, RCMMaintenance, Machine).join(
+            RCMMaintenance, MaintenanceDueState.rcm_maintenance_id == RCMMaintenance.id
+        ).join(
+            Machine, MaintenanceDueState.machine_id == Machine.id
+        )
+        if due_before is not None:
+            query = query.filter(MaintenanceDueState.next_due_at <= _naive_utc(due_before))
+        if maintenance_ids is not None:
+            query = query.filter(MaintenanceDueState.rcm_maintenance_id.in_(maintenance_ids))
+        if machine_id is not None:
+            query = query.filter(MaintenanceDueState.machine_id == machine_id)
+        return query
+
+    @staticmethod
+    def upcoming(days=30, hours=50, machine_id=None):
+        """
+        Actions due within the given number of days or operating hours
+
+        Returns:
+            List of dicts sorted by due date, hour based actions without a date last
+        """
+        due_before = _naive_utc(datetime.now(timezone.utc) + timedelta(days=days))
+
+        def base_query():
+            query = db.session.query(
+                MaintenanceDueState,
+                RCMMaintenance.title,
+                RCMMaintenance.interval_days,
+                RCMMaintenance.interval_hours,
+                Machine.name.label('machine_name'),
+                Machine.hour_counter
+            )
+            if machine_id is not None:
+                query = query.filter(Machine.id == machine_id)
+            return query
+
+        # Two queries rather than one OR, so each is a range scan on its own index:
+        # by date on next_due_at, and by hours per machine on (machine_id, next_due_hours)
+        by_date = base_query().select_from(MaintenanceDueState).join(
+            Machine, MaintenanceDueState.machine_id == Machine.id
+        ).join(
+            RCMMaintenance, MaintenanceDueState.rcm_maintenance_id == RCMMaintenance.id
+        ).filter(
+            MaintenanceDueState.next_due_at <= due_before
+        ).all()
+
+        # "+ 0" keeps SQLite from driving this join from the due state side, the
+        # machine table is the small one and each machine is an index range lookup
+        by_hours = base_query().select_from(Machine).join(
+            MaintenanceDueState, and_(
+                MaintenanceDueState.machine_id == Machine.id + 0,
+                MaintenanceDueState.next_due_hours <= func.coalesce(Machine.hour_counter, 0) + hours
+            )
+        ).join(
+            RCMMaintenance, MaintenanceDueState.rcm_maintenance_id == RCMMaintenance.id
+        ).all()
+
+        rows = {row[0].id: row for row in by_date + by_hours}
+
+        result = []
+        for state, title, interval_days, interval_hours, machine_name, hour_counter in rows.values():
+            result.append({
+                'rcm_maintenance_id': state.rcm_maintenance_id,
+                'title': title,
+                'machine_id': state.machine_id,
+                'machine_name': machine_name,
+                'subsystem_id': state.subsystem_id,
+                'component_id': state.component_id,
+                'interval_days': interval_days,
+                'interval_hours': interval_hours,
+                'last_performed_at': state.last_performed_at.isoformat() if state.last_performed_at else None,
+                'last_performed_hours': state.last_performed_hours,
+                'next_due_at': state.next_due_at.isoformat() if state.next_due_at else None,
+                'next_due_hours': state.next_due_hours,
+                'hours_remaining': state.next_due_hours - (hour_counter or 0) if state.next_due_hours is not None else None
+            })
+
+        result.sort(key=lambda r: (r['next_due_at'] is None, r['next_due_at'] or ''))
+        return result
+
+# Keep the table current from the ORM
+
+@event.listens_for(RCMMaintenance, 'after_insert')
+def _action_created(mapper, connection, target):
+    DueStateService.refresh(connection, maintenance_ids=[target.id])
+
+@event.listens_for(RCMMaintenance, 'after_update')
+def _action_updated(mapper, connection, target):
+    state = sa_inspect(target)
+    if (state.attrs.interval_days.history.has_changes()
+            or state.attrs.interval_hours.history.has_changes()
+            or state.attrs.failure_mode_id.history.has_changes()):
+        DueStateService.refresh(connection, maintenance_ids=[target.id])
+
+@event.listens_for(RCMMaintenance, 'after_delete')
+def _action_deleted(mapper, connection, target):
+    table = MaintenanceDueState.__table__
+    connection.execute(table.delete().where(table.c.rcm_maintenance_id == target.id))
+
+def _machine_hours(connection, machine_id):
+    return connection.execute(select(Machine.hour_counter).where(Machine.id == machine_id)).scalar()
+
+@event.listens_for(MaintenanceLog, 'after_insert')
+def _log_written(mapper, connection, target):
+    if not target.work_order_id:
+        return
+    maintenance_id = connection.execute(
+        select(WorkOrder.rcm_maintenance_id).where(WorkOrder.id == target.work_order_id)
+    ).scalar()
+    if maintenance_id is None:
+        return
+    hours = target.hour_counter if target.hour_counter is not None else _machine_hours(connection, target.machine_id)
+    performed_at = target.timestamp or datetime.now(timezone.utc)
+    DueStateService.refresh(connection, maintenance_ids=[maintenance_id],
+                            performed={maintenance_id: (performed_at, hours)})
+
+@event.listens_for(WorkOrder, 'after_update')
+def _work_order_completed(mapper, connection, target):
+    if target.rcm_maintenance_id is None or target.status != 'completed':
+        return
+    if not sa_inspect(target).attrs.status.history.has_changes():
+        return
+    hours = _machine_hours(connection, target.machine_id)
+    DueStateService.refresh(connection, maintenance_ids=[target.rcm_maintenance_id],
+                            performed={target.rcm_maintenance_id: (datetime.now(timezone.utc), hours)})
@@ -0,0 +1,58 @@
+"""
+Bulk lookup of the machines, subsystems and components behind a result set
+"""
+# Grouped statistics come back as ids. Resolving them with Model.query.get()
+# per row costs a query per machine/subsystem/component in the result, so a
+# fleet wide report grows with the fleet. EntityLookup collects the ids first
+# and fetches each level with one IN query, the machines of the requested
+# subsystems and components included.
+from backend.models.machine import Machine, Subsystem, Component
+from backend.services.rcm_analysis import IN_CHUNK_SIZE
+
+def _fetch(model, ids):
+    ids = sorted({entity_id for entity_id in ids if entity_id is not None})
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[start:start + IN_CHUNK_SIZE]
+        found.update((entity.id, entity) for entity in model.query.filter(model.id.in_(chunk)).all())
+    return found
+
+class EntityLookup:
+    """Machines, subsystems and components by id, loaded in at most one query per level"""
+
+    def __init__(self, machine_ids=(), subsystem_ids=(), component_ids=()):
+        self.components = _fetch(Component, component_ids)
+        self.subsystems = _fetch(Subsystem, subsystem_ids)
+        self.machines = _fetch(Machine, [
+            *machine_ids,
+            *(component.machine_id for component in self.components.values()),
+            *(subsystem.machine_id for subsystem in self.subsystems.values())
+        ])
+
+    @classmethod
+    def for_level(cls, level, ids):
+        """Lookup of the ids of one level: 'machine', 'subsystem' or 'component'"""
+        return cls(**{f'{level}_ids': ids})
+
+    def machine(self, machine_id):
+        return self.machines.get(machine_id)
+
+    def subsystem(self, subsystem_id):
+        return self.subsystems.get(subsystem_id)
+
+    def component(self, component_id):
+        return self.components.get(component_id)
+
+    def entity(self, level, entity_id):
+        """The machine, subsystem or component with the given id"""
+        return {'machine': self.machines, 'subsystem': self.subsystems, 'component': self.components}[level].get(entity_id)
+
+    def machine_of(self, level, entity_id):
+        """The machine an entity of the given level belongs to"""
+        if level == 'component':
+            component = self.components.get(entity_id)
+            return self.machines.get(component.machine_id) if component else None
+        if level == 'subsystem':
+            subsystem = self.subsystems.get(entity_id)
+            return self.machines.get(subsystem.machine_id) if subsystem else None
+        return self.machines.get(entity_id)
@@ -157,7 +157,7 @@ class ExportService:
         from backend.services.statistics import MaintenanceStatistics
         
         # Get statistics
-        failure_rates = MaintenanceStatistics.get_failure_rates(machine_id, start_date, end_date)
+        failure_rates = MaintenanceStatistics.get_failure_rates(machine_id=machine_id, start_date=start_date, end_date=end_date)
         uptime_stats = MaintenanceStatistics.get_uptime_statistics(machine_id, start_date, end_date)
         mtbf_mttr = MaintenanceStatistics.get_mtbf_mttr(machine_id, start_date, end_date)
         work_order_stats = MaintenanceStatistics.get_work_order_statistics(machine_id, start_date, end_date)
@@ -0,0 +1,115 @@
+"""
+Hour counter threshold crossing engine
+"""
+# Runs when a machine's hour counter is updated. Instead of sweeping every
+# machine and hoping the counter is read close to a multiple of the interval,
+# it compares the previous and the new reading and creates an order for each
+# hour interval that was passed in between, however large the jump.
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from backend.services.work_order_generator import WorkOrderGenerator, RCM_ACTION_SOURCES
+
+logger = logging.getLogger(__name__)
+
+# Machine level service interval, used for every machine like generate_hour_based_orders
+DEFAULT_HOUR_INTERVAL = 100
+
+def crossed_thresholds(previous_hours, new_hours, interval):
+    """Multiples of interval in (previous_hours, new_hours], oldest first"""
+    if not interval or interval <= 0 or new_hours <= previous_hours:
+        return []
+    first = math.floor(previous_hours / interval) + 1
+    last = math.floor(new_hours / interval)
+    return [n * interval for n in range(first, last + 1)]
+
+class HourThresholdEngine:
+    @staticmethod
+    def process_reading(machine, previous_hours, new_hours):
+        """
+        Create the work orders for the hour thresholds crossed by a new reading
+
+        The caller has already set machine.hour_counter; the orders are committed
+        together with it. One order is created per maintenance action even when a
+        jump passes several multiples of its interval, the reason lists them all.
+
+        Returns:
+            List of created WorkOrders
+        """
+        previous_hours = previous_hours or 0
+        if new_hours <= previous_hours:
+            return []
+
+        open_keys = WorkOrderGenerator._open_order_keys(*RCM_ACTION_SOURCES, machine_id=machine.id)
+        due_date = datetime.now(timezone.utc) + timedelta(days=3)
+        rows = []
+
+        # Machine level service every DEFAULT_HOUR_INTERVAL hours
+        thresholds = crossed_thresholds(previous_hours, new_hours, DEFAULT_HOUR_INTERVAL)
+        if thresholds and (machine.id, None, None) not in open_keys:
+            rows.append(dict(
+                title=f"Regular maintenance for {machine.name} - {thresholds[-1]:g} hours",
+                description=f"Perform regular maintenance after {thresholds[-1]:g} hours of operation.",
+                due_date=due_date,
+                status='open',
+                priority='normal',
+                type='preventive',
+                frequency='periodic',
+                category='regular_maintenance',
+                machine_id=machine.id,
+                generation_source='hour_counter',
+                reason=HourThresholdEngine._reason(thresholds)
+            ))
+
+        # RCM actions with an hour interval
+        actions = WorkOrderGenerator._rcm_actions_for_machine(machine.id, hour_based_only=True)
+        targets = WorkOrderGenerator._resolve_unit_targets(unit for _, _, _, _, unit in actions)
+
+        for maint, mode, failure, function, unit in actions:
+            thresholds = crossed_thresholds(previous_hours, new_hours, maint.interval_hours)
+            if not thresholds:
+                continue
+
+            subsystem_id, component_id = targets.get(unit.technical_id, (None, None))
+            key = (machine.id, component_id, maint.id)
+            if key in open_keys:
+                continue
+            open_keys.add(key)
+
+            rows.append(dict(
+                title=f"{maint.title or 'Maintenance'} - {function.name} ({thresholds[-1]:g} hours)",
+                description=(
+                    f"RCM-based maintenance action every {maint.interval_hours:g} operating hours\n\n"
+                    f"Unit: {unit.name} ({unit.technical_id})\n"
+                    f"Function: {function.name}\n"
+                    f"Functional Failure: {failure.name}\n"
+                    f"Failure Mode: {mode.name}\n"
+                    f"Action: {maint.description or maint.title}\n"
+                ),
+                due_date=due_date,
+                status='open',
+                priority='normal',
+                type=WorkOrderGenerator._work_order_type(maint.maintenance_type),
+                frequency='periodic',
+                category='rcm_maintenance',
+                machine_id=machine.id,
+                subsystem_id=subsystem_id,
+                component_id=component_id,
+                generation_source='hour_counter',
+                rcm_maintenance_id=maint.id,
+                reason=HourThresholdEngine._reason(thresholds),
+                tool_requirements=''
+            ))
+
+        created = WorkOrderGenerator._insert_orders(rows)
+        if created:
+            logger.info(f"Machine {machine.id} went from {previous_hours:g} to {new_hours:g} hours, "
+                        f"created {len(created)} work orders")
+        return created
+
+    @staticmethod
+    def _reason(thresholds):
+        if len(thresholds) == 1:
+            return f"Machine has reached {thresholds[0]:g} operating hours"
+        listed = ', '.join(f"{t:g}" for t in thresholds)
+        return f"Machine has passed {listed} operating hours since the last reading"
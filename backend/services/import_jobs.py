@@ -0,0 +1,308 @@
+"""
+Background import jobs
+"""
+# Imports can take minutes on large workbooks and the server handles one request
+# at a time, so uploads only save the file and queue a job. A small thread pool
+# runs the importers; the job row records status and outcome, and the counters
+# of a running job are read from memory so polling never waits on the import's
+# write transaction.
+#
+# Uploads are hashed with SHA-256 as they are saved. A job for a file,
+# importer and params that were imported before reuses that job's result
+# instead of parsing the file again, as long as what it was imported into
+# hasn't changed since (the RCM revision of the machine, the table versions of
+# the technical structure). Re-importing then would add nothing in sync mode
+# and only duplicate the rows in append mode.
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import current_app
+from backend.database import db
+from backend.models.import_job import ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Errors kept per job, a broken sheet can fail on every row
+MAX_JOB_ERRORS = 100
+
+class ImportProgress:
+    """Counters an importer updates while it runs"""
+
+    def __init__(self):
+        self.rows_parsed = 0
+        self.objects_created = 0
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def update(self, rows_parsed=None, objects_created=None):
+        with self._lock:
+            if rows_parsed is not None:
+                self.rows_parsed = rows_parsed
+            if objects_created is not None:
+                self.objects_created = objects_created
+
+    def add_created(self, count=1):
+        with self._lock:
+            self.objects_created += count
+
+    def error(self, message):
+        with self._lock:
+            if len(self.errors) < MAX_JOB_ERRORS:
+                self.errors.append(message)
+
+    def as_dict(self):
+        with self._lock:
+            return {'rows_parsed': self.rows_parsed, 'objects_created': self.objects_created,
+                    'errors': list(self.errors)}
+
+def _import_rcm_excel(params, progress):
+    from backend.services.import_service import RCMImportService
+    return RCMImportService.import_from_excel(params['file_path'], params['equipment_id'],
+                                              sync=params.get('sync', False), progress=progress)
+
+def _import_rcm_json(params, progress):
+    from backend.services.import_service import RCMImportService
+    return RCMImportService.import_from_dict(params['units'], progress=progress)
+
+def _import_technical_structure(params, progress):
+    from backend.services.import_service import import_technical_structure_park, import_technical_structure_equipment
+    sync = params.get('sync', False)
+    if params['import_mode'] == 'park':
+        return import_technical_structure_park(params['file_path'], sync=sync, progress=progress)
+    return import_technical_structure_equipment(params['file_path'], params['equipment_id'], sync=sync,
+                                                progress=progress)
+
+def _import_rcm_excel_batch(params, progress):
+    from backend.services.import_service import RCMImportService
+    return RCMImportService.import_from_excel_files(params['file_paths'], params['equipment_id'],
+                                                    sync=params.get('sync', False), progress=progress,
+                                                    file_names=params.get('file_names'))
+
+def _import_technical_structure_batch(params, progress):
+    from backend.services.import_service import import_technical_structure_files
+    return import_technical_structure_files(params['file_paths'], params['import_mode'], params.get('equipment_id'),
+                                            sync=params.get('sync', False), progress=progress,
+                                            file_names=params.get('file_names'))
+
+# kind -> importer(params, progress), returning a dict with 'success' and 'message'
+IMPORTERS = {
+    'rcm_excel': _import_rcm_excel,
+    'rcm_excel_batch': _import_rcm_excel_batch,
+    'rcm_json': _import_rcm_json,
+    'technical_structure': _import_technical_structure,
+    'technical_structure_batch': _import_technical_structure_batch,
+}
+
+def _rcm_target_version(params):
+    from backend.services.rcm_analysis import get_rcm_revision
+    revision, every_snapshot = get_rcm_revision(params['equipment_id'])
+    return f"rcm:{params['equipment_id']}:{revision}.{every_snapshot}"
+
+def _structure_target_version(params):
+    from backend.models.table_version import get_table_versions
+    versions = get_table_versions(['machine', 'subsystem', 'component'])
+    return 'structure:' + '.'.join(str(versions[name]) for name in sorted(versions))
+
+# kind -> version(params) of the data the import writes to, kinds without one are never cached
+TARGET_VERSIONS = {
+    'rcm_excel': _rcm_target_version,
+    'rcm_excel_batch': _rcm_target_version,
+    'technical_structure': _structure_target_version,
+    'technical_structure_batch': _structure_target_version,
+}
+
+def import_cache_key(kind, content_hash, params):
+    """Key of an import in the result cache: the importer, the file and what it is imported into"""
+    params = {key: value for key, value in params.items() if key not in ('file_path', 'file_paths', 'file_names')}
+    payload = json.dumps([kind, content_hash, params], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def combined_hash(content_hashes):
+    """Content hash of a batch of files, independent of their order"""
+    return hashlib.sha256('|'.join(sorted(content_hashes)).encode()).hexdigest()
+
+def _job_files(job):
+    """Uploaded files a job reads"""
+    paths = [job.file_path] if job.file_path else []
+    return paths + json.loads(job.params or '{}').get('file_paths', [])
+
+def upload_folder():
+    """Folder of the uploaded import files, kept apart from the other uploads"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'imports')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+class ImportJobRunner:
+    """Queues import jobs on a thread pool and tracks the ones running in this process"""
+
+    def __init__(self):
+        self._executor = None
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                workers = current_app.config.get('IMPORT_WORKERS', 2)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import')
+            return self._executor
+
+    def submit(self, kind, params, created_by=None, file_path=None, original_filename=None, content_hash=None):
+        """
+        Record a job and queue it, returns the ImportJob
+
+        When the same file was imported with the same params before and nothing was
+        written to the target since, the job is completed right away with that result.
+        """
+        if kind not in IMPORTERS:
+            raise ValueError(f"Unknown import kind: {kind}")
+        cache_key = import_cache_key(kind, content_hash, params) if content_hash and kind in TARGET_VERSIONS else None
+        if file_path is not None:
+            params = {**params, 'file_path': file_path}
+
+        job = ImportJob(
+            id=str(uuid.uuid4()),
+            kind=kind,
+            status='queued',
+            params=json.dumps(params),
+            file_path=file_path,
+            content_hash=content_hash,
+            cache_key=cache_key,
+            original_filename=original_filename,
+            created_by=created_by
+        )
+
+        previous = self._cached_job(kind, cache_key, params)
+        if previous is not None:
+            result = {**json.loads(previous.result), 'cached': True}
+            job.status = 'completed'
+            job.message = "This file was already imported, nothing has changed since"
+            job.result = json.dumps(result, default=str)
+            job.target_version = previous.target_version
+            job.cached_from = previous.id
+            job.errors = json.dumps([])
+            job.started_at = job.finished_at = datetime.now(timezone.utc)
+            job.file_path = None
+            db.session.add(job)
+            db.session.commit()
+            for path in [file_path] + params.get('file_paths', []):
+                self._release_file(path)
+            logger.info(f"Import job {job.id} ({kind}) reused the result of job {previous.id}")
+            return job
+
+        db.session.add(job)
+        db.session.commit()
+
+        with self._lock:
+            self._running[job.id] = ImportProgress()
+        self._get_executor().submit(self._run, current_app._get_current_object(), job.id)
+        return job
+
+    def _cached_job(self, kind, cache_key, params):
+        """The last completed job with this cache key whose target hasn't changed since, if any"""
+        if cache_key is None:
+            return None
+        previous = ImportJob.query.filter(
+            ImportJob.cache_key == cache_key,
+            ImportJob.status == 'completed',
+            ImportJob.target_version.isnot(None)
+        ).order_by(ImportJob.finished_at.desc()).first()
+        if previous is None or previous.target_version != TARGET_VERSIONS[kind](params):
+            return None
+        return previous
+
+    def _release_file(self, file_path):
+        """Delete an uploaded file unless a job that hasn't run yet still needs it"""
+        if not file_path or not os.path.exists(file_path):
+            return
+        pending = ImportJob.query.filter(ImportJob.status.in_(['queued', 'running'])).all()
+        if any(file_path in _job_files(job) for job in pending):
+            return
+        try:
+            os.remove(file_path)
+        except OSError:
+            logger.warning(f"Could not delete uploaded file {file_path}")
+
+    def progress(self, job_id):
+        """Live counters of a job queued or running in this process, None otherwise"""
+        with self._lock:
+            progress = self._running.get(job_id)
+        return progress.as_dict() if progress is not None else None
+
+    def _run(self, app, job_id):
+        with app.app_context():
+            progress = self._running[job_id]
+            job = db.session.get(ImportJob, job_id)
+            job.status = 'running'
+            job.started_at = datetime.now(timezone.utc)
+            db.session.commit()
+
+            try:
+                params = json.loads(job.params)
+                result = IMPORTERS[job.kind](params, progress)
+                job.status = 'completed' if result.get('success', False) else 'failed'
+                job.message = (result.get('message') or '')[:500]
+                if job.status == 'failed':
+                    progress.error(job.message)
+                elif job.cache_key:
+                    job.target_version = TARGET_VERSIONS[job.kind](params)
+                job.result = json.dumps(result, default=str)
+            except Exception as e:
+                logger.error(f"Import job {job_id} failed: {str(e)}", exc_info=True)
+                db.session.rollback()
+                job = db.session.get(ImportJob, job_id)
+                job.status = 'failed'
+                job.message = f"Import failed: {str(e)}"[:500]
+                progress.error(str(e))
+
+            counts = progress.as_dict()
+            job.rows_parsed = counts['rows_parsed']
+            job.objects_created = counts['objects_created']
+            job.errors = json.dumps(counts['errors'])
+            job.finished_at = datetime.now(timezone.utc)
+            db.session.commit()
+            for path in _job_files(job):
+                self._release_file(path)
+
+            with self._lock:
+                self._running.pop(job_id, None)
+            logger.info(f"Import job {job_id} ({job.kind}) {job.status}: {counts['objects_created']} objects created")
+            db.session.remove()
+
+    def fail_interrupted(self):
+        """Mark jobs left queued or running by a previous process as failed"""
+        interrupted = ImportJob.query.filter(ImportJob.status.in_(['queued', 'running'])).all()
+        for job in interrupted:
+            job.status = 'failed'
+            job.message = "Import was interrupted by a server restart"
+            job.finished_at = datetime.now(timezone.utc)
+        if interrupted:
+            db.session.commit()
+        return len(interrupted)
+
+    def collect_upload_files(self):
+        """Delete uploaded import files no queued or running job refers to, returns how many"""
+        folder = upload_folder()
+        pending = {
+            os.path.abspath(path)
+            for job in ImportJob.query.filter(ImportJob.status.in_(['queued', 'running'])).all()
+            for path in _job_files(job)
+        }
+        removed = 0
+        for name in os.listdir(folder):
+            path = os.path.abspath(os.path.join(folder, name))
+            if path in pending or not os.path.isfile(path):
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                logger.warning(f"Could not delete uploaded file {path}")
+        return removed
+
+import_jobs = ImportJobRunner()
@@ -22,7 +22,19 @@ import os
 from datetime import datetime
 from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance
 from backend.models.machine import Machine, Subsystem, Component
+from backend.models.table_version import bump_table_versions
 from backend.database import db
+from backend.services.due_state import DueStateService
+from backend.services.import_jobs import ImportProgress
+from backend.services.query_counter import track_queries
+from backend.services.workbook_reader import WorkbookReader, map_sheets
+from backend.services.rcm_analysis import bump_rcm_revision, IN_CHUNK_SIZE
+from backend.models.maintenance_due_state import MaintenanceDueState
+from backend.models.work_order import WorkOrder
+from collections import defaultdict
+from sqlalchemy import select, func, bindparam
+import numpy as np
+import re
 import uuid
 import logging
 
@@ -30,365 +42,705 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# (table key, model, parent table key, column holding the parent id), parents first
+RCM_LEVELS = [
+    ('units', RCMUnit, None, None),
+    ('functions', RCMFunction, 'units', 'unit_id'),
+    ('failures', RCMFunctionalFailure, 'functions', 'function_id'),
+    ('modes', RCMFailureMode, 'failures', 'functional_failure_id'),
+    ('effects', RCMFailureEffect, 'modes', 'failure_mode_id'),
+    ('maintenance_actions', RCMMaintenance, 'modes', 'failure_mode_id'),
+]
+
+# Columns taken from the sheet that a re-import in sync mode updates on matched rows,
+# everything else may have been edited in the app since and is left alone
+RCM_SYNC_COLUMNS = {
+    'functions': ['technical_id'],
+    'maintenance_actions': ['description', 'maintenance_type', 'interval_days', 'interval_hours',
+                            'maintenance_strategy'],
+}
+
+# Words in the name of an RCM sheet, and in the header row of one
+RCM_SHEET_KEYWORDS = ['rcm', 'analyse']
+RCM_HEADER_KEYWORDS = ['funksjon', 'function']
+
+# Maintenance type by keywords in the strategy text, first match wins
+MAINTENANCE_TYPE_KEYWORDS = [
+    ('inspection', ['inspeksjon', 'inspection', 'visuell', 'visual']),
+    ('testing', ['test', 'funksjonstest', 'testing']),
+    ('lubrication', ['smøring', 'lubrication', 'olje']),
+    ('replacement', ['bytte', 'replace', 'skifte']),
+]
+
+def _clean_text(series):
+    """Stripped text of a column, <NA> for empty cells"""
+    text = series.astype('string').str.strip()
+    return text.mask(text == '')
+
+def _insert_rows(connection, model, rows):
+    """Insert rows in one statement with a block of IDs after the current maximum, returns the IDs"""
+    next_id = connection.execute(select(func.coalesce(func.max(model.id), 0))).scalar() + 1
+    values = [{**row, 'id': next_id + offset} for offset, row in enumerate(rows)]
+    connection.execute(model.__table__.insert(), values)
+    return [row['id'] for row in values]
+
+def _to_python(series):
+    """Column values as Python objects, None for missing"""
+    return series.astype(object).where(series.notna(), None).tolist()
+
 class RCMImportService:
     @staticmethod
     # In backend/services/import_service.py, update the import_from_excel method in RCMImportService:
-    def import_from_excel(file_path, equipment_id):
-        """Import RCM analysis from Excel file with headers on the second/third row"""
+    def import_from_excel(file_path, equipment_id, sync=False, progress=None):
+        """
+        Import RCM analysis from Excel file with headers on the second/third row
+        
+        With sync the machine's existing analysis is updated to match the sheet
+        instead of the sheet being added to it.
+        """
+        progress = progress or ImportProgress()
         try:
-            # Read Excel file - first list all sheets
-            excel_file = pd.ExcelFile(file_path)
-            sheet_names = excel_file.sheet_names
-            logger.info(f"Excel sheets found: {sheet_names}")
-            
-            # Try to find the RCM sheet
-            target_sheet = None
-            for sheet in sheet_names:
-                sheet_lower = sheet.lower()
-                if 'rcm' in sheet_lower or 'analyse' in sheet_lower:
-                    target_sheet = sheet
-                    break
-            
-            if not target_sheet and len(sheet_names) > 0:
-                target_sheet = sheet_names[0]
-                logger.info(f"No RCM sheet found, using first sheet: {target_sheet}")
-            
-            # Read the sheet without headers first to inspect structure
-            df_raw = pd.read_excel(file_path, sheet_name=target_sheet, header=None)
-            logger.info(f"Sheet has {len(df_raw)} rows and {len(df_raw.columns)} columns")
+            # Open the workbook once, rows are streamed from it in chunks
+            reader = WorkbookReader(file_path)
+            logger.info(f"Excel sheets found: {reader.sheet_names}")
             
-            # Log first few rows to see structure
-            for i in range(min(5, len(df_raw))):
-                logger.info(f"Row {i}: {df_raw.iloc[i].tolist()}")
+            # Try to find the RCM sheet, the first one if there is none
+            target_sheet = reader.find_sheet(RCM_SHEET_KEYWORDS)
             
-            # Find the header row by looking for key words
-            header_row = None
-            for i in range(min(10, len(df_raw))):
-                row_values = df_raw.iloc[i].astype(str).str.lower().tolist()
-                # Check if this row contains header keywords
-                if any('funksjon' in str(val) for val in row_values) or \
-                any('function' in str(val) for val in row_values):
-                    header_row = i
-                    logger.info(f"Found header row at index {header_row}")
-                    break
+            # Stage 1: parse and deduplicate the rows into in-memory tables, chunk by chunk
+            tables = RCMImportService._new_tables(equipment_id)
+            summary = RCMImportService._stage_sheet(reader, target_sheet, equipment_id, tables, progress)
+            if not summary['success']:
+                return {"success": False, "message": summary['message']}
             
-            if header_row is None:
-                logger.warning("Could not find header row, defaulting to row 1")
-                header_row = 1
+            result = RCMImportService._write_staged(tables, equipment_id, sync, progress)
+            result["sheet_name"] = target_sheet
+            return result
             
-            # Read the Excel file with the identified header row
-            df = pd.read_excel(file_path, sheet_name=target_sheet, header=header_row)
-            logger.info(f"Columns found: {df.columns.tolist()}")
-            
-            # Clean column names
-            df.columns = [str(col).strip() for col in df.columns]
-            
-            # Map columns (be flexible with column names)
-            column_map = {
-                'unit': None,
-                'function': None,
-                'failure': None,
-                'mode': None,
-                'effect': None,
-                'interval': None,
-                'strategy': None
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error importing RCM data: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "message": f"Import failed: {str(e)}"
             }
+        finally:
+            if 'reader' in locals():
+                reader.close()
+
+    @staticmethod
+    def import_from_excel_files(file_paths, equipment_id, sync=False, progress=None, file_names=None):
+        """
+        Import every RCM sheet of several workbooks into one machine's analysis
+        
+        The sheets are parsed in parallel, then merged and written together as if they
+        were one sheet. Sheets without the RCM columns are reported and left out.
+        
+        Args:
+            file_paths: Excel files
+            file_names: Names to report for the files, the file names by default
+        
+        Returns:
+            Result dict like import_from_excel, with a summary per sheet under 'sheets'
+        """
+        progress = progress or ImportProgress()
+        file_names = file_names or [os.path.basename(path) for path in file_paths]
+        try:
+            tasks = []
+            names = []
+            for file_path, file_name in zip(file_paths, file_names):
+                with WorkbookReader(file_path) as reader:
+                    for sheet_name in reader.find_sheets(RCM_SHEET_KEYWORDS):
+                        tasks.append((file_path, sheet_name, equipment_id))
+                        names.append(file_name)
             
-            # Try to identify columns
-            for col in df.columns:
-                col_lower = col.lower()
-                
-                # Check for exact matches first
-                if col_lower == 'enhet':
-                    column_map['unit'] = col
-                elif col_lower == 'funksjon':
-                    column_map['function'] = col
-                elif col_lower == 'funksjonsfeil':
-                    column_map['failure'] = col
-                elif col_lower == 'sviktmode':
-                    column_map['mode'] = col
-                elif col_lower == 'effekt':
-                    column_map['effect'] = col
-                elif col_lower == 'intervall':
-                    column_map['interval'] = col
-                elif col_lower == 'svikthåndteringsstrategi':
-                    column_map['strategy'] = col
-                else:
-                    # Fall back to partial matches if exact match not found
-                    if 'enhet' in col_lower or 'unit' in col_lower:
-                        column_map['unit'] = column_map['unit'] or col
-                    elif 'funksjon' in col_lower and 'feil' not in col_lower:
-                        column_map['function'] = column_map['function'] or col
-                    elif 'funksjonsfeil' in col_lower:
-                        column_map['failure'] = column_map['failure'] or col
-                    elif 'sviktmode' in col_lower and 'håndtering' not in col_lower:
-                        column_map['mode'] = column_map['mode'] or col
-                    elif 'effekt' in col_lower:
-                        column_map['effect'] = column_map['effect'] or col
-                    elif 'timer' in col_lower or 'mtf' in col_lower:
-                        column_map['interval'] = column_map['interval'] or col
-                    elif ('strategi' in col_lower or 'håndtering' in col_lower) and 'mode' not in col_lower:
-                        column_map['strategy'] = column_map['strategy'] or col
+            # Stage 1: parse the sheets side by side, then merge their tables
+            tables = RCMImportService._new_tables(equipment_id)
+            sheets = []
+            rows_parsed = 0
+            for file_name, (summary, sheet_tables) in zip(names, map_sheets(parse_rcm_sheet, tasks)):
+                sheets.append({'file': file_name, **summary})
+                if not summary['success']:
+                    continue
+                for level, rows in sheet_tables.items():
+                    for key, row in rows.items():
+                        tables[level].setdefault(key, row)
+                rows_parsed += summary['rows_parsed']
+                progress.update(rows_parsed=rows_parsed)
             
-            logger.info(f"Column mapping: {column_map}")
+            if not any(sheet['success'] for sheet in sheets):
+                return {"success": False, "message": "No sheet with RCM columns was found", "sheets": sheets}
             
-            # Verify we have the essential columns
-            if not column_map['function'] or not column_map['mode']:
-                logger.error("Missing essential columns (function or mode)")
-                return {
-                    "success": False,
-                    "message": "Could not identify required columns in Excel file"
-                }
+            result = RCMImportService._write_staged(tables, equipment_id, sync, progress)
+            result["sheets"] = sheets
+            return result
             
-            # Initialize counters
-            imported = {
-                'units': 0,
-                'functions': 0,
-                'failures': 0,
-                'modes': 0,
-                'effects': 0,
-                'maintenance_actions': 0
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error importing RCM data: {str(e)}", exc_info=True)
+            return {
+                "success": False,
+                "message": f"Import failed: {str(e)}"
             }
+
+    @staticmethod
+    def _map_columns(columns):
+        """Column of the sheet holding each RCM field, None when it has none"""
+        # Map columns (be flexible with column names)
+        column_map = {
+            'unit': None,
+            'function': None,
+            'failure': None,
+            'mode': None,
+            'effect': None,
+            'interval': None,
+            'strategy': None
+        }
+        
+        # Try to identify columns
+        for col in columns:
+            col_lower = col.lower()
             
-            # Track created objects
-            units_map = {}
-            functions_map = {}
-            failures_map = {}
-            
-            # Process each row
-            current_unit = None
-            default_unit = None
-            
-            # Create a default unit if none specified
-            default_unit = RCMUnit(
-                name="Equipment Unit",
-                description=f"Main unit for equipment {equipment_id}",
-                equipment_id=equipment_id,
-                technical_id=""
-            )
-            db.session.add(default_unit)
-            db.session.flush()
-            units_map["default"] = default_unit
-            imported['units'] += 1
-            
-            # Process data rows
-            # Process data rows
-            for idx, row in df.iterrows():
-                try:
-                    # Skip empty rows
-                    if pd.isna(row.get(column_map['function'], '')):
-                        continue
-                    
-                    # Get values from row
-                    unit_val = row.get(column_map['unit']) if column_map['unit'] else None
-                    function_val = row.get(column_map['function'])
-                    failure_val = row.get(column_map['failure']) if column_map['failure'] else None
-                    mode_val = row.get(column_map['mode']) if column_map['mode'] else None
-                    effect_val = row.get(column_map['effect']) if column_map['effect'] else None
-                    interval_val = row.get(column_map['interval']) if column_map['interval'] else None
-                    strategy_val = row.get(column_map['strategy']) if column_map['strategy'] else None
-                    
-                    # Log what we're processing
-                    logger.info(f"Row {idx}: function='{function_val}', unit='{unit_val}'")
-                    
-                    # Skip if no meaningful data
-                    if pd.isna(function_val) or str(function_val).strip() == '':
-                        continue
-                    
-                    # Handle unit
-                    if unit_val and not pd.isna(unit_val) and str(unit_val).strip() != '':
-                        unit_str = str(unit_val).strip()
-                        if unit_str not in units_map:
-                            unit = RCMUnit(
-                                name=unit_str,
-                                description=f"Unit: {unit_str}",
-                                equipment_id=equipment_id,
-                                technical_id=unit_str if '.' in unit_str else ""
-                            )
-                            db.session.add(unit)
-                            db.session.flush()
-                            units_map[unit_str] = unit
-                            imported['units'] += 1
-                            logger.info(f"Created unit: {unit_str} with ID {unit.id}")
-                        current_unit = units_map[unit_str]
-                    else:
-                        current_unit = default_unit
-                    
-                    # Handle function - FIXED: ensure we actually create it
-                    function_str = str(function_val).strip()
-                    function_key = f"{current_unit.id}_{function_str}"
+            # Check for exact matches first
+            if col_lower == 'enhet':
+                column_map['unit'] = col
+            elif col_lower == 'funksjon':
+                column_map['function'] = col
+            elif col_lower == 'funksjonsfeil':
+                column_map['failure'] = col
+            elif col_lower == 'sviktmode':
+                column_map['mode'] = col
+            elif col_lower == 'effekt':
+                column_map['effect'] = col
+            elif col_lower == 'intervall':
+                column_map['interval'] = col
+            elif col_lower == 'svikthåndteringsstrategi':
+                column_map['strategy'] = col
+            else:
+                # Fall back to partial matches if exact match not found
+                if 'enhet' in col_lower or 'unit' in col_lower:
+                    column_map['unit'] = column_map['unit'] or col
+                elif 'funksjon' in col_lower and 'feil' not in col_lower:
+                    column_map['function'] = column_map['function'] or col
+                elif 'funksjonsfeil' in col_lower:
+                    column_map['failure'] = column_map['failure'] or col
+                elif 'sviktmode' in col_lower and 'håndtering' not in col_lower:
+                    column_map['mode'] = column_map['mode'] or col
+                elif 'effekt' in col_lower:
+                    column_map['effect'] = column_map['effect'] or col
+                elif 'timer' in col_lower or 'mtf' in col_lower:
+                    column_map['interval'] = column_map['interval'] or col
+                elif ('strategi' in col_lower or 'håndtering' in col_lower) and 'mode' not in col_lower:
+                    column_map['strategy'] = column_map['strategy'] or col
+        
+        logger.info(f"Column mapping: {column_map}")
+        return column_map
+
+    @staticmethod
+    def _stage_sheet(reader, sheet_name, equipment_id, tables, progress=None):
+        """
+        Stage the rows of one sheet into tables, chunk by chunk
+        
+        Returns:
+            Summary dict with sheet_name, success, message, rows_parsed and rows_skipped
+        """
+        # Headers are on the second/third row, under a title
+        sheet = reader.open_sheet(sheet_name, header_keywords=RCM_HEADER_KEYWORDS, default_header_row=1)
+        column_map = RCMImportService._map_columns(sheet.columns)
+        summary = {'sheet_name': sheet_name, 'success': True, 'message': "", 'rows_parsed': 0, 'rows_skipped': 0}
+        
+        # Verify we have the essential columns
+        if not column_map['function'] or not column_map['mode']:
+            logger.error(f"Missing essential columns (function or mode) in sheet '{sheet_name}'")
+            summary.update(success=False, message="Could not identify required columns in Excel file")
+            return summary
+        
+        for chunk in sheet.chunks():
+            summary['rows_skipped'] += RCMImportService._stage_rows(chunk, column_map, equipment_id, tables)
+            summary['rows_parsed'] += len(chunk)
+            if progress is not None:
+                progress.update(rows_parsed=summary['rows_parsed'])
+        return summary
+
+    @staticmethod
+    def _write_staged(tables, equipment_id, sync, progress):
+        """Stage 2 of the Excel imports: write the staged tables and commit, returns the result dict"""
+        # Assign IDs and write each level with one bulk statement
+        with track_queries() as write_stats:
+            if sync:
+                changes = RCMImportService._sync_tables(tables, equipment_id)
+                imported = changes['inserted']
+            else:
+                changes = None
+                imported = RCMImportService._write_tables(tables, equipment_id)
+            db.session.commit()
+        progress.update(objects_created=sum(imported.values()))
+        
+        logger.info(f"Import completed: {changes or imported}, "
+                    f"written in {write_stats.queries} statements ({write_stats.duration_ms:.0f} ms)")
+        
+        result = {
+            "success": True,
+            "message": f"Successfully imported RCM data",
+            "imported": imported
+        }
+        if changes is not None:
+            result.update(updated=changes['updated'], deleted=changes['deleted'], unchanged=changes['unchanged'])
+        return result
+
+
+    @staticmethod
+    def import_from_dict(units, progress=None):
+        """Import nested RCM data as posted to /api/rcm/import"""
+        progress = progress or ImportProgress()
+        try:
+            # Process units and their nested data
+            for unit_data in units:
+                unit = RCMUnit(
+                    name=unit_data.get('name'),
+                    description=unit_data.get('description'),
+                    equipment_id=unit_data.get('equipment_id'),
+                    technical_id=unit_data.get('technical_id', '')
+                )
+                db.session.add(unit)
+                db.session.flush()  # Get ID without committing
+                progress.add_created()
+                
+                # Process functions for this unit
+                for function_data in unit_data.get('functions', []):
+                    function = RCMFunction(
+                        name=function_data.get('name'),
+                        description=function_data.get('description'),
+                        equipment_id=unit_data.get('equipment_id'),
+                        unit_id=unit.id,
+                        technical_id=function_data.get('technical_id', '')
+                    )
+                    db.session.add(function)
+                    db.session.flush()
+                    progress.add_created()
                     
-                    if function_key not in functions_map:
-                        # Create the function
-                        function = RCMFunction(
-                            name=function_str,
-                            description="",
-                            equipment_id=equipment_id,
-                            unit_id=current_unit.id,
-                            technical_id=current_unit.technical_id if hasattr(current_unit, 'technical_id') else ""
+                    # Process functional failures
+                    for failure_data in function_data.get('functional_failures', []):
+                        failure = RCMFunctionalFailure(
+                            name=failure_data.get('name'),
+                            description=failure_data.get('description'),
+                            function_id=function.id
                         )
-                        db.session.add(function)
-                        db.session.flush()  # Important: flush to get the ID
+                        db.session.add(failure)
+                        db.session.flush()
+                        progress.add_created()
                         
-                        functions_map[function_key] = function
-                        imported['functions'] += 1
-                        logger.info(f"Created function: '{function_str}' with ID {function.id} for unit {current_unit.id}")
-                    else:
-                        logger.info(f"Function already exists: '{function_str}'")
-                    
-                    current_function = functions_map[function_key]
-                    
-                    # Handle functional failure
-                    if failure_val and not pd.isna(failure_val):
-                        failure_str = str(failure_val).strip()
-                        failure_key = f"{current_function.id}_{failure_str}"
-                        
-                        if failure_key not in failures_map:
-                            failure = RCMFunctionalFailure(
-                                name=failure_str,
-                                description="",
-                                function_id=current_function.id
-                            )
-                            db.session.add(failure)
-                            db.session.flush()
-                            failures_map[failure_key] = failure
-                            imported['failures'] += 1
-                        
-                        current_failure = failures_map[failure_key]
-                        
-                        # Handle failure mode
-                        if mode_val and not pd.isna(mode_val):
-                            mode_str = str(mode_val).strip()
-                            
+                        # Process failure modes
+                        for mode_data in failure_data.get('failure_modes', []):
                             mode = RCMFailureMode(
-                                name=mode_str,
-                                description="",
-                                failure_type="",
-                                detection_method="",
-                                functional_failure_id=current_failure.id
+                                name=mode_data.get('name'),
+                                description=mode_data.get('description'),
+                                failure_type=mode_data.get('failure_type'),
+                                detection_method=mode_data.get('detection_method'),
+                                functional_failure_id=failure.id
                             )
                             db.session.add(mode)
                             db.session.flush()
-                            imported['modes'] += 1
+                            progress.add_created()
                             
-                            # Handle effect
-                            if effect_val and not pd.isna(effect_val):
+                            # Process effects
+                            for effect_data in mode_data.get('effects', []):
                                 effect = RCMFailureEffect(
-                                    description=str(effect_val).strip(),
-                                    severity="Medium",
+                                    description=effect_data.get('description'),
+                                    severity=effect_data.get('severity'),
                                     failure_mode_id=mode.id,
-                                    safety_impact="",
-                                    environmental_impact="",
-                                    operational_impact="",
-                                    economic_impact=""
+                                    safety_impact=effect_data.get('safety_impact'),
+                                    environmental_impact=effect_data.get('environmental_impact'),
+                                    operational_impact=effect_data.get('operational_impact'),
+                                    economic_impact=effect_data.get('economic_impact')
                                 )
                                 db.session.add(effect)
-                                imported['effects'] += 1
-                            # Handle maintenance action - FIXED SECTION
-                            # Check both strategy and interval columns
-                            has_maintenance = False
-                            maintenance_title = ""
-                            maintenance_desc = ""
-                            interval_hours = None
-                            interval_days = None
-                            
-                            # Get strategy/maintenance description
-                            if strategy_val and not pd.isna(strategy_val) and str(strategy_val).strip():
-                                has_maintenance = True
-                                maintenance_desc = str(strategy_val).strip()
-                                maintenance_title = maintenance_desc
-                                logger.info(f"Found strategy: {maintenance_desc}")
-                            
-                            # Get interval value
-                            if interval_val and not pd.isna(interval_val):
-                                try:
-                                    # Handle different interval formats
-                                    interval_str = str(interval_val).strip()
-                                    
-                                    # Remove any text, keep only numbers
-                                    import re
-                                    numbers = re.findall(r'\d+[\.,]?\d*', interval_str)
-                                    if numbers:
-                                        interval_value = float(numbers[0].replace(',', '.'))
-                                        
-                                        # Assume the interval is in hours if column mentions "timer" or "hours"
-                                        # You can adjust this logic based on your Excel structure
-                                        if column_map['interval'] and ('timer' in column_map['interval'].lower() or 
-                                                                    'hour' in column_map['interval'].lower() or
-                                                                    'mtf' in column_map['interval'].lower()):
-                                            interval_hours = interval_value
-                                            logger.info(f"Set interval_hours to {interval_hours}")
-                                        else:
-                                            # Otherwise assume days
-                                            interval_days = int(interval_value)
-                                            logger.info(f"Set interval_days to {interval_days}")
-                                            
-                                        has_maintenance = True
-                                except Exception as e:
-                                    logger.warning(f"Could not parse interval '{interval_val}': {e}")
+                                progress.add_created()
                             
-                            # Create maintenance action if we have any maintenance info
-                            if has_maintenance:
-                                # If we don't have a title from strategy, create one
-                                if not maintenance_title:
-                                    maintenance_title = f"Maintenance for {mode_str[:50]}"
-                                
-                                # Determine maintenance type based on strategy keywords
-                                maintenance_type = 'preventive'  # default
-                                if maintenance_desc:
-                                    desc_lower = maintenance_desc.lower()
-                                    if any(word in desc_lower for word in ['inspeksjon', 'inspection', 'visuell', 'visual']):
-                                        maintenance_type = 'inspection'
-                                    elif any(word in desc_lower for word in ['test', 'funksjonstest', 'testing']):
-                                        maintenance_type = 'testing'
-                                    elif any(word in desc_lower for word in ['smøring', 'lubrication', 'olje']):
-                                        maintenance_type = 'lubrication'
-                                    elif any(word in desc_lower for word in ['bytte', 'replace', 'skifte']):
-                                        maintenance_type = 'replacement'
-                                
-                                maintenance = RCMMaintenance(
-                                    title=maintenance_title[:255],  # Ensure title isn't too long
-                                    description=maintenance_desc or "Maintenance action from RCM analysis",
-                                    maintenance_type=maintenance_type,
-                                    interval_hours=interval_hours,
-                                    interval_days=interval_days,
+                            # Process maintenance actions
+                            for action_data in mode_data.get('maintenance_actions', []):
+                                action = RCMMaintenance(
+                                    title=action_data.get('title'),
+                                    description=action_data.get('description'),
+                                    maintenance_type=action_data.get('maintenance_type'),
+                                    interval_days=action_data.get('interval_days'),
+                                    interval_hours=action_data.get('interval_hours'),
                                     failure_mode_id=mode.id,
-                                    maintenance_strategy=maintenance_desc or ""
+                                    maintenance_strategy=action_data.get('maintenance_strategy')
                                 )
-                                db.session.add(maintenance)
-                                db.session.flush()
-                                imported['maintenance_actions'] += 1
-                                logger.info(f"Created maintenance action: {maintenance_title} with interval_hours={interval_hours}, interval_days={interval_days}")
-                            else:
-                                logger.info(f"No maintenance action created for mode: {mode_str} (no strategy or interval found)")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing row {idx}: {str(e)}")
-                    continue
+                                db.session.add(action)
+                                progress.add_created()
+                
+                progress.update(rows_parsed=progress.rows_parsed + 1)
             
-            # Commit all changes
             db.session.commit()
+            return {"success": True, "message": "RCM data imported successfully"}
+        
+        except Exception as e:
+            db.session.rollback()
+            return {"success": False, "message": f"Import failed: {str(e)}"}
+
+    @staticmethod
+    def _clean_rows(df, column_map):
+        """
+        Cleaned values of the mapped columns, computed once per column for the whole sheet
+        
+        Returns:
+            DataFrame with one column per field, None for empty cells, plus the parsed
+            interval_hours / interval_days and the maintenance_type of the strategy
+        """
+        clean = pd.DataFrame(index=df.index)
+        for key in ('unit', 'function', 'failure', 'mode', 'effect', 'interval', 'strategy'):
+            column = column_map[key]
+            clean[key] = _clean_text(df[column]) if column else pd.Series(pd.NA, index=df.index, dtype='string')
+        
+        # First number in the interval cell, decimal comma allowed
+        interval = pd.to_numeric(
+            clean['interval'].str.extract(r'(\d+[\.,]?\d*)', expand=False).str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+        # Assume the interval is in hours if column mentions "timer" or "hours", otherwise days
+        interval_column = (column_map['interval'] or '').lower()
+        if 'timer' in interval_column or 'hour' in interval_column or 'mtf' in interval_column:
+            clean['interval_hours'] = interval
+            clean['interval_days'] = pd.Series(pd.NA, index=df.index, dtype='Int64')
+        else:
+            clean['interval_hours'] = pd.Series(float('nan'), index=df.index)
+            clean['interval_days'] = np.trunc(interval).astype('Int64')
+        
+        # Maintenance type from keywords in the strategy, first match wins
+        strategy = clean['strategy'].str.lower()
+        clean['maintenance_type'] = np.select(
+            [strategy.str.contains('|'.join(map(re.escape, words)), regex=True, na=False).to_numpy()
+             for _, words in MAINTENANCE_TYPE_KEYWORDS],
+            [maintenance_type for maintenance_type, _ in MAINTENANCE_TYPE_KEYWORDS],
+            default='preventive'
+        )
+        
+        return clean
+
+    @staticmethod
+    def _new_tables(equipment_id):
+        """
+        Empty in-memory tables, one per RCM level, filled by _stage_rows
+        
+        Every table maps a natural key to the row to insert; a row refers to its parent
+        by the parent's key under '_parent', the IDs are only known when the tables are written.
+        """
+        tables = {level: {} for level, _, _, _ in RCM_LEVELS}
+        
+        # Create a default unit if none specified
+        tables['units'][None] = {
+            'name': "Equipment Unit",
+            'description': f"Main unit for equipment {equipment_id}",
+            'equipment_id': equipment_id,
+            'technical_id': ""
+        }
+        return tables
+
+    @staticmethod
+    def _stage_rows(df, column_map, equipment_id, tables):
+        """
+        Add sheet rows to the tables, deduplicated on the natural keys
+        
+        Returns:
+            Number of rows skipped
+        """
+        
+        clean = RCMImportService._clean_rows(df, column_map)
+        # Skip rows without a function
+        has_function = clean['function'].notna()
+        rows_skipped = int((~has_function).sum())
+        clean = clean[has_function]
+        
+        fields = ['unit', 'function', 'failure', 'mode', 'effect', 'strategy',
+                  'interval_hours', 'interval_days', 'maintenance_type']
+        columns = [_to_python(clean[field]) for field in fields]
+        
+        for (unit_key, function_str, failure_str, mode_str, effect_str, strategy,
+             interval_hours, interval_days, maintenance_type) in zip(*columns):
+            # Handle unit
+            if unit_key is not None and unit_key not in tables['units']:
+                tables['units'][unit_key] = {
+                    'name': unit_key,
+                    'description': f"Unit: {unit_key}",
+                    'equipment_id': equipment_id,
+                    'technical_id': unit_key if '.' in unit_key else ""
+                }
             
-            logger.info(f"Import completed: {imported}")
+            # Handle function
+            function_key = (unit_key, function_str)
+            if function_key not in tables['functions']:
+                tables['functions'][function_key] = {
+                    '_parent': unit_key,
+                    'name': function_str,
+                    'description': "",
+                    'equipment_id': equipment_id,
+                    'technical_id': tables['units'][unit_key]['technical_id']
+                }
             
-            return {
-                "success": True,
-                "message": f"Successfully imported RCM data",
-                "imported": imported,
-                "sheet_name": target_sheet
-            }
+            # Handle functional failure
+            if failure_str is None:
+                continue
+            failure_key = (function_key, failure_str)
+            if failure_key not in tables['failures']:
+                tables['failures'][failure_key] = {
+                    '_parent': function_key,
+                    'name': failure_str,
+                    'description': ""
+                }
             
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"Error importing RCM data: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "message": f"Import failed: {str(e)}"
+            # Handle failure mode
+            if mode_str is None:
+                continue
+            mode_key = (failure_key, mode_str)
+            if mode_key not in tables['modes']:
+                tables['modes'][mode_key] = {
+                    '_parent': failure_key,
+                    'name': mode_str,
+                    'description': "",
+                    'failure_type': "",
+                    'detection_method': ""
+                }
+            
+            # Handle effect
+            if effect_str is not None:
+                tables['effects'].setdefault((mode_key, effect_str), {
+                    '_parent': mode_key,
+                    'description': effect_str,
+                    'severity': "Medium",
+                    'safety_impact': "",
+                    'environmental_impact': "",
+                    'operational_impact': "",
+                    'economic_impact': ""
+                })
+            
+            # Handle maintenance action, from the strategy and/or the interval
+            if strategy is None and interval_hours is None and interval_days is None:
+                continue
+            
+            # If we don't have a title from strategy, create one
+            maintenance_title = (strategy or f"Maintenance for {mode_str[:50]}")[:255]
+            tables['maintenance_actions'].setdefault((mode_key, maintenance_title, interval_hours, interval_days), {
+                '_parent': mode_key,
+                'title': maintenance_title,
+                'description': strategy or "Maintenance action from RCM analysis",
+                'maintenance_type': maintenance_type,
+                'interval_hours': interval_hours,
+                'interval_days': interval_days,
+                'maintenance_strategy': strategy or ""
+            })
+        
+        return rows_skipped
+
+    @staticmethod
+    def _write_tables(tables, equipment_id):
+        """
+        Insert the staged tables in the session's transaction, one statement per level
+        
+        Returns:
+            Number of rows inserted per level
+        """
+        connection = db.session.connection()
+        
+        # Written first so the transaction holds the write lock before IDs are handed out
+        bump_rcm_revision(connection, [equipment_id])
+        
+        ids = {}
+        imported = {}
+        for level, model, parent_level, parent_column in RCM_LEVELS:
+            rows = tables[level]
+            imported[level] = len(rows)
+            if not rows:
+                continue
+            
+            values = []
+            for row in rows.values():
+                row = dict(row)
+                parent_key = row.pop('_parent', None)
+                if parent_column:
+                    row[parent_column] = ids[parent_level][parent_key]
+                values.append(row)
+            ids[level] = dict(zip(rows, _insert_rows(connection, model, values)))
+        
+        # The ORM hooks don't see Core inserts, keep what they maintain in step
+        bump_table_versions(connection, [model.__tablename__ for _, model, _, _ in RCM_LEVELS])
+        if ids.get('maintenance_actions'):
+            DueStateService.refresh(connection, maintenance_ids=list(ids['maintenance_actions'].values()))
+        
+        return imported
+
+    @staticmethod
+    def _natural_keys(level, rows):
+        """
+        Natural keys of rows given as (row, parent natural key) in insertion order
+        
+        A row is keyed by its parent's key and its name (title for actions, text for
+        effects), units by technical ID or name. Rows sharing that key are told apart
+        by their order, so duplicates left by earlier imports line up with the sheet.
+        """
+        seen = defaultdict(int)
+        keys = []
+        for row, parent_key in rows:
+            if level == 'units':
+                base = row['technical_id'] or row['name']
+            elif level == 'effects':
+                base = (parent_key, row['description'])
+            elif level == 'maintenance_actions':
+                base = (parent_key, row['title'])
+            else:
+                base = (parent_key, row['name'])
+            keys.append((base, seen[base]))
+            seen[base] += 1
+        return keys
+
+    @staticmethod
+    def _load_existing(connection, equipment_id):
+        """
+        The current analysis of a machine, level by level
+        
+        Returns:
+            {level: {natural key: row}}, rows as mappings with their id
+        """
+        existing = {}
+        keys_by_id = {}
+        for level, model, parent_level, parent_column in RCM_LEVELS:
+            table = model.__table__
+            if parent_column is None:
+                rows = connection.execute(
+                    select(table).where(table.c.equipment_id == equipment_id).order_by(table.c.id)
+                ).mappings().all()
+            else:
+                parent_ids = list(keys_by_id[parent_level])
+                rows = []
+                for start in range(0, len(parent_ids), IN_CHUNK_SIZE):
+                    chunk = parent_ids[start:start + IN_CHUNK_SIZE]
+                    rows.extend(connection.execute(
+                        select(table).where(table.c[parent_column].in_(chunk))
+                    ).mappings().all())
+                rows.sort(key=lambda row: row['id'])
+            
+            parent_keys = keys_by_id.get(parent_level, {})
+            keys = RCMImportService._natural_keys(
+                level, [(row, parent_keys.get(row[parent_column]) if parent_column else None) for row in rows]
+            )
+            existing[level] = dict(zip(keys, rows))
+            keys_by_id[level] = {row['id']: key for key, row in zip(keys, rows)}
+        return existing
+
+    @staticmethod
+    def _sync_tables(tables, equipment_id):
+        """
+        Bring a machine's analysis in line with the staged tables in the session's transaction
+        
+        Rows are matched on their natural keys; only new rows are inserted, matched rows whose
+        sheet values changed are updated, and rows no longer in the sheet are deleted.
+        
+        Returns:
+            {'inserted', 'updated', 'deleted', 'unchanged'}, each the number of rows per level
+        """
+        connection = db.session.connection()
+        
+        # Written first so the transaction holds the write lock before IDs are handed out
+        bump_rcm_revision(connection, [equipment_id])
+        existing = RCMImportService._load_existing(connection, equipment_id)
+        
+        # Match the staged rows, staged key -> natural key / id of the matched row
+        staged_keys = {}
+        matched = {}
+        for level, _, parent_level, _ in RCM_LEVELS:
+            rows = tables[level]
+            parent_keys = staged_keys.get(parent_level, {})
+            keys = RCMImportService._natural_keys(
+                level, [(row, parent_keys.get(row.get('_parent'))) for row in rows.values()]
+            )
+            staged_keys[level] = dict(zip(rows, keys))
+            matched[level] = {
+                staged_key: existing[level][key]['id']
+                for staged_key, key in staged_keys[level].items() if key in existing[level]
             }
-        finally:
-            if 'excel_file' in locals():
-                excel_file.close()
+        
+        changes = {change: {level: 0 for level, _, _, _ in RCM_LEVELS}
+                   for change in ('inserted', 'updated', 'deleted', 'unchanged')}
+        changed_tables = set()
+        
+        # Deletes, children first
+        for level, model, _, _ in reversed(RCM_LEVELS):
+            kept = set(staged_keys[level].values())
+            stale_ids = [row['id'] for key, row in existing[level].items() if key not in kept]
+            changes['deleted'][level] = len(stale_ids)
+            if not stale_ids:
+                continue
+            if model is RCMMaintenance:
+                RCMImportService._unlink_actions(connection, stale_ids)
+                changed_tables.update(['maintenance_due_state', 'work_order'])
+            table = model.__table__
+            for start in range(0, len(stale_ids), IN_CHUNK_SIZE):
+                connection.execute(table.delete().where(table.c.id.in_(stale_ids[start:start + IN_CHUNK_SIZE])))
+            changed_tables.add(model.__tablename__)
+        
+        # Updates of the values a sheet sets, then inserts, parents first
+        ids = {}
+        refresh_ids = []
+        for level, model, parent_level, parent_column in RCM_LEVELS:
+            rows = tables[level]
+            columns = RCM_SYNC_COLUMNS.get(level, [])
+            updates = []
+            inserts = []
+            insert_keys = []
+            for staged_key, row in rows.items():
+                row_id = matched[level].get(staged_key)
+                if row_id is not None:
+                    current = existing[level][staged_keys[level][staged_key]]
+                    if any(current[column] != row[column] for column in columns):
+                        updates.append({'row_id': row_id, **{column: row[column] for column in columns}})
+                    continue
+                row = dict(row)
+                parent_key = row.pop('_parent', None)
+                if parent_column:
+                    row[parent_column] = ids[parent_level][parent_key]
+                inserts.append(row)
+                insert_keys.append(staged_key)
+            
+            table = model.__table__
+            if updates:
+                connection.execute(
+                    table.update().where(table.c.id == bindparam('row_id')).values(
+                        {column: bindparam(column) for column in columns}
+                    ),
+                    updates
+                )
+            ids[level] = dict(matched[level])
+            if inserts:
+                ids[level].update(zip(insert_keys, _insert_rows(connection, model, inserts)))
+            if updates or inserts:
+                changed_tables.add(model.__tablename__)
+            if model is RCMMaintenance:
+                refresh_ids = [row['row_id'] for row in updates] + [ids[level][key] for key in insert_keys]
+            
+            changes['inserted'][level] = len(inserts)
+            changes['updated'][level] = len(updates)
+            changes['unchanged'][level] = len(matched[level]) - len(updates)
+        
+        # The ORM hooks don't see Core writes, keep what they maintain in step
+        if changed_tables:
+            bump_table_versions(connection, sorted(changed_tables))
+        if refresh_ids:
+            DueStateService.refresh(connection, maintenance_ids=refresh_ids)
+        
+        return changes
 
+    @staticmethod
+    def _unlink_actions(connection, maintenance_ids):
+        """Drop the due state of actions about to be deleted and detach their work orders"""
+        due_state = MaintenanceDueState.__table__
+        work_order = WorkOrder.__table__
+        for start in range(0, len(maintenance_ids), IN_CHUNK_SIZE):
+            chunk = maintenance_ids[start:start + IN_CHUNK_SIZE]
+            connection.execute(due_state.delete().where(due_state.c.rcm_maintenance_id.in_(chunk)))
+            connection.execute(
+                work_order.update().where(work_order.c.rcm_maintenance_id.in_(chunk)).values(rcm_maintenance_id=None)
+            )
 
     def extract_component_from_failure_mode(failure_mode_text):
         """Extract component name from failure mode text"""
@@ -413,6 +765,13 @@ class RCMImportService:
         
         return None
 
+def parse_rcm_sheet(file_path, sheet_name, equipment_id):
+    """Stage one RCM sheet of a workbook, run in a worker process by the batch import"""
+    tables = RCMImportService._new_tables(equipment_id)
+    with WorkbookReader(file_path) as reader:
+        summary = RCMImportService._stage_sheet(reader, sheet_name, equipment_id, tables)
+    return summary, tables
+
 def import_hierarchy_from_excel(file_path):
     """Import machine hierarchy from Excel file"""
     import pandas as pd
@@ -475,198 +834,281 @@ def import_hierarchy_from_excel(file_path):
 
 # NEW CODE: Technical structure import functions
 
-def import_technical_structure_park(file_path):
+def _clean_structure_rows(df, prefix=None):
     """
-    Import the entire machine park structure from Excel file.
-    Creates all machines, subsystems, and components based on work station numbers.
+    Clean a technical structure sheet in one pass over each column
+    
+    Args:
+        df: Sheet with at least Arbeidsstasjonsnummer and Benevnelse
+        prefix: Only keep work station numbers starting with this
+    
+    Returns:
+        List of (station_number, name, description, technical_name, level,
+        machine_number, subsystem_number) tuples
     """
-    excel_file = None
-    try:
-        # Read Excel file - first list all sheets
-        excel_file = pd.ExcelFile(file_path)
-        sheet_names = excel_file.sheet_names
-        print("Excel sheets found:", sheet_names)
-        
-        # Try to find the "Teknisk plassstruktur" sheet
-        target_sheet = "Teknisk plasstruktur"
-        
-        # Check if the target sheet exists
-        if target_sheet in sheet_names:
-            print(f"Found target sheet: {target_sheet}")
-            df = pd.read_excel(file_path, sheet_name=target_sheet)
-        else:
-            # If the exact sheet name isn't found, look for something similar
-            for sheet in sheet_names:
-                if "teknisk" in sheet.lower() or "plassstruktur" in sheet.lower() or "struktur" in sheet.lower():
-                    print(f"Found similar sheet: {sheet}")
-                    df = pd.read_excel(file_path, sheet_name=sheet)
-                    break
-            else:
-                # If no matching sheet is found, use the first sheet but warn about it
-                print(f"Target sheet '{target_sheet}' not found. Using first sheet: {sheet_names[0]}")
-                df = pd.read_excel(file_path, sheet_name=0)
-        
-        # Print columns for debugging
-        print("Excel columns found:", df.columns.tolist())
-        
-        # Map possible column names
-        column_mapping = {
-            'Arbeidsstasjon': 'Arbeidsstasjonsnummer',
-            'Benevnelse': 'Benevnelse',  # Already matches
-            'Teknisk navn': 'Teknisk navn',  # Already matches
-            'Beskrivelse': 'Beskrivelse'  # Already matches
+    # The header is "Teknisk navn" in some exports and "Teknisk navn " in others
+    technical_name_column = next((col for col in df.columns if str(col).strip() == 'Teknisk navn'), None)
+    
+    def text(column):
+        if column is None or column not in df.columns:
+            return pd.Series('', index=df.index, dtype='string')
+        return _clean_text(df[column]).fillna('')
+    
+    clean = pd.DataFrame({
+        'station_number': _clean_text(df['Arbeidsstasjonsnummer']),
+        'name': text('Benevnelse'),
+        'description': text('Beskrivelse'),
+        'technical_name': text(technical_name_column)
+    })
+    
+    # Skip empty rows
+    clean = clean[clean['station_number'].notna()]
+    if prefix is not None:
+        clean = clean[clean['station_number'].str.startswith(prefix)]
+    
+    # 1077 is a machine, 1077.01 a subsystem and 1077.01.001 a component
+    clean['level'] = clean['station_number'].str.count(r'\.') + 1
+    parts = clean['station_number'].str.extract(r'^([^.]*)(?:\.([^.]*))?')
+    clean['machine_number'] = parts[0]
+    clean['subsystem_number'] = parts[0] + '.' + parts[1]
+    
+    columns = ['station_number', 'name', 'description', 'technical_name', 'level',
+               'machine_number', 'subsystem_number']
+    return list(zip(*(_to_python(clean[column]) for column in columns)))
+
+
+# Header names used by older exports of the technical structure
+STRUCTURE_COLUMN_MAPPING = {
+    'Arbeidsstasjon': 'Arbeidsstasjonsnummer'
+}
+STRUCTURE_REQUIRED_COLUMNS = ['Arbeidsstasjonsnummer', 'Benevnelse']
+
+STRUCTURE_SHEET_KEYWORDS = ['teknisk', 'plassstruktur', 'struktur']
+
+def _read_structure_sheet(reader, sheet_name, prefix=None):
+    """
+    Read and clean one technical structure sheet chunk by chunk
+    
+    Returns:
+        (rows, missing_columns) where rows are the tuples of _clean_structure_rows
+    """
+    sheet = reader.open_sheet(sheet_name, header_keywords=['arbeidsstasjon'])
+    
+    # Rename columns to standardized names if needed
+    renames = {
+        old_name: new_name for old_name, new_name in STRUCTURE_COLUMN_MAPPING.items()
+        if old_name in sheet.columns and new_name not in sheet.columns
+    }
+    columns = [renames.get(col, col) for col in sheet.columns]
+    print("Excel columns after mapping:", columns)
+    
+    missing_columns = [col for col in STRUCTURE_REQUIRED_COLUMNS if col not in columns]
+    if missing_columns:
+        return [], missing_columns
+    
+    rows = []
+    for chunk in sheet.chunks():
+        rows.extend(_clean_structure_rows(chunk.rename(columns=renames), prefix=prefix))
+    return rows, []
+
+def _sort_structure_rows(rows):
+    """Order rows by level so parents come first"""
+    rows.sort(key=lambda row: (row[4], row[0]))
+    return rows
+
+def _read_structure_rows(file_path, target_sheet, prefix=None):
+    """
+    Read and clean the technical structure sheet of a workbook chunk by chunk
+    
+    Args:
+        file_path: Excel file
+        target_sheet: Sheet name to use when it exists
+        prefix: Only keep work station numbers starting with this
+    
+    Returns:
+        (rows, missing_columns) where rows are the tuples of _clean_structure_rows
+        sorted by level so parents come first
+    """
+    with WorkbookReader(file_path) as reader:
+        print("Excel sheets found:", reader.sheet_names)
+        sheet_name = reader.find_sheet(STRUCTURE_SHEET_KEYWORDS, preferred=[target_sheet])
+        print(f"Using sheet: {sheet_name}")
+        rows, missing_columns = _read_structure_sheet(reader, sheet_name, prefix)
+    return _sort_structure_rows(rows), missing_columns
+
+def parse_structure_sheet(file_path, sheet_name, prefix=None):
+    """Read one technical structure sheet of a workbook, run in a worker process by the batch import"""
+    with WorkbookReader(file_path) as reader:
+        rows, missing_columns = _read_structure_sheet(reader, sheet_name, prefix)
+    summary = {
+        'sheet_name': sheet_name,
+        'success': not missing_columns,
+        'message': f"Missing required columns after mapping: {', '.join(missing_columns)}" if missing_columns else "",
+        'rows_parsed': len(rows)
+    }
+    return summary, rows
+
+# level -> (model, columns a structure import sets and updates in sync mode)
+STRUCTURE_LEVELS = {
+    1: (Machine, ['name', 'description']),
+    2: (Subsystem, ['name', 'description']),
+    3: (Component, ['name', 'description', 'function']),
+}
+
+def _load_structure(connection):
+    """Every existing machine, subsystem and component by technical ID, one query per level"""
+    existing = {}
+    for level, (model, columns) in STRUCTURE_LEVELS.items():
+        table = model.__table__
+        selected = [table.c.id, table.c.technical_id] + [table.c[column] for column in columns]
+        if model is not Machine:
+            selected.append(table.c.machine_id)
+        existing[level] = {
+            row.technical_id: row
+            for row in connection.execute(select(*selected).where(table.c.technical_id.isnot(None))).all()
         }
+    return existing
+
+def _write_structure(rows, stats, progress, sync=False, equipment=None):
+    """
+    Write cleaned technical structure rows with one bulk insert per level
+    
+    Existing items are loaded once, parents are resolved in memory from the items in
+    the file and those already in the database.
+    
+    Args:
+        rows: Tuples of _read_structure_rows, parents first
+        stats: Counters to update
+        sync: Update the names and descriptions of items that already exist
+        equipment: Import the subsystems and components of this machine, the whole park when None
+    """
+    connection = db.session.connection()
+    
+    # Written first so the transaction holds the write lock before IDs are handed out,
+    # the ORM hooks that keep the versions don't see Core writes
+    bump_table_versions(connection, [model.__tablename__ for model, _ in STRUCTURE_LEVELS.values()])
+    existing = _load_structure(connection)
+    
+    # technical ID -> id per level, and the machine of each subsystem
+    ids = {level: {technical_id: row.id for technical_id, row in items.items()}
+           for level, items in existing.items()}
+    subsystem_machines = {technical_id: row.machine_id for technical_id, row in existing[2].items()}
+    
+    rows_by_level = defaultdict(list)
+    for row in rows:
+        rows_by_level[row[4]].append(row)
+    
+    for level, (model, columns) in STRUCTURE_LEVELS.items():
+        if equipment is not None and level == 1:
+            continue
         
-        # Rename columns to standardized names if needed
-        for old_name, new_name in column_mapping.items():
-            if old_name in df.columns and new_name not in df.columns:
-                df = df.rename(columns={old_name: new_name})
-        
-        # Print columns after mapping for debugging
-        print("Excel columns after mapping:", df.columns.tolist())
+        inserts = []
+        insert_ids = []
+        updates = []
+        seen = set()
+        for station_number, name, description, technical_name, _, machine_number, subsystem_number in rows_by_level[level]:
+            if equipment is not None and station_number == equipment.technical_id:
+                continue
+            
+            # Find the parent, an item of the file or one that already exists
+            if level == 1:
+                values = {'name': name, 'description': description, 'location': '', 'qr_code': str(uuid.uuid4())}
+            elif level == 2:
+                machine_id = equipment.id if equipment is not None else ids[1].get(machine_number)
+                if machine_id is None:
+                    stats['items_skipped'] += 1
+                    continue
+                values = {'name': name, 'description': description, 'machine_id': machine_id}
+            else:
+                subsystem_id = ids[2].get(subsystem_number)
+                if subsystem_id is None:
+                    stats['items_skipped'] += 1
+                    continue
+                values = {
+                    'name': name,
+                    'location': '',
+                    'function': technical_name,  # Use technical name as function
+                    'subsystem_id': subsystem_id,
+                    'machine_id': equipment.id if equipment is not None else subsystem_machines[subsystem_number]
+                }
+                if equipment is not None:
+                    values['description'] = description
+            
+            # Items already in the database are updated in sync mode, skipped otherwise
+            if station_number in seen:
+                stats['items_skipped'] += 1
+                continue
+            seen.add(station_number)
+            current = existing[level].get(station_number)
+            if current is not None:
+                update = {column: values[column] for column in columns if column in values}
+                if sync and any(getattr(current, column) != value for column, value in update.items()):
+                    updates.append({'item_id': current.id, **update})
+                    stats['items_updated'] += 1
+                else:
+                    stats['items_skipped'] += 1
+                continue
+            
+            inserts.append({'technical_id': station_number, **values})
+            insert_ids.append(station_number)
         
-        # Verify required columns exist after mapping
-        required_columns = ['Arbeidsstasjonsnummer', 'Benevnelse']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        table = model.__table__
+        if updates:
+            update_columns = [key for key in updates[0] if key != 'item_id']
+            connection.execute(
+                table.update().where(table.c.id == bindparam('item_id')).values(
+                    {column: bindparam(column) for column in update_columns}
+                ),
+                updates
+            )
+            if level == 1:
+                # The analysis snapshots show the machine name, Core updates skip the flush hook that would bump them
+                bump_rcm_revision(connection, [u['item_id'] for u in updates])
+        if inserts:
+            ids[level].update(zip(insert_ids, _insert_rows(connection, model, inserts)))
+            if level == 2:
+                subsystem_machines.update((row['technical_id'], row['machine_id']) for row in inserts)
+            progress.add_created(len(inserts))
         
+        stats[f"{model.__tablename__}s_added"] = len(inserts)
+    
+    # Deeper levels are not supported in this version
+    if equipment is None:
+        stats['items_skipped'] += sum(len(level_rows) for level, level_rows in rows_by_level.items()
+                                      if level not in STRUCTURE_LEVELS)
+
+
+def import_technical_structure_park(file_path, sync=False, progress=None):
+    """
+    Import the entire machine park structure from Excel file.
+    Creates all machines, subsystems, and components based on work station numbers.
+    With sync, items that already exist get the names and descriptions in the file.
+    """
+    progress = progress or ImportProgress()
+    try:
+        # Clean the rows and work out their level, parent items sort first
+        rows, missing_columns = _read_structure_rows(file_path, "Teknisk plasstruktur")
         if missing_columns:
             return {
                 'success': False,
                 'message': f"Missing required columns after mapping: {', '.join(missing_columns)}"
             }
-        
-        # Add a column to determine the level of each item based on work station number
-        df['ItemLevel'] = df['Arbeidsstasjonsnummer'].apply(
-            lambda x: len(str(x).split('.'))
-        )
-        
-        # Sort dataframe by work station number to ensure parent items are created first
-        df = df.sort_values(by=['ItemLevel', 'Arbeidsstasjonsnummer'])
+        progress.update(rows_parsed=len(rows))
         
         # Stats to track import progress
         stats = {
             'machines_added': 0,
             'subsystems_added': 0,
             'components_added': 0,
+            'items_updated': 0,
             'items_skipped': 0
         }
         
-        # Dictionary to track created items by technical ID
-        created_items = {}
-        
-        # Process each row in order
-        for index, row in df.iterrows():
-            station_number = str(row['Arbeidsstasjonsnummer']).strip()
-            name = str(row['Benevnelse']).strip()
-            description = str(row.get('Beskrivelse', ''))
-            technical_name = str(row.get('Teknisk navn ', ''))  # Note the space after 'navn'
-            location = ''  # Default empty location since it's not in your Excel
-            
-            # Skip empty rows
-            if not station_number or station_number == 'nan':
-                continue
-                
-            # Determine item level
-            parts = station_number.split('.')
-            level = len(parts)
-            
-            # Process based on level (machine, subsystem, component)
-            if level == 1:
-                # This is a machine
-                existing = Machine.query.filter_by(technical_id=station_number).first()
-                if existing:
-                    # Machine already exists, skip
-                    created_items[station_number] = {'id': existing.id, 'type': 'machine'}
-                    stats['items_skipped'] += 1
-                    continue
-                
-                # Create new machine
-                machine = Machine(
-                    name=name,
-                    technical_id=station_number,
-                    description=description,
-                    location=location,
-                    qr_code=str(uuid.uuid4())  # Generate unique QR code
-                )
-                db.session.add(machine)
-                db.session.flush()  # Get ID without committing yet
-                
-                created_items[station_number] = {'id': machine.id, 'type': 'machine'}
-                stats['machines_added'] += 1
-                
-            elif level == 2:
-                # This is a subsystem
-                # Find parent machine
-                parent_id = parts[0]
-                
-                if parent_id not in created_items or created_items[parent_id]['type'] != 'machine':
-                    # Parent machine not found, skip
-                    stats['items_skipped'] += 1
-                    continue
-                
-                machine_id = created_items[parent_id]['id']
-                
-                # Check if subsystem already exists
-                existing = Subsystem.query.filter_by(technical_id=station_number).first()
-                if existing:
-                    # Subsystem already exists, skip
-                    created_items[station_number] = {'id': existing.id, 'type': 'subsystem'}
-                    stats['items_skipped'] += 1
-                    continue
-                
-                # Create new subsystem
-                subsystem = Subsystem(
-                    name=name,
-                    technical_id=station_number,
-                    description=description,
-                    machine_id=machine_id
-                )
-                db.session.add(subsystem)
-                db.session.flush()  # Get ID without committing yet
-                
-                created_items[station_number] = {'id': subsystem.id, 'type': 'subsystem'}
-                stats['subsystems_added'] += 1
-                
-            elif level == 3:
-                # This is a component
-                # Find parent subsystem and machine
-                parent_machine_id = parts[0]
-                parent_subsystem_id = f"{parts[0]}.{parts[1]}"
-                
-                if (parent_subsystem_id not in created_items or 
-                    created_items[parent_subsystem_id]['type'] != 'subsystem'):
-                    # Parent subsystem not found, skip
-                    stats['items_skipped'] += 1
-                    continue
-                
-                subsystem_id = created_items[parent_subsystem_id]['id']
-                machine_id = created_items[parent_machine_id]['id']
-                
-                # Check if component already exists
-                existing = Component.query.filter_by(technical_id=station_number).first()
-                if existing:
-                    # Component already exists, skip
-                    stats['items_skipped'] += 1
-                    continue
-                
-                # Create new component - REMOVE description parameter
-                component = Component(
-                    name=name,
-                    technical_id=station_number,
-                    location=location,
-                    function=technical_name,  # Use technical name as function
-                    subsystem_id=subsystem_id,
-                    machine_id=machine_id
-                )
-                db.session.add(component)
-                stats['components_added'] += 1
-            
-            else:
-                # Deeper levels are not supported in this version
-                stats['items_skipped'] += 1
-        
-        # Commit all changes
-        db.session.commit()
+        with track_queries() as write_stats:
+            _write_structure(rows, stats, progress, sync=sync)
+            db.session.commit()
+        logger.info(f"Technical structure written in {write_stats.queries} statements "
+                    f"({write_stats.duration_ms:.0f} ms): {stats}")
         
         return {
             'success': True,
@@ -681,174 +1123,41 @@ def import_technical_structure_park(file_path):
         import traceback
         logger.error(traceback.format_exc())
         raise e
-        
-    finally:
-        # Explicitly close the Excel file to release the lock
-        if excel_file is not None:
-            excel_file.close()
             
-def import_technical_structure_equipment(file_path, equipment_id):
+def import_technical_structure_equipment(file_path, equipment_id, sync=False, progress=None):
     """
     Import components for a specific equipment.
     This is the original functionality that expects an equipment_id.
+    With sync, items that already exist get the names and descriptions in the file.
     """
+    progress = progress or ImportProgress()
     try:
-        # Read Excel file - first list all sheets
-        excel_file = pd.ExcelFile(file_path)
-        sheet_names = excel_file.sheet_names
-        print("Excel sheets found:", sheet_names)
-        
-        # Try to find the "Teknisk plassstruktur" sheet
-        target_sheet = "Teknisk plassstruktur"
-        
-        # Check if the target sheet exists
-        if target_sheet in sheet_names:
-            print(f"Found target sheet: {target_sheet}")
-            df = pd.read_excel(file_path, sheet_name=target_sheet)
-        else:
-            # If the exact sheet name isn't found, look for something similar
-            for sheet in sheet_names:
-                if "teknisk" in sheet.lower() or "plassstruktur" in sheet.lower() or "struktur" in sheet.lower():
-                    print(f"Found similar sheet: {sheet}")
-                    df = pd.read_excel(file_path, sheet_name=sheet)
-                    break
-            else:
-                # If no matching sheet is found, use the first sheet but warn about it
-                print(f"Target sheet '{target_sheet}' not found. Using first sheet: {sheet_names[0]}")
-                df = pd.read_excel(file_path, sheet_name=0)
-        
-        # Print columns for debugging
-        print("Excel columns found:", df.columns.tolist())
-        
-        # Map possible column names
-        column_mapping = {
-            'Arbeidsstasjon': 'Arbeidsstasjonsnummer',
-            'Benevnelse': 'Benevnelse',  # Already matches
-            'Teknisk navn': 'Teknisk navn',  # Already matches
-            'Beskrivelse': 'Beskrivelse'  # Already matches
-        }
-        
-        # Rename columns to standardized names if needed
-        for old_name, new_name in column_mapping.items():
-            if old_name in df.columns and new_name not in df.columns:
-                df = df.rename(columns={old_name: new_name})
-        
-        # Print columns after mapping for debugging
-        print("Excel columns after mapping:", df.columns.tolist())
-        
-        # Verify required columns exist after mapping
-        required_columns = ['Arbeidsstasjonsnummer', 'Benevnelse']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # Get the equipment
+        equipment = Machine.query.get(equipment_id)
+        equipment_technical_id = equipment.technical_id
         
+        # Clean the rows relevant to this equipment and work out their level
+        rows, missing_columns = _read_structure_rows(file_path, "Teknisk plassstruktur", prefix=equipment_technical_id)
         if missing_columns:
             return {
                 'success': False,
                 'message': f"Missing required columns after mapping: {', '.join(missing_columns)}"
             }
-        
-        # Get the equipment
-        equipment = Machine.query.get(equipment_id)
-        equipment_technical_id = equipment.technical_id
-        
-        # Filter rows relevant to this equipment
-        df = df[df['Arbeidsstasjonsnummer'].astype(str).str.startswith(equipment_technical_id)]
-        
-        # Add a column to determine the level of each item
-        df['ItemLevel'] = df['Arbeidsstasjonsnummer'].apply(
-            lambda x: len(str(x).split('.'))
-        )
-        
-        # Sort by level and work station number
-        df = df.sort_values(by=['ItemLevel', 'Arbeidsstasjonsnummer'])
+        progress.update(rows_parsed=len(rows))
         
         # Stats to track import progress
         stats = {
             'subsystems_added': 0,
             'components_added': 0,
+            'items_updated': 0,
             'items_skipped': 0
         }
         
-        # Dictionary to track created subsystems by technical ID
-        created_subsystems = {}
-        
-        # Process each row in order
-        for index, row in df.iterrows():
-            station_number = str(row['Arbeidsstasjonsnummer']).strip()
-            name = str(row['Benevnelse']).strip()
-            description = str(row.get('Beskrivelse', ''))
-            technical_name = str(row.get('Teknisk navn', ''))
-            location = ''  # Default empty location since it's not in your Excel
-            
-            # Skip empty rows
-            if not station_number or station_number == 'nan':
-                continue
-                
-            # Skip the equipment itself
-            if station_number == equipment_technical_id:
-                continue
-            
-            # Determine item level
-            parts = station_number.split('.')
-            level = len(parts)
-            
-            # Process based on level (subsystem or component)
-            if level == 2:
-                # This is a subsystem
-                # Check if subsystem already exists
-                existing = Subsystem.query.filter_by(technical_id=station_number).first()
-                if existing:
-                    # Subsystem already exists, skip
-                    created_subsystems[station_number] = existing.id
-                    stats['items_skipped'] += 1
-                    continue
-                
-                # Create new subsystem
-                subsystem = Subsystem(
-                    name=name,
-                    technical_id=station_number,
-                    description=description,
-                    machine_id=equipment.id
-                )
-                db.session.add(subsystem)
-                db.session.flush()  # Get ID without committing yet
-                
-                created_subsystems[station_number] = subsystem.id
-                stats['subsystems_added'] += 1
-                
-            elif level == 3:
-                # This is a component
-                # Find parent subsystem
-                parent_subsystem_id = f"{parts[0]}.{parts[1]}"
-                
-                if parent_subsystem_id not in created_subsystems:
-                    # Parent subsystem not found, skip
-                    stats['items_skipped'] += 1
-                    continue
-                
-                subsystem_id = created_subsystems[parent_subsystem_id]
-                
-                # Check if component already exists
-                existing = Component.query.filter_by(technical_id=station_number).first()
-                if existing:
-                    # Component already exists, skip
-                    stats['items_skipped'] += 1
-                    continue
-                
-                # Create new component
-                component = Component(
-                    name=name,
-                    technical_id=station_number,
-                    description=description,
-                    location=location,
-                    function=technical_name,  # Use technical name as function
-                    subsystem_id=subsystem_id,
-                    machine_id=equipment.id
-                )
-                db.session.add(component)
-                stats['components_added'] += 1
-        
-        # Commit all changes
-        db.session.commit()
+        with track_queries() as write_stats:
+            _write_structure(rows, stats, progress, sync=sync, equipment=equipment)
+            db.session.commit()
+        logger.info(f"Equipment structure written in {write_stats.queries} statements "
+                    f"({write_stats.duration_ms:.0f} ms): {stats}")
         
         return {
             'success': True,
@@ -862,4 +1171,68 @@ def import_technical_structure_equipment(file_path, equipment_id):
         logger.error(f"Error importing equipment components: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        raise e
\ No newline at end of file
+        raise e
+
+def import_technical_structure_files(file_paths, import_mode, equipment_id=None, sync=False, progress=None,
+                                     file_names=None):
+    """
+    Import every technical structure sheet of several workbooks in one write
+    
+    The sheets are parsed in parallel and their rows merged, an item listed on more
+    than one sheet is imported once. Sheets without the required columns are
+    reported and left out.
+    
+    Args:
+        import_mode: 'park' for the whole machine park, 'equipment' for one machine
+        file_names: Names to report for the files, the file names by default
+    
+    Returns:
+        Result dict like the single file imports, with a summary per sheet under 'sheets'
+    """
+    progress = progress or ImportProgress()
+    file_names = file_names or [os.path.basename(path) for path in file_paths]
+    try:
+        equipment = Machine.query.get(equipment_id) if import_mode == 'equipment' else None
+        prefix = equipment.technical_id if equipment is not None else None
+        
+        tasks = []
+        names = []
+        for file_path, file_name in zip(file_paths, file_names):
+            with WorkbookReader(file_path) as reader:
+                for sheet_name in reader.find_sheets(STRUCTURE_SHEET_KEYWORDS):
+                    tasks.append((file_path, sheet_name, prefix))
+                    names.append(file_name)
+        
+        rows = []
+        sheets = []
+        for file_name, (summary, sheet_rows) in zip(names, map_sheets(parse_structure_sheet, tasks)):
+            sheets.append({'file': file_name, **summary})
+            rows.extend(sheet_rows)
+            progress.update(rows_parsed=len(rows))
+        
+        if not any(sheet['success'] for sheet in sheets):
+            return {'success': False, 'message': "No sheet with the technical structure columns was found",
+                    'sheets': sheets}
+        
+        stats = {'subsystems_added': 0, 'components_added': 0, 'items_updated': 0, 'items_skipped': 0}
+        if equipment is None:
+            stats = {'machines_added': 0, **stats}
+        
+        with track_queries() as write_stats:
+            _write_structure(_sort_structure_rows(rows), stats, progress, sync=sync, equipment=equipment)
+            db.session.commit()
+        logger.info(f"Technical structure of {len(sheets)} sheets written in {write_stats.queries} statements "
+                    f"({write_stats.duration_ms:.0f} ms): {stats}")
+        
+        return {
+            'success': True,
+            'message': "Technical structure imported successfully",
+            'stats': stats,
+            'sheets': sheets
+        }
+        
+    except Exception as e:
+        # Rollback in case of error
+        db.session.rollback()
+        logger.error(f"Error importing technical structure: {str(e)}", exc_info=True)
+        raise e
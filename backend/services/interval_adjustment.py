@@ -173,106 +173,18 @@ class IntervalAdjustmentService:
         Returns:
             List of created work orders
         """
-        from backend.models.rcm import RCMFailureMode, RCMFunctionalFailure, RCMFunction
-        from backend.models.machine import Machine, Component
+        from backend.services.work_order_generator import WorkOrderGenerator
         
         # Find maintenance actions with recent interval adjustments (last 7 days)
         cutoff_time = datetime.now(timezone.utc) - timedelta(days=7)
-        recent_adjustments = IntervalAdjustmentHistory.query.filter(
-            IntervalAdjustmentHistory.timestamp >= cutoff_time
-        ).all()
-        
-        # Get unique maintenance IDs
-        maintenance_ids = set()
-        for adj in recent_adjustments:
-            maintenance_ids.add(adj.maintenance_id)
+        maintenance_ids = {
+            adj.maintenance_id for adj in db.session.query(IntervalAdjustmentHistory.maintenance_id).filter(
+                IntervalAdjustmentHistory.timestamp >= cutoff_time
+            ).distinct()
+        }
         
-        # Generate work orders
-        created_orders = []
+        if not maintenance_ids:
+            return []
         
-        for maintenance_id in maintenance_ids:
-            # Get the maintenance action
-            maintenance = RCMMaintenance.query.get(maintenance_id)
-            if not maintenance:
-                continue
-                
-            # Get related component
-            component = None
-            
-            try:
-                failure_mode = RCMFailureMode.query.get(maintenance.failure_mode_id)
-                if not failure_mode:
-                    continue
-                    
-                failure = RCMFunctionalFailure.query.get(failure_mode.functional_failure_id)
-                if not failure:
-                    continue
-                    
-                function = RCMFunction.query.get(failure.function_id)
-                if not function or not function.component_id:
-                    continue
-                    
-                component = Component.query.get(function.component_id)
-                if not component:
-                    continue
-                    
-                machine = Machine.query.get(component.machine_id)
-                if not machine:
-                    continue
-            except Exception as e:
-                logger.error(f"Error finding component for maintenance ID {maintenance_id}: {str(e)}")
-                continue
-                
-            # Check if work order already exists
-            existing_order = WorkOrder.query.filter_by(
-                machine_id=machine.id,
-                status='open',
-                generation_source='rcm'
-            ).filter(
-                WorkOrder.reason.like(f"%Maintenance ID: {maintenance_id}%")
-            ).first()
-            
-            if existing_order:
-                # Already have an open work order for this maintenance action
-                continue
-                
-            # Calculate due date based on interval type
-            if maintenance.interval_days:
-                due_date = datetime.now(timezone.utc) + timedelta(days=maintenance.interval_days)
-            elif maintenance.interval_hours and machine.hour_counter:
-                # Estimate due date based on operating hours
-                # Calculate average operating hours per day
-                if machine.expected_annual_usage:
-                    hours_per_day = machine.expected_annual_usage / 365
-                else:
-                    hours_per_day = 8  # Default to 8 hours per day
-                    
-                # Calculate days until next maintenance
-                days_until_maintenance = maintenance.interval_hours / hours_per_day
-                due_date = datetime.now(timezone.utc) + timedelta(days=days_until_maintenance)
-            else:
-                # Default to 30 days if no interval set
-                due_date = datetime.now(timezone.utc) + timedelta(days=30)
-                
-            # Create work order
-            work_order = WorkOrder(
-                title=f"{maintenance.title} - {component.name}",
-                description=f"{maintenance.description}\n\nBased on RCM analysis for {component.name}.",
-                machine_id=machine.id,
-                component_id=component.id,
-                due_date=due_date,
-                status='open',
-                priority='normal',
-                type=maintenance.maintenance_type or 'preventive',
-                category='rcm_maintenance',
-                reason=f"Generated from RCM maintenance action. Maintenance ID: {maintenance_id}",
-                generation_source='rcm'
-            )
-            
-            db.session.add(work_order)
-            created_orders.append(work_order)
-            
-        if created_orders:
-            db.session.commit()
-            
-        return created_orders
\ No newline at end of file
+        # Targets and due dates come from the maintenance due state, kept current as intervals change
+        return WorkOrderGenerator.generate_due_orders(maintenance_ids=maintenance_ids)
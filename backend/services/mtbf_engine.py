@@ -0,0 +1,146 @@
+"""
+MTBF/MTTR engine on the failure history
+"""
+# The daily rollups answer machine level MTBF/MTTR for a date range, but not
+# per subsystem or component over time. This engine reads the failures of
+# completed work orders into one DataFrame, sorted per entity and timestamp,
+# and derives everything from a single pass: the gaps between failures come
+# from groupby().diff(), the means from a grouped aggregation and the trend
+# from a rolling mean over the same gaps.
+import pandas as pd
+from datetime import datetime, time, timedelta
+from sqlalchemy import select
+from backend.database import db
+from backend.models.maintenance_log import MaintenanceLog
+from backend.models.work_order import WorkOrder
+from backend.models.failure import Failure
+from backend.services.entity_lookup import EntityLookup
+from backend.services.reliability_rollup import day_of
+
+LEVELS = {
+    'machine': MaintenanceLog.machine_id,
+    'subsystem': MaintenanceLog.subsystem_id,
+    'component': MaintenanceLog.component_id,
+}
+
+def load_failures(level='machine', machine_id=None, entity_id=None, start_date=None, end_date=None):
+    """
+    Failures on completed work orders as a DataFrame
+
+    Columns entity_id, machine_id, timestamp and downtime_hours, sorted by
+    entity and time. Like the statistics, the range covers whole UTC days.
+    """
+    entity_column = LEVELS[level]
+    query = select(
+        entity_column.label('entity_id'),
+        MaintenanceLog.machine_id,
+        MaintenanceLog.timestamp,
+        WorkOrder.downtime_hours
+    ).join(
+        Failure, Failure.maintenance_log_id == MaintenanceLog.id
+    ).join(
+        WorkOrder, WorkOrder.id == MaintenanceLog.work_order_id
+    ).where(
+        WorkOrder.status == 'completed',
+        entity_column.isnot(None)
+    ).order_by(
+        entity_column,
+        MaintenanceLog.timestamp
+    )
+
+    if machine_id:
+        query = query.where(MaintenanceLog.machine_id == machine_id)
+    if entity_id:
+        query = query.where(entity_column == entity_id)
+    if start_date:
+        query = query.where(MaintenanceLog.timestamp >= datetime.combine(day_of(start_date), time.min))
+    if end_date:
+        query = query.where(MaintenanceLog.timestamp < datetime.combine(day_of(end_date) + timedelta(days=1), time.min))
+
+    return pd.read_sql(query, db.session.connection(), parse_dates=['timestamp'])
+
+def mtbf_mttr_frame(failures, trend_window_days=None):
+    """
+    Per entity failure_count, mtbf_hours and mttr_hours, plus the failures with their rolling MTBF
+
+    Returns:
+        (summary DataFrame indexed by entity_id, failures DataFrame with gap_hours
+        and, when a window is given, trend_mtbf_hours)
+    """
+    failures = failures.copy()
+    by_entity = failures.groupby('entity_id', sort=False)
+
+    failures['gap_hours'] = by_entity['timestamp'].diff().dt.total_seconds() / 3600
+    by_entity = failures.groupby('entity_id', sort=False)
+    # Only repairs that recorded downtime count towards MTTR
+    failures['repair_hours'] = failures['downtime_hours'].where(failures['downtime_hours'].fillna(0) != 0)
+
+    summary = failures.groupby('entity_id').agg(
+        machine_id=('machine_id', 'first'),
+        failure_count=('timestamp', 'size'),
+        mtbf_hours=('gap_hours', 'mean'),
+        mttr_hours=('repair_hours', 'mean')
+    )
+    # At least two failures are needed for a gap
+    summary = summary[summary['failure_count'] >= 2]
+    summary['mttr_hours'] = summary['mttr_hours'].fillna(0)
+
+    if trend_window_days:
+        # Rows come back indexed by (entity, timestamp) in group order, which is the frame's order
+        rolling = by_entity.rolling(f'{trend_window_days}D', on='timestamp')['gap_hours'].mean()
+        failures['trend_mtbf_hours'] = rolling.to_numpy()
+
+    return summary, failures
+
+class MTBFEngine:
+    @staticmethod
+    def analyse(level='machine', machine_id=None, entity_id=None, start_date=None, end_date=None, trend_window_days=None):
+        """
+        MTBF and MTTR per machine, subsystem or component
+
+        Args:
+            level: 'machine', 'subsystem' or 'component'
+            machine_id: Only entities of this machine
+            entity_id: Only this machine/subsystem/component
+            trend_window_days: Add each entity's MTBF over the trailing window at every failure
+
+        Returns:
+            List of dicts sorted by entity id
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level '{level}', expected one of {', '.join(LEVELS)}")
+
+        failures = load_failures(level, machine_id, entity_id, start_date, end_date)
+        summary, failures = mtbf_mttr_frame(failures, trend_window_days)
+
+        entities = EntityLookup.for_level(level, [int(current_id) for current_id in summary.index])
+        trends = {}
+        if trend_window_days:
+            points = failures[failures['entity_id'].isin(summary.index) & failures['trend_mtbf_hours'].notna()]
+            for current_id, group in points.groupby('entity_id'):
+                trends[current_id] = [
+                    {'timestamp': timestamp.isoformat(), 'mtbf_hours': round(value, 2)}
+                    for timestamp, value in zip(group['timestamp'], group['trend_mtbf_hours'])
+                ]
+
+        results = []
+        for current_id, row in summary.iterrows():
+            machine = entities.machine_of(level, current_id)
+            entity = entities.entity(level, current_id)
+            result = {
+                'level': level,
+                'id': int(current_id),
+                'name': entity.name if entity else None,
+                'technical_id': entity.technical_id if entity else None,
+                'machine_id': int(row['machine_id']),
+                'machine_name': machine.name if machine else None,
+                'failure_count': int(row['failure_count']),
+                'mtbf_hours': round(float(row['mtbf_hours']), 2),
+                'mttr_hours': round(float(row['mttr_hours']), 2)
+            }
+            if trend_window_days:
+                result['trend_window_days'] = trend_window_days
+                result['trend'] = trends.get(current_id, [])
+            results.append(result)
+
+        return results
@@ -0,0 +1,34 @@
+"""
+Query counting for generator and import runs
+"""
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from backend.database import db
+
+class QueryStats:
+    """Number of statements executed and wall time of a block"""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration_ms = 0.0
+
+    def as_dict(self):
+        return {'queries': self.queries, 'duration_ms': round(self.duration_ms, 1)}
+
+@contextmanager
+def track_queries(engine=None):
+    """Count every statement executed on the engine inside the block"""
+    engine = engine or db.engine
+    stats = QueryStats()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats.queries += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.duration_ms = (time.perf_counter() - start) * 1000
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
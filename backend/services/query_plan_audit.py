@@ -0,0 +1,193 @@
+"""
+Query plan audit for the hot maintenance tables
+"""
+# Runs the real statistics and work order generation code against a scratch
+# database, captures every SELECT it issues and checks the SQLite query plan.
+# A query that falls back to a full scan of one of the hot tables is reported
+# as a regression.
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from backend.database import db
+
+logger = logging.getLogger(__name__)
+
+# Tables that grow with plant history and must always be reached through an index
+HOT_TABLES = ['maintenance_log', 'work_order', 'failure', 'rcm_maintenance', 'maintenance_due_state',
+              'reliability_daily']
+
+@contextmanager
+def capture_queries(engine):
+    """Record (statement, parameters) for every SELECT executed on the engine"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def explain(engine, statement, parameters):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+def find_table_scans(plan, tables=HOT_TABLES):
+    """Return the plan lines that scan one of the given tables"""
+    scans = []
+    for detail in plan:
+        parts = detail.split()
+        # "SCAN work_order" or "SCAN TABLE work_order" (older SQLite versions)
+        if not parts or parts[0] != 'SCAN':
+            continue
+        table = parts[2] if len(parts) > 2 and parts[1] == 'TABLE' else parts[1] if len(parts) > 1 else None
+        if table in tables:
+            scans.append(detail)
+    return scans
+
+def _seed_sample_data():
+    """Insert a small but complete data set so every code path issues its queries"""
+    from backend.models.user import User
+    from backend.models.machine import Machine, Subsystem, Component
+    from backend.models.work_order import WorkOrder
+    from backend.models.maintenance_log import MaintenanceLog
+    from backend.models.failure import Failure
+    from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMMaintenance
+
+    now = datetime.now(timezone.utc)
+
+    user = User(username='audit', email='audit@example.com', role='admin')
+    user.set_password('audit')
+    db.session.add(user)
+
+    machine = Machine(name='Audit machine', location='Audit', technical_id='9001',
+                      qr_code='audit-qr', hour_counter=1000, last_maintenance=now - timedelta(days=60))
+    db.session.add(machine)
+    db.session.flush()
+
+    subsystem = Subsystem(name='Audit subsystem', technical_id='9001.01', machine_id=machine.id)
+    db.session.add(subsystem)
+    db.session.flush()
+
+    component = Component(name='Audit component', technical_id='9001.01.001',
+                          subsystem_id=subsystem.id, machine_id=machine.id)
+    db.session.add(component)
+    db.session.flush()
+
+    for i in range(3):
+        work_order = WorkOrder(title=f'Audit order {i}', description='Audit', due_date=now,
+                               status='completed', type='corrective', machine_id=machine.id,
+                               component_id=component.id, downtime_hours=2, generation_source='deviation')
+        db.session.add(work_order)
+        db.session.flush()
+
+        log = MaintenanceLog(description='Audit', machine_id=machine.id, subsystem_id=subsystem.id,
+                             component_id=component.id, performed_by=user.id, work_order_id=work_order.id,
+                             timestamp=now - timedelta(days=10 * (i + 1)), has_deviation=True)
+        db.session.add(log)
+        db.session.flush()
+
+        db.session.add(Failure(maintenance_log_id=log.id, description='Audit', severity='minor'))
+
+    unit = RCMUnit(name='Audit unit', equipment_id=machine.id, technical_id='9001.01')
+    db.session.add(unit)
+    db.session.flush()
+    function = RCMFunction(name='Audit function', equipment_id=machine.id, unit_id=unit.id)
+    db.session.add(function)
+    db.session.flush()
+    failure = RCMFunctionalFailure(name='Audit failure', function_id=function.id)
+    db.session.add(failure)
+    db.session.flush()
+    mode = RCMFailureMode(name='Audit mode', functional_failure_id=failure.id)
+    db.session.add(mode)
+    db.session.flush()
+    db.session.add(RCMMaintenance(title='Audit action', maintenance_type='preventive',
+                                  interval_days=30, failure_mode_id=mode.id))
+
+    db.session.commit()
+    return machine.id, subsystem.id, component.id
+
+def _audited_calls(machine_id, subsystem_id, component_id):
+    """The service calls whose queries are checked, as (name, callable) pairs"""
+    from backend.services.statistics import MaintenanceStatistics
+    from backend.services.AdvancedStatistics import AdvancedStatistics
+    from backend.services.work_order_generator import WorkOrderGenerator
+    from backend.services.due_state import DueStateService
+    from backend.services.rcm_analysis import RCMAnalysisService
+
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=90)
+
+    return [
+        ('statistics.get_failure_rates (machine)',
+         lambda: MaintenanceStatistics.get_failure_rates(machine_id=machine_id, start_date=start_date, end_date=end_date)),
+        ('statistics.get_failure_rates (subsystem)',
+         lambda: MaintenanceStatistics.get_failure_rates(subsystem_id=subsystem_id, start_date=start_date, end_date=end_date)),
+        ('statistics.get_failure_rates (component)',
+         lambda: MaintenanceStatistics.get_failure_rates(component_id=component_id, start_date=start_date, end_date=end_date)),
+        ('statistics.get_uptime_statistics',
+         lambda: MaintenanceStatistics.get_uptime_statistics(machine_id, start_date, end_date)),
+        ('statistics.get_mtbf_mttr',
+         lambda: MaintenanceStatistics.get_mtbf_mttr(machine_id, start_date, end_date)),
+        ('statistics.generate_work_order_statistics',
+         lambda: MaintenanceStatistics.generate_work_order_statistics(machine_id, start_date, end_date)),
+        ('AdvancedStatistics.perform_weibull_analysis',
+         lambda: AdvancedStatistics.perform_weibull_analysis(component_id)),
+        ('AdvancedStatistics.perform_kaplan_meier_analysis',
+         lambda: AdvancedStatistics.perform_kaplan_meier_analysis(component_id)),
+        ('WorkOrderGenerator.generate_hour_based_orders',
+         lambda: WorkOrderGenerator.generate_hour_based_orders()),
+        ('WorkOrderGenerator.generate_calendar_based_orders',
+         lambda: WorkOrderGenerator.generate_calendar_based_orders()),
+        ('WorkOrderGenerator.generate_from_rcm',
+         lambda: WorkOrderGenerator.generate_from_rcm(machine_id)),
+        ('WorkOrderGenerator.generate_due_orders',
+         lambda: WorkOrderGenerator.generate_due_orders()),
+        ('DueStateService.upcoming',
+         lambda: DueStateService.upcoming(days=30)),
+        ('RCMAnalysisService.build_tree',
+         lambda: RCMAnalysisService.build_tree(machine_id)),
+    ]
+
+def run_query_plan_audit():
+    """
+    Run the audited service calls against the current (scratch) database
+
+    Returns:
+        List of dicts, one per audited call, with the queries that scan a hot table
+        and the error message if the call itself raised
+    """
+    engine = db.engine
+    machine_id, subsystem_id, component_id = _seed_sample_data()
+
+    report = []
+    for name, call in _audited_calls(machine_id, subsystem_id, component_id):
+        error = None
+        with capture_queries(engine) as captured:
+            try:
+                call()
+            except Exception as e:
+                # The queries issued before the failure are still checked
+                db.session.rollback()
+                error = str(e)
+
+        regressions = []
+        for statement, parameters in captured:
+            plan = explain(engine, statement, parameters)
+            scans = find_table_scans(plan)
+            if scans:
+                regressions.append({'statement': statement, 'plan': plan, 'scans': scans})
+
+        report.append({'name': name, 'error': error, 'queries': len(captured), 'regressions': regressions})
+
+    return report
@@ -0,0 +1,281 @@
+"""
+RCM analysis tree assembly
+"""
+# The analysis is a five level tree (unit > function > functional failure >
+# failure mode > effects/maintenance actions). Loading it through the lazy
+# relationships costs a query per node; here each level is loaded with one
+# IN query on the parent IDs and the tree is put together in Python, so the
+# number of queries is the same for a tree of ten nodes or ten thousand.
+#
+# The serialised analysis of each machine is also kept as a snapshot, valid for
+# one revision of that machine's RCM data. Revisions are bumped on every write
+# to the analysis, so a request between writes just returns the stored bytes.
+import gzip
+import threading
+from collections import OrderedDict, defaultdict
+from itertools import chain
+from flask import current_app
+from sqlalchemy import event, select, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from backend.database import db
+from backend.models.machine import Machine
+from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance, RCMRevision
+
+# SQLite allows 999 bound parameters in older versions, stay under it
+IN_CHUNK_SIZE = 900
+
+# Revision rows that aren't a machine: the analysis of all machines together,
+# and a counter bumped when a change can't be placed under one machine
+ALL_EQUIPMENT = 0
+EVERY_SNAPSHOT = -1
+
+RCM_MODELS = (RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance)
+
+# model -> (attribute holding the parent id, parent model), up to the unit
+_PARENTS = {
+    RCMMaintenance: ('failure_mode_id', RCMFailureMode),
+    RCMFailureEffect: ('failure_mode_id', RCMFailureMode),
+    RCMFailureMode: ('functional_failure_id', RCMFunctionalFailure),
+    RCMFunctionalFailure: ('function_id', RCMFunction),
+    RCMFunction: ('unit_id', RCMUnit),
+}
+
+def _load_children(model, parent_column, parent_ids):
+    """All rows of model whose parent_column is in parent_ids, grouped by parent id"""
+    children = defaultdict(list)
+    parent_ids = list(parent_ids)
+    for start in range(0, len(parent_ids), IN_CHUNK_SIZE):
+        chunk = parent_ids[start:start + IN_CHUNK_SIZE]
+        for row in model.query.filter(parent_column.in_(chunk)).order_by(model.id).all():
+            children[getattr(row, parent_column.key)].append(row)
+    return children
+
+def bump_rcm_revision(connection, equipment_ids=None):
+    """
+    Invalidate the analysis snapshots of the given machines, of every machine when None
+
+    Called from the flush for ORM writes, writes that bypass the ORM must call it themselves.
+    """
+    table = RCMRevision.__table__
+    keys = {ALL_EQUIPMENT, EVERY_SNAPSHOT} if equipment_ids is None else {ALL_EQUIPMENT, *equipment_ids}
+    for equipment_id in sorted(keys):
+        result = connection.execute(
+            table.update()
+            .where(table.c.equipment_id == equipment_id)
+            .values(revision=table.c.revision + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(equipment_id=equipment_id, revision=1))
+
+def get_rcm_revision(equipment_id=None):
+    """Revision of a machine's analysis, or of all machines' when None"""
+    key = equipment_id or ALL_EQUIPMENT
+    table = RCMRevision.__table__
+    rows = dict(db.session.execute(
+        select(table.c.equipment_id, table.c.revision).where(table.c.equipment_id.in_([key, EVERY_SNAPSHOT]))
+    ).all())
+    return rows.get(key, 0), rows.get(EVERY_SNAPSHOT, 0)
+
+class AnalysisSnapshot:
+    """The serialised analysis response of one revision"""
+
+    def __init__(self, revision, body):
+        self.revision = revision
+        self.body = body
+        self._gzipped = None
+
+    def gzipped(self):
+        # Compressed on first use only, most clients on the plant network ask for it
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+class SnapshotCache:
+    """Bounded equipment_id -> AnalysisSnapshot cache, least recently used dropped first"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, equipment_id, revision):
+        with self._lock:
+            snapshot = self._entries.get(equipment_id)
+            if snapshot is None or snapshot.revision != revision:
+                return None
+            self._entries.move_to_end(equipment_id)
+            return snapshot
+
+    def set(self, equipment_id, snapshot):
+        with self._lock:
+            self._entries[equipment_id] = snapshot
+            self._entries.move_to_end(equipment_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+snapshot_cache = SnapshotCache()
+
+class RCMAnalysisService:
+    @staticmethod
+    def get_snapshot(equipment_id=None):
+        """
+        Serialised analysis of a machine (all machines when None) for its current revision
+
+        Returns:
+            AnalysisSnapshot whose body is the JSON response as bytes
+        """
+        revision = get_rcm_revision(equipment_id)
+        snapshot = snapshot_cache.get(equipment_id, revision)
+        if snapshot is None:
+            tree = RCMAnalysisService.build_tree(equipment_id)
+            body = current_app.json.response(rcm_analysis=tree).get_data()
+            snapshot = AnalysisSnapshot(revision, body)
+            snapshot_cache.set(equipment_id, snapshot)
+        return snapshot
+
+    @staticmethod
+    def build_tree(equipment_id=None):
+        """
+        Complete RCM analysis as nested dicts, in a fixed number of queries
+
+        Args:
+            equipment_id: Only the units of this machine, all units when None
+
+        Returns:
+            List of unit dicts, same shape as /api/rcm/analysis has always returned
+        """
+        query = RCMUnit.query
+        if equipment_id:
+            query = query.filter_by(equipment_id=equipment_id)
+        units = query.order_by(RCMUnit.id).all()
+
+        # Get equipment name if ID is provided
+        equipment_name = None
+        if equipment_id:
+            machine = db.session.get(Machine, equipment_id)
+            if machine:
+                equipment_name = machine.name
+
+        functions = _load_children(RCMFunction, RCMFunction.unit_id, [u.id for u in units])
+        function_ids = [f.id for group in functions.values() for f in group]
+
+        failures = _load_children(RCMFunctionalFailure, RCMFunctionalFailure.function_id, function_ids)
+        failure_ids = [f.id for group in failures.values() for f in group]
+
+        modes = _load_children(RCMFailureMode, RCMFailureMode.functional_failure_id, failure_ids)
+        mode_ids = [m.id for group in modes.values() for m in group]
+
+        effects = _load_children(RCMFailureEffect, RCMFailureEffect.failure_mode_id, mode_ids)
+        actions = _load_children(RCMMaintenance, RCMMaintenance.failure_mode_id, mode_ids)
+
+        return [{
+            'id': unit.id,
+            'name': unit.name,
+            'description': unit.description,
+            'equipment_id': unit.equipment_id,
+            'equipment_name': equipment_name,
+            'technical_id': unit.technical_id,
+            'functions': [{
+                'id': function.id,
+                'name': function.name,
+                'description': function.description,
+                'technical_id': function.technical_id,
+                'unit_id': function.unit_id,
+                'functional_failures': [{
+                    'id': failure.id,
+                    'name': failure.name,
+                    'description': failure.description,
+                    'failure_modes': [{
+                        'id': mode.id,
+                        'name': mode.name,
+                        'description': mode.description,
+                        'failure_type': mode.failure_type,
+                        'detection_method': mode.detection_method,
+                        'effects': [{
+                            'id': effect.id,
+                            'description': effect.description,
+                            'severity': effect.severity,
+                            'safety_impact': effect.safety_impact,
+                            'environmental_impact': effect.environmental_impact,
+                            'operational_impact': effect.operational_impact,
+                            'economic_impact': effect.economic_impact
+                        } for effect in effects[mode.id]],
+                        'maintenance_actions': [{
+                            'id': action.id,
+                            'title': action.title,
+                            'description': action.description,
+                            'maintenance_type': action.maintenance_type,
+                            'interval_days': action.interval_days,
+                            'interval_hours': action.interval_hours,
+                            'maintenance_strategy': action.maintenance_strategy
+                        } for action in actions[mode.id]]
+                    } for mode in modes[failure.id]]
+                } for failure in failures[function.id]]
+            } for function in functions[unit.id]]
+        } for unit in units]
+
+# Keep the revisions current from the ORM
+
+def _affected_equipment(connection, objects):
+    """Machines whose analysis the changed objects belong to, None when that can't be told"""
+    equipment = set()
+    pending = defaultdict(set)
+    for obj in objects:
+        state = sa_inspect(obj)
+        attribute, parent = _PARENTS.get(type(obj), ('equipment_id', None))
+        # Only look at what is loaded, a lazy load in the middle of a flush could hit a deleted row
+        if attribute not in state.dict:
+            return None
+        history = state.attrs[attribute].history
+        if parent is None:
+            equipment.update(e for e in chain(history.added, history.unchanged, history.deleted) if e is not None)
+            continue
+        # Moved to another parent, the old machine isn't known anymore
+        if history.deleted or state.dict[attribute] is None:
+            return None
+        pending[parent].add(state.dict[attribute])
+
+    # Walk up one level at a time, one query per level
+    for model in (RCMFailureMode, RCMFunctionalFailure, RCMFunction, RCMUnit):
+        ids = pending.pop(model, None)
+        if not ids:
+            continue
+        column = RCMUnit.equipment_id if model is RCMUnit else getattr(model, _PARENTS[model][0])
+        rows = connection.execute(select(model.id, column).where(model.id.in_(ids))).all()
+        # A parent deleted in the same flush
+        if len(rows) < len(ids):
+            return None
+        if model is RCMUnit:
+            equipment.update(e for _, e in rows if e is not None)
+        else:
+            pending[_PARENTS[model][1]].update(parent_id for _, parent_id in rows)
+    return equipment
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_rcm_revisions(session, flush_context):
+    changed = [obj for obj in chain(session.new, session.deleted) if isinstance(obj, RCM_MODELS)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, RCM_MODELS) and session.is_modified(obj, include_collections=False)]
+
+    # The machine name is part of the analysis
+    machines = {obj.id for obj in session.deleted if isinstance(obj, Machine)}
+    machines.update(obj.id for obj in session.dirty
+                    if isinstance(obj, Machine) and sa_inspect(obj).attrs.name.history.has_changes())
+
+    if not changed and not machines:
+        return
+    connection = session.connection()
+    equipment = _affected_equipment(connection, changed)
+    bump_rcm_revision(connection, None if equipment is None else equipment | machines)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_dml_rcm_revisions(orm_execute_state):
+    # Bulk statements don't say which machines they touch
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.statement.table.name in {model.__tablename__ for model in RCM_MODELS}:
+        bump_rcm_revision(orm_execute_state.session.connection())
@@ -0,0 +1,68 @@
+"""
+Query count benchmark for the RCM analysis tree
+"""
+# Seeds RCM trees of growing size into a scratch database and records how many
+# queries RCMAnalysisService.build_tree issues for each. The count has to stay
+# the same whatever the size, anything else means a per-node query crept back in.
+from backend.database import db
+from backend.services.query_counter import track_queries
+from backend.services.rcm_analysis import RCMAnalysisService
+
+def _seed_tree(machine_id, units, fanout):
+    """Insert units with fanout children at every level below, returns the number of nodes"""
+    from backend.models.rcm import RCMUnit, RCMFunction, RCMFunctionalFailure, RCMFailureMode, RCMFailureEffect, RCMMaintenance
+
+    nodes = 0
+    for u in range(units):
+        unit = RCMUnit(name=f'Unit {u}', equipment_id=machine_id, technical_id=f'{machine_id}.{u:02d}')
+        db.session.add(unit)
+        db.session.flush()
+        nodes += 1
+        for f in range(fanout):
+            function = RCMFunction(name=f'Function {u}.{f}', equipment_id=machine_id, unit_id=unit.id)
+            db.session.add(function)
+            db.session.flush()
+            nodes += 1
+            for ff in range(fanout):
+                failure = RCMFunctionalFailure(name=f'Failure {u}.{f}.{ff}', function_id=function.id)
+                db.session.add(failure)
+                db.session.flush()
+                nodes += 1
+                for m in range(fanout):
+                    mode = RCMFailureMode(name=f'Mode {u}.{f}.{ff}.{m}', functional_failure_id=failure.id)
+                    db.session.add(mode)
+                    db.session.flush()
+                    db.session.add(RCMFailureEffect(description='Benchmark effect', severity='Low',
+                                                    failure_mode_id=mode.id))
+                    db.session.add(RCMMaintenance(title='Benchmark action', maintenance_type='preventive',
+                                                  interval_days=30, failure_mode_id=mode.id))
+                    nodes += 3
+    db.session.commit()
+    return nodes
+
+def run_rcm_analysis_benchmark(sizes=((1, 1), (2, 2), (4, 3), (8, 4))):
+    """
+    Build the analysis tree for machines with RCM trees of the given (units, fanout)
+
+    Returns:
+        List of dicts with the tree size, query count and duration of each run
+    """
+    from backend.models.machine import Machine
+
+    report = []
+    for index, (units, fanout) in enumerate(sizes):
+        machine = Machine(name=f'Benchmark machine {index}', location='Benchmark',
+                          technical_id=f'{8000 + index}', qr_code=f'benchmark-qr-{index}')
+        db.session.add(machine)
+        db.session.flush()
+        machine_id = machine.id
+        nodes = _seed_tree(machine_id, units, fanout)
+
+        # Start from an empty identity map so nothing is served without a query
+        db.session.expunge_all()
+        with track_queries() as stats:
+            tree = RCMAnalysisService.build_tree(machine_id)
+
+        report.append({'units': len(tree), 'nodes': nodes, **stats.as_dict()})
+
+    return report
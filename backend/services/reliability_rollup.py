@@ -0,0 +1,343 @@
+"""
+Incremental upkeep of the daily reliability rollups
+"""
+# Failure rates, uptime, MTBF/MTTR and work order statistics used to
+# re-aggregate every maintenance log, failure and work order in the requested
+# range on each call. They now sum reliability_daily instead, which holds one
+# row per day and machine/subsystem/component, so a report costs the number
+# of days in its range rather than the amount of history behind it.
+#
+# A flush that writes a log, failure or work order recomputes the
+# (machine, day) buckets it touched from the source tables. Recomputing
+# rather than adding deltas keeps updates and deletes simple: moving a log to
+# another day or completing an order just refreshes the old and new buckets.
+# Bulk writes that skip the flush call refresh() themselves. A refresh that
+# touches the last 30 days also updates the dashboard summary row.
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import event, select, func, case, and_, or_, true, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from backend.database import db
+from backend.models.machine import Machine
+from backend.models.work_order import WorkOrder
+from backend.models.maintenance_log import MaintenanceLog
+from backend.models.failure import Failure
+from backend.models.reliability_rollup import ReliabilityDaily, MachineHoursDaily
+from backend.services.rcm_analysis import IN_CHUNK_SIZE
+from backend.services.dashboard_summary import DashboardSummaryService
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('minor', 'major', 'critical')
+WORK_ORDER_STATUSES = ('open', 'in_progress', 'completed')
+WORK_ORDER_TYPES = ('preventive', 'predictive', 'corrective')
+
+# Keys refreshed per pass, each one adds a few parameters to every statement
+REFRESH_CHUNK_SIZE = 200
+
+# Attributes that move a row to another bucket or change what it counts for
+LOG_FIELDS = ('machine_id', 'subsystem_id', 'component_id', 'timestamp', 'work_order_id')
+FAILURE_FIELDS = ('maintenance_log_id', 'severity')
+WORK_ORDER_FIELDS = ('machine_id', 'subsystem_id', 'component_id', 'created_at', 'status', 'type', 'downtime_hours')
+
+def day_of(value):
+    """UTC calendar day of a timestamp, naive values are taken as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+def _day_start(day):
+    return datetime.combine(day, time.min)
+
+def _empty_bucket():
+    return {
+        'failure_count': 0, 'failures_minor': 0, 'failures_major': 0, 'failures_critical': 0,
+        'repaired_failure_count': 0, 'first_failure_at': None, 'last_failure_at': None,
+        'repair_count': 0, 'repair_hours': 0.0,
+        'work_orders_total': 0, 'work_orders_open': 0, 'work_orders_in_progress': 0,
+        'work_orders_completed': 0, 'work_orders_preventive': 0, 'work_orders_predictive': 0,
+        'work_orders_corrective': 0, 'downtime_hours': 0.0
+    }
+
+def _collect(connection, log_filter, order_filter):
+    """(machine_id, day, subsystem_id, component_id) -> rollup values, from the source tables"""
+    buckets = defaultdict(_empty_bucket)
+
+    log_day = func.date(MaintenanceLog.timestamp)
+    log_key = (MaintenanceLog.machine_id, log_day, MaintenanceLog.subsystem_id, MaintenanceLog.component_id)
+
+    failures = connection.execute(
+        select(*log_key, Failure.severity, func.count(Failure.id))
+        .join(Failure, Failure.maintenance_log_id == MaintenanceLog.id)
+        .where(log_filter)
+        .group_by(*log_key, Failure.severity)
+    ).all()
+    for machine_id, day, subsystem_id, component_id, severity, count in failures:
+        bucket = buckets[(machine_id, day, subsystem_id, component_id)]
+        bucket['failure_count'] += count
+        if severity in SEVERITIES:
+            bucket[f'failures_{severity}'] += count
+
+    # Only failures on completed orders count towards MTBF/MTTR
+    has_downtime = and_(WorkOrder.downtime_hours.isnot(None), WorkOrder.downtime_hours != 0)
+    repaired = connection.execute(
+        select(
+            *log_key,
+            func.count(Failure.id),
+            func.min(MaintenanceLog.timestamp),
+            func.max(MaintenanceLog.timestamp),
+            func.sum(case((has_downtime, 1), else_=0)),
+            func.sum(case((has_downtime, WorkOrder.downtime_hours), else_=0))
+        )
+        .join(Failure, Failure.maintenance_log_id == MaintenanceLog.id)
+        .join(WorkOrder, WorkOrder.id == MaintenanceLog.work_order_id)
+        .where(log_filter, WorkOrder.status == 'completed')
+        .group_by(*log_key)
+    ).all()
+    for machine_id, day, subsystem_id, component_id, count, first_at, last_at, repairs, hours in repaired:
+        bucket = buckets[(machine_id, day, subsystem_id, component_id)]
+        bucket['repaired_failure_count'] = count
+        bucket['first_failure_at'] = first_at
+        bucket['last_failure_at'] = last_at
+        bucket['repair_count'] = repairs or 0
+        bucket['repair_hours'] = hours or 0.0
+
+    order_day = func.date(WorkOrder.created_at)
+    order_key = (WorkOrder.machine_id, order_day, WorkOrder.subsystem_id, WorkOrder.component_id)
+    orders = connection.execute(
+        select(*order_key, WorkOrder.type, WorkOrder.status, func.count(WorkOrder.id), func.sum(WorkOrder.downtime_hours))
+        .where(order_filter)
+        .group_by(*order_key, WorkOrder.type, WorkOrder.status)
+    ).all()
+    for machine_id, day, subsystem_id, component_id, wo_type, status, count, downtime in orders:
+        bucket = buckets[(machine_id, day, subsystem_id, component_id)]
+        bucket['work_orders_total'] += count
+        if wo_type in WORK_ORDER_TYPES:
+            bucket[f'work_orders_{wo_type}'] += count
+        if status in WORK_ORDER_STATUSES:
+            bucket[f'work_orders_{status}'] += count
+        if status == 'completed':
+            bucket['downtime_hours'] += downtime or 0
+
+    return {
+        (machine_id, date.fromisoformat(day), subsystem_id, component_id): values
+        for (machine_id, day, subsystem_id, component_id), values in buckets.items()
+        if day is not None
+    }
+
+def _rows(buckets):
+    return [
+        {'machine_id': machine_id, 'day': day, 'subsystem_id': subsystem_id, 'component_id': component_id, **values}
+        for (machine_id, day, subsystem_id, component_id), values in buckets.items()
+    ]
+
+def _days_filter(machine_column, time_column, days_by_machine):
+    """Rows of the given machines that fall on one of their days"""
+    return or_(*(
+        and_(machine_column == machine_id, or_(*(
+            and_(time_column >= _day_start(day), time_column < _day_start(day + timedelta(days=1)))
+            for day in sorted(days)
+        )))
+        for machine_id, days in days_by_machine.items()
+    ))
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class ReliabilityRollupService:
+    @staticmethod
+    def refresh(connection=None, keys=()):
+        """
+        Recompute the rollup rows of a set of (machine_id, day) buckets
+
+        Args:
+            connection: Connection to write on, defaults to the session's
+            keys: (machine_id, date) pairs, the days are UTC
+
+        Returns:
+            Number of rollup rows written
+        """
+        connection = connection if connection is not None else db.session.connection()
+        table = ReliabilityDaily.__table__
+        keys = {(machine_id, day) for machine_id, day in keys if machine_id is not None and day is not None}
+
+        written = 0
+        for chunk in _chunks(sorted(keys), REFRESH_CHUNK_SIZE):
+            days_by_machine = defaultdict(set)
+            for machine_id, day in chunk:
+                days_by_machine[machine_id].add(day)
+
+            buckets = _collect(
+                connection,
+                _days_filter(MaintenanceLog.machine_id, MaintenanceLog.timestamp, days_by_machine),
+                _days_filter(WorkOrder.machine_id, WorkOrder.created_at, days_by_machine)
+            )
+            connection.execute(table.delete().where(or_(*(
+                and_(table.c.machine_id == machine_id, table.c.day.in_(sorted(days)))
+                for machine_id, days in days_by_machine.items()
+            ))))
+            rows = _rows(buckets)
+            if rows:
+                connection.execute(table.insert(), rows)
+            written += len(rows)
+
+        if DashboardSummaryService.affects(day for _, day in keys):
+            DashboardSummaryService.refresh(connection)
+        return written
+
+    @staticmethod
+    def refresh_work_orders(connection=None, work_order_ids=()):
+        """Recompute the buckets of work orders changed by a bulk UPDATE, and of their logs"""
+        connection = connection if connection is not None else db.session.connection()
+        return ReliabilityRollupService.refresh(connection, _work_order_keys(connection, work_order_ids))
+
+    @staticmethod
+    def work_order_keys(work_orders):
+        """Buckets of freshly inserted work orders, for bulk inserts"""
+        return {(wo.machine_id, day_of(wo.created_at)) for wo in work_orders}
+
+    @staticmethod
+    def rebuild(engine=None):
+        """Recompute every rollup row from the maintenance logs, failures and work orders"""
+        engine = engine or db.engine
+        table = ReliabilityDaily.__table__
+        with engine.begin() as connection:
+            connection.execute(table.delete())
+            rows = _rows(_collect(connection, true(), true()))
+            if rows:
+                connection.execute(table.insert(), rows)
+            DashboardSummaryService.refresh(connection)
+        return len(rows)
+
+    @staticmethod
+    def ensure_populated(engine=None):
+        """Fill the table on databases that had history before it existed"""
+        engine = engine or db.engine
+        with engine.connect() as connection:
+            has_rollups = connection.execute(select(ReliabilityDaily.id).limit(1)).first() is not None
+            has_history = (
+                connection.execute(select(MaintenanceLog.id).limit(1)).first() is not None
+                or connection.execute(select(WorkOrder.id).limit(1)).first() is not None
+            )
+        if has_rollups or not has_history:
+            return 0
+        count = ReliabilityRollupService.rebuild(engine=engine)
+        logger.info(f"Computed {count} daily reliability rollup rows")
+        return count
+
+    @staticmethod
+    def record_hours(connection, machine_id, hours, day=None):
+        """Add operating hours to a machine's total for the day, today by default"""
+        table = MachineHoursDaily.__table__
+        day = day or datetime.now(timezone.utc).date()
+        result = connection.execute(
+            table.update()
+            .where(table.c.machine_id == machine_id, table.c.day == day)
+            .values(hours=table.c.hours + hours)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(machine_id=machine_id, day=day, hours=hours))
+
+def _log_keys(connection, log_ids=(), failure_ids=()):
+    """(machine, day) buckets of the given logs and of the logs of the given failures"""
+    keys = set()
+    for chunk in _chunks(log_ids, IN_CHUNK_SIZE):
+        rows = connection.execute(
+            select(MaintenanceLog.machine_id, MaintenanceLog.timestamp).where(MaintenanceLog.id.in_(chunk))
+        ).all()
+        keys.update((machine_id, day_of(timestamp)) for machine_id, timestamp in rows)
+    for chunk in _chunks(failure_ids, IN_CHUNK_SIZE):
+        rows = connection.execute(
+            select(MaintenanceLog.machine_id, MaintenanceLog.timestamp)
+            .join(Failure, Failure.maintenance_log_id == MaintenanceLog.id)
+            .where(Failure.id.in_(chunk))
+        ).all()
+        keys.update((machine_id, day_of(timestamp)) for machine_id, timestamp in rows)
+    return keys
+
+def _work_order_keys(connection, work_order_ids):
+    """(machine, day) buckets of the given orders and of the logs written against them"""
+    keys = set()
+    for chunk in _chunks(work_order_ids, IN_CHUNK_SIZE):
+        orders = connection.execute(
+            select(WorkOrder.machine_id, WorkOrder.created_at).where(WorkOrder.id.in_(chunk))
+        ).all()
+        logs = connection.execute(
+            select(MaintenanceLog.machine_id, MaintenanceLog.timestamp).where(MaintenanceLog.work_order_id.in_(chunk))
+        ).all()
+        keys.update((machine_id, day_of(at)) for machine_id, at in orders + logs)
+    return keys
+
+# Keep the rollups current from the ORM
+
+_PENDING = 'reliability_rollup_keys'
+
+def _changed(obj, fields):
+    state = sa_inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+@event.listens_for(Session, 'before_flush')
+def _note_changed(session, flush_context, instances):
+    # The buckets updated and deleted rows are in now. Read from the database
+    # before the flush, the old values of attributes that were assigned
+    # without being loaded first are not kept in the attribute history.
+    log_ids, failure_ids, work_order_ids = set(), set(), set()
+    keys = session.info.setdefault(_PENDING, set())
+
+    for obj in session.dirty:
+        if isinstance(obj, MaintenanceLog) and _changed(obj, LOG_FIELDS):
+            log_ids.add(obj.id)
+            keys.add((obj.machine_id, day_of(obj.timestamp)))
+        elif isinstance(obj, Failure) and _changed(obj, FAILURE_FIELDS):
+            failure_ids.add(obj.id)
+            log_ids.add(obj.maintenance_log_id)
+        elif isinstance(obj, WorkOrder) and _changed(obj, WORK_ORDER_FIELDS):
+            # Completing an order or changing its downtime also changes the MTBF/MTTR of its logs
+            work_order_ids.add(obj.id)
+            keys.add((obj.machine_id, day_of(obj.created_at)))
+
+    for obj in session.deleted:
+        if isinstance(obj, MaintenanceLog):
+            log_ids.add(obj.id)
+        elif isinstance(obj, Failure):
+            failure_ids.add(obj.id)
+        elif isinstance(obj, WorkOrder):
+            work_order_ids.add(obj.id)
+
+    if log_ids or failure_ids or work_order_ids:
+        connection = session.connection()
+        keys.update(_log_keys(connection, log_ids - {None}, failure_ids))
+        keys.update(_work_order_keys(connection, work_order_ids))
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_flushed(session, flush_context):
+    # New rows only have their default timestamps and foreign keys once flushed
+    keys = session.info.pop(_PENDING, set())
+    log_ids = set()
+    for obj in session.new:
+        if isinstance(obj, MaintenanceLog):
+            keys.add((obj.machine_id, day_of(obj.timestamp)))
+        elif isinstance(obj, Failure):
+            log_ids.add(obj.maintenance_log_id)
+        elif isinstance(obj, WorkOrder):
+            keys.add((obj.machine_id, day_of(obj.created_at)))
+
+    if log_ids:
+        keys.update(_log_keys(session.connection(), log_ids - {None}))
+    if keys:
+        ReliabilityRollupService.refresh(session.connection(), keys)
+
+@event.listens_for(Machine, 'after_update')
+def _hour_counter_moved(mapper, connection, target):
+    history = sa_inspect(target).attrs.hour_counter.history
+    # Nothing to compare with when the old value was never loaded
+    if not history.added or not history.deleted:
+        return
+    delta = (history.added[0] or 0) - (history.deleted[0] or 0)
+    if delta:
+        ReliabilityRollupService.record_hours(connection, target.id, delta)
@@ -0,0 +1,302 @@
+"""
+Full-text search over work orders, maintenance logs and failures
+"""
+# Backed by an SQLite FTS5 table. Rows are written by mapper events in the
+# same transaction as the change to the source row. Bulk INSERT/UPDATE
+# statements skip those events, so code issuing them has to index the rows
+# itself with index_new_work_orders or reindex_work_orders.
+# The FTS rowid encodes the entity type and id, which keeps updates and
+# deletes to a primary key lookup instead of a scan of the index.
+import logging
+import re
+from sqlalchemy import event, text, select
+from backend.database import db
+from backend.models.work_order import WorkOrder
+from backend.models.maintenance_log import MaintenanceLog
+from backend.models.failure import Failure
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'search_index'
+
+# entity_type -> code stored in the low bits of the rowid
+ENTITY_CODES = {
+    'work_order': 1,
+    'maintenance_log': 2,
+    'failure': 3
+}
+ROWID_FACTOR = 4
+
+# Set by ensure_search_index, the hooks do nothing when SQLite lacks FTS5
+search_index_enabled = False
+
+_CREATE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    title,
+    body,
+    entity_type UNINDEXED,
+    entity_id UNINDEXED,
+    machine_id UNINDEXED,
+    kind UNINDEXED,
+    occurred_at UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+def _rowid(entity_type, entity_id):
+    return entity_id * ROWID_FACTOR + ENTITY_CODES[entity_type]
+
+def _format_time(value):
+    # Stored as text so the date filters can compare strings
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+def _join_text(*parts):
+    return '\n'.join(part for part in parts if part)
+
+def _work_order_entry(work_order):
+    return {
+        'title': work_order.title,
+        'body': _join_text(work_order.description, work_order.reason),
+        'machine_id': work_order.machine_id,
+        'kind': work_order.type,
+        'occurred_at': _format_time(work_order.created_at)
+    }
+
+def _maintenance_log_entry(log):
+    return {
+        'title': log.maintenance_category,
+        'body': log.description,
+        'machine_id': log.machine_id,
+        'kind': log.maintenance_type,
+        'occurred_at': _format_time(log.timestamp)
+    }
+
+def _failure_entry(failure, connection):
+    # Machine and time come from the maintenance log the failure was reported in
+    log = connection.execute(
+        select(MaintenanceLog.machine_id, MaintenanceLog.timestamp)
+        .where(MaintenanceLog.id == failure.maintenance_log_id)
+    ).first()
+    return {
+        'title': None,
+        'body': _join_text(failure.description, failure.resolution),
+        'machine_id': log.machine_id if log else None,
+        'kind': failure.severity,
+        'occurred_at': _format_time(log.timestamp) if log else None
+    }
+
+def index_entity(connection, entity_type, entity_id, entry):
+    """Insert or replace the index row of one entity"""
+    rowid = _rowid(entity_type, entity_id)
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"), {'rowid': rowid})
+    connection.execute(
+        text(f"""
+            INSERT INTO {SEARCH_TABLE} (rowid, title, body, entity_type, entity_id, machine_id, kind, occurred_at)
+            VALUES (:rowid, :title, :body, :entity_type, :entity_id, :machine_id, :kind, :occurred_at)
+        """),
+        {'rowid': rowid, 'entity_type': entity_type, 'entity_id': entity_id, **entry}
+    )
+
+def remove_entity(connection, entity_type, entity_id):
+    """Drop the index row of one entity"""
+    connection.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"),
+        {'rowid': _rowid(entity_type, entity_id)}
+    )
+
+# Work order columns that end up in the index
+WORK_ORDER_INDEXED_FIELDS = {'title', 'description', 'reason', 'type', 'machine_id', 'created_at'}
+
+def reindex_work_orders(connection, work_order_ids):
+    """Index work orders again from their current rows, after a bulk update"""
+    if not search_index_enabled or not work_order_ids:
+        return
+    work_orders = connection.execute(
+        select(WorkOrder.__table__).where(WorkOrder.id.in_(list(work_order_ids)))
+    ).all()
+    for work_order in work_orders:
+        index_entity(connection, 'work_order', work_order.id, _work_order_entry(work_order))
+
+def index_new_work_orders(connection, work_orders):
+    """Index work orders written with a bulk insert, in one statement"""
+    if not search_index_enabled or not work_orders:
+        return
+    rows = [{'rowid': _rowid('work_order', wo.id), 'entity_type': 'work_order', 'entity_id': wo.id,
+             **_work_order_entry(wo)} for wo in work_orders]
+    # SQLite reuses the ids of deleted rows, clear anything a bulk delete left behind
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"), rows)
+    connection.execute(
+        text(f"""
+            INSERT INTO {SEARCH_TABLE} (rowid, title, body, entity_type, entity_id, machine_id, kind, occurred_at)
+            VALUES (:rowid, :title, :body, :entity_type, :entity_id, :machine_id, :kind, :occurred_at)
+        """),
+        rows
+    )
+
+def _reindex_failures_of_log(connection, log):
+    # A failure's machine and time are copied from its log, keep them in step
+    failures = connection.execute(
+        select(Failure.__table__).where(Failure.maintenance_log_id == log.id)
+    ).all()
+    for failure in failures:
+        index_entity(connection, 'failure', failure.id, _failure_entry(failure, connection))
+
+def _index_listener(entity_type, build_entry):
+    def listener(mapper, connection, target):
+        if search_index_enabled:
+            index_entity(connection, entity_type, target.id, build_entry(target, connection))
+    return listener
+
+def _remove_listener(entity_type):
+    def listener(mapper, connection, target):
+        if search_index_enabled:
+            remove_entity(connection, entity_type, target.id)
+    return listener
+
+_SOURCES = [
+    ('work_order', WorkOrder, lambda target, connection: _work_order_entry(target)),
+    ('maintenance_log', MaintenanceLog, lambda target, connection: _maintenance_log_entry(target)),
+    ('failure', Failure, _failure_entry),
+]
+
+for _entity_type, _model, _build_entry in _SOURCES:
+    event.listen(_model, 'after_insert', _index_listener(_entity_type, _build_entry))
+    event.listen(_model, 'after_update', _index_listener(_entity_type, _build_entry))
+    event.listen(_model, 'after_delete', _remove_listener(_entity_type))
+
+@event.listens_for(MaintenanceLog, 'after_update')
+def _maintenance_log_updated(mapper, connection, target):
+    if search_index_enabled:
+        _reindex_failures_of_log(connection, target)
+
+def rebuild_search_index(engine=None):
+    """Drop and refill the index from the source tables, returns the number of rows indexed"""
+    engine = engine or db.engine
+    count = 0
+    with engine.begin() as connection:
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+
+        for work_order in connection.execute(select(WorkOrder.__table__)).all():
+            index_entity(connection, 'work_order', work_order.id, _work_order_entry(work_order))
+            count += 1
+
+        for log in connection.execute(select(MaintenanceLog.__table__)).all():
+            index_entity(connection, 'maintenance_log', log.id, _maintenance_log_entry(log))
+            count += 1
+
+        for failure in connection.execute(select(Failure.__table__)).all():
+            index_entity(connection, 'failure', failure.id, _failure_entry(failure, connection))
+            count += 1
+
+    return count
+
+def ensure_search_index(engine=None):
+    """Create the FTS table if it is missing and fill it from existing rows"""
+    global search_index_enabled
+    engine = engine or db.engine
+
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first() is not None
+        if not exists:
+            try:
+                connection.execute(text(_CREATE_SQL))
+            except Exception as e:
+                logger.warning(f"Full-text search disabled, FTS5 is not available: {e}")
+                search_index_enabled = False
+                return False
+
+    search_index_enabled = True
+    if not exists:
+        logger.info(f"Indexed {rebuild_search_index(engine)} rows for search")
+    return not exists
+
+def build_match_query(query):
+    """
+    Turn free text from the user into a safe FTS5 MATCH expression
+
+    Every word must match, the last one as a prefix so results show up while typing.
+    """
+    words = re.findall(r'\w+', query, flags=re.UNICODE)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search(query, machine_id=None, entity_types=None, kind=None, start_date=None, end_date=None,
+           limit=20, highlight=('<mark>', '</mark>'), assigned_to=None):
+    """
+    Ranked search with snippets
+
+    Args:
+        query: Free text entered by the user
+        machine_id: Only results for this machine
+        entity_types: Only these of 'work_order', 'maintenance_log', 'failure'
+        kind: Work order type, maintenance type or failure severity
+        start_date, end_date: Only results in this period
+        limit: Maximum number of results
+        assigned_to: Only work orders assigned to this user, for workers
+
+    Returns:
+        List of result dicts, best match first
+    """
+    match = build_match_query(query)
+    if match is None:
+        return []
+
+    conditions = [f"{SEARCH_TABLE} MATCH :match"]
+    params = {'match': match, 'limit': limit, 'open': highlight[0], 'close': highlight[1]}
+
+    if machine_id is not None:
+        conditions.append("machine_id = :machine_id")
+        params['machine_id'] = machine_id
+    if entity_types:
+        placeholders = []
+        for i, entity_type in enumerate(entity_types):
+            placeholders.append(f":entity_type_{i}")
+            params[f"entity_type_{i}"] = entity_type
+        conditions.append(f"entity_type IN ({', '.join(placeholders)})")
+    if kind:
+        conditions.append("kind = :kind")
+        params['kind'] = kind
+    if assigned_to is not None:
+        # Filtered here rather than after the query so LIMIT still counts visible rows
+        conditions.append(
+            f"(entity_type != 'work_order' OR entity_id IN "
+            f"(SELECT id FROM {WorkOrder.__table__.name} WHERE assigned_to = :assigned_to))"
+        )
+        params['assigned_to'] = assigned_to
+    if start_date:
+        conditions.append("occurred_at >= :start_date")
+        params['start_date'] = _format_time(start_date)
+    if end_date:
+        conditions.append("occurred_at <= :end_date")
+        params['end_date'] = _format_time(end_date)
+
+    # Title matches weigh more than matches in the longer body text
+    rows = db.session.execute(text(f"""
+        SELECT entity_type, entity_id, machine_id, kind, occurred_at,
+               snippet({SEARCH_TABLE}, 0, :open, :close, '…', 12) AS title_snippet,
+               snippet({SEARCH_TABLE}, 1, :open, :close, '…', 24) AS body_snippet,
+               bm25({SEARCH_TABLE}, 5.0, 1.0) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY score
+        LIMIT :limit
+    """), params).all()
+
+    return [{
+        'type': row.entity_type,
+        'id': int(row.entity_id),
+        'machine_id': int(row.machine_id) if row.machine_id is not None else None,
+        'kind': row.kind,
+        'occurred_at': row.occurred_at,
+        'title': row.title_snippet,
+        'snippet': row.body_snippet,
+        # bm25 is lower for better matches, flip it so higher is better for clients
+        'score': round(-row.score, 4)
+    } for row in rows]
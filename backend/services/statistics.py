@@ -1,23 +1,75 @@
 """
 Statistical analysis functions
 """
+# The sums come from the daily rollups in reliability_daily (kept current by
+# services/reliability_rollup.py), so the date range is resolved to whole
+# UTC days: start_date and end_date select the days they fall on, both included.
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, timezone
-from backend.models.maintenance_log import MaintenanceLog
-from backend.models.work_order import WorkOrder
-from backend.models.failure import Failure
 from backend.models.machine import Machine,Subsystem, Component
-from sqlalchemy import func
+from backend.models.reliability_rollup import ReliabilityDaily, MachineHoursDaily
+from backend.services.reliability_rollup import day_of
+from backend.services.entity_lookup import EntityLookup
+from backend.services.mtbf_engine import MTBFEngine
+from sqlalchemy import func, select, literal, union_all
 from backend.database import db
 
+# Period start of a rollup day per timeseries granularity, as a 'YYYY-MM-DD' string.
+# Weeks start on Monday: 'weekday 0' moves to the coming Sunday, 6 days back is its Monday.
+TIMESERIES_BUCKETS = {
+    'day': lambda day: func.strftime('%Y-%m-%d', day),
+    'week': lambda day: func.date(day, 'weekday 0', '-6 days'),
+    'month': lambda day: func.strftime('%Y-%m-01', day),
+}
+TIMESERIES_LEVELS = ('machine', 'subsystem', 'component')
+TIMESERIES_METRICS = ('failures', 'downtime', 'work_orders', 'hours')
+
+def _bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    if granularity == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+def _bucket_range(first, last, granularity):
+    """Every bucket start from the one holding first to the one holding last"""
+    buckets = []
+    current = _bucket_start(first, granularity)
+    while current <= last:
+        buckets.append(current.isoformat())
+        current = _next_bucket(current, granularity)
+    return buckets
+
+def _in_days(query, start_date, end_date):
+    """Limit a rollup query to the days from start_date to end_date"""
+    if start_date:
+        query = query.filter(ReliabilityDaily.day >= day_of(start_date))
+    if end_date:
+        query = query.filter(ReliabilityDaily.day <= day_of(end_date))
+    return query
+
 class MaintenanceStatistics:
     @staticmethod
     def get_failure_rates(machine_id=None, subsystem_id=None, component_id=None, start_date=None, end_date=None):
         """
         Calculating failure rates for machines, subsystems, or components
-        depending on the ID 
+        depending on the ID
         """
+        failure_totals = (
+            func.sum(ReliabilityDaily.failure_count).label('failure_count'),
+            func.sum(ReliabilityDaily.failures_minor).label('minor'),
+            func.sum(ReliabilityDaily.failures_major).label('major'),
+            func.sum(ReliabilityDaily.failures_critical).label('critical')
+        )
+
         # Determine the level we're analyzing
         if component_id:
             # Component-level analysis
@@ -27,19 +79,18 @@ class MaintenanceStatistics:
                 Component.technical_id,
                 Subsystem.name.label('subsystem_name'),
                 Machine.name.label('machine_name'),
-                func.count(Failure.id).label('failure_count')
+                *failure_totals
             ).join(
-                MaintenanceLog, MaintenanceLog.component_id == Component.id
+                ReliabilityDaily, ReliabilityDaily.component_id == Component.id
             ).join(
                 Subsystem, Component.subsystem_id == Subsystem.id
             ).join(
                 Machine, Component.machine_id == Machine.id
-            ).join(
-                Failure, Failure.maintenance_log_id == MaintenanceLog.id
             ).filter(Component.id == component_id)
-            
+
             group_by = Component.id
-            
+            level = 'component'
+
         elif subsystem_id:
             # Subsystem-level analysis
             base_query = db.session.query(
@@ -47,149 +98,125 @@ class MaintenanceStatistics:
                 Subsystem.name,
                 Subsystem.technical_id,
                 Machine.name.label('machine_name'),
-                func.count(Failure.id).label('failure_count')
+                *failure_totals
             ).join(
-                MaintenanceLog, MaintenanceLog.subsystem_id == Subsystem.id
+                ReliabilityDaily, ReliabilityDaily.subsystem_id == Subsystem.id
             ).join(
                 Machine, Subsystem.machine_id == Machine.id
-            ).join(
-                Failure, Failure.maintenance_log_id == MaintenanceLog.id
             ).filter(Subsystem.id == subsystem_id)
-            
+
             group_by = Subsystem.id
-            
+            level = 'subsystem'
+
         else:
             # Machine-level analysis
             base_query = db.session.query(
                 Machine.id,
                 Machine.name,
                 Machine.technical_id,
-                func.count(Failure.id).label('failure_count')
+                *failure_totals
             ).join(
-                MaintenanceLog, MaintenanceLog.machine_id == Machine.id
-            ).join(
-                Failure, Failure.maintenance_log_id == MaintenanceLog.id
+                ReliabilityDaily, ReliabilityDaily.machine_id == Machine.id
             )
-            
+
             group_by = Machine.id
+            level = 'machine'
             if machine_id:
                 base_query = base_query.filter(Machine.id == machine_id)
-        
+
         # Common filters for all levels
-        if start_date:
-            base_query = base_query.filter(MaintenanceLog.timestamp >= start_date)
-        if end_date:
-            base_query = base_query.filter(MaintenanceLog.timestamp <= end_date)
-        
-        # Group by the appropriate level
-        results = base_query.group_by(group_by).all()
-        
+        base_query = _in_days(base_query, start_date, end_date)
+
+        # Group by the appropriate level, days with work orders but no failures have rollup rows too
+        results = base_query.group_by(group_by).having(func.sum(ReliabilityDaily.failure_count) > 0).all()
+
         # Process and format the results
         failure_rates = []
-    
+        entities = EntityLookup.for_level(level, [result.id for result in results])
+
         for result in results:
-            if component_id:
-                # Component-level results
-                component_id, component_name, technical_id, subsystem_name, machine_name, failure_count = result
-                
-                # Get the operating hours and machine settings
-                machine = Machine.query.get(Component.query.get(component_id).machine_id)
-                total_hours = machine.hour_counter if machine.hour_counter else 0
-                denominator = machine.failure_rate_denominator  # Get machine-specific setting
-                
-            elif subsystem_id:
-                # Subsystem-level results
-                subsystem_id, subsystem_name, technical_id, machine_name, failure_count = result
-                
-                # Get the operating hours and machine settings
-                machine = Machine.query.get(Subsystem.query.get(subsystem_id).machine_id)
-                total_hours = machine.hour_counter if machine.hour_counter else 0
-                denominator = machine.failure_rate_denominator  # Get machine-specific setting
-                
-            else:
-                # Machine-level results
-                machine_id, machine_name, technical_id, failure_count = result
-                
-                # Get the operating hours and machine settings
-                machine = Machine.query.get(machine_id)
-                total_hours = machine.hour_counter if machine.hour_counter else 0
-                denominator = machine.failure_rate_denominator  # Get machine-specific setting
-            
+            # Get the operating hours and machine settings
+            machine = entities.machine_of(level, result.id)
+            total_hours = machine.hour_counter if machine.hour_counter else 0
+            denominator = machine.failure_rate_denominator  # Get machine-specific setting
+
             # Calculate failure rate using the machine-specific denominator
+            failure_count = result.failure_count
             failure_rate = round((failure_count / total_hours * denominator) if total_hours > 0 else 0, 2)
-            
+
             # Add to results with appropriate information
             result_dict = {
-                'level': 'component' if component_id else 'subsystem' if subsystem_id else 'machine',
-                'id': component_id or subsystem_id or machine_id,
-                'name': component_name or subsystem_name or machine_name,
-                'technical_id': technical_id,
+                'level': level,
+                'id': result.id,
+                'name': result.name,
+                'technical_id': result.technical_id,
                 'failure_count': failure_count,
+                'failures_by_severity': {
+                    'minor': result.minor,
+                    'major': result.major,
+                    'critical': result.critical
+                },
                 'operation_hours': total_hours,
                 'failure_rate_per_x_hours': failure_rate,
                 'denominator': denominator,
                 'rate_description': f"{failure_rate} failures per {denominator} hours"
             }
-            
+
             # Add additional fields based on level
-            if component_id:
-                result_dict['subsystem_name'] = subsystem_name
-                result_dict['machine_name'] = machine_name
-            elif subsystem_id:
-                result_dict['machine_name'] = machine_name
-                
+            if level == 'component':
+                result_dict['subsystem_name'] = result.subsystem_name
+                result_dict['machine_name'] = result.machine_name
+            elif level == 'subsystem':
+                result_dict['machine_name'] = result.machine_name
+
             failure_rates.append(result_dict)
-    
+
         return failure_rates
     @staticmethod
     def get_uptime_statistics(machine_id=None, start_date=None, end_date=None):
         """Calculate uptime statistics for machines"""
-        # Query completed work orders that caused downtime
+        # Downtime of the completed work orders, per machine
         query = db.session.query(
-            WorkOrder.machine_id,
-            func.sum(WorkOrder.downtime_hours).label('total_downtime')
-        ).filter(
-            WorkOrder.status == 'completed'
+            ReliabilityDaily.machine_id,
+            func.sum(ReliabilityDaily.downtime_hours).label('total_downtime')
         ).group_by(
-            WorkOrder.machine_id
+            ReliabilityDaily.machine_id
+        ).having(
+            func.sum(ReliabilityDaily.work_orders_completed) > 0
+        ).order_by(
+            ReliabilityDaily.machine_id
         )
-        
+
         if machine_id:
-            query = query.filter(WorkOrder.machine_id == machine_id)
-            
-        if start_date:
-            query = query.filter(WorkOrder.created_at >= start_date)
-            
-        if end_date:
-            query = query.filter(WorkOrder.created_at <= end_date)
-            
-        # Note: This assumes we have a 'downtime_hours' field in WorkOrder model
-        # You would need to add this field or use a different approach
-        
+            query = query.filter(ReliabilityDaily.machine_id == machine_id)
+
+        query = _in_days(query, start_date, end_date)
+
         results = query.all()
-        
+        entities = EntityLookup(machine_ids=[result.machine_id for result in results])
+
         # Calculate time period for uptime calculation
         if not start_date:
             start_date = datetime.now(timezone.utc) - timedelta(days=30)  # Default to last 30 days
-            
+
         if not end_date:
             end_date = datetime.now(timezone.utc)
-            
+
         total_hours = (end_date - start_date).total_seconds() / 3600
-        
+
         uptime_stats = []
         for result in results:
             machine_id, total_downtime = result
-            
+
             # Get machine
-            machine = Machine.query.get(machine_id)
-            
+            machine = entities.machine(machine_id)
+
             if total_downtime is None:
                 total_downtime = 0
-                
+
             uptime_hours = total_hours - total_downtime
             uptime_percentage = (uptime_hours / total_hours * 100) if total_hours > 0 else 0
-            
+
             uptime_stats.append({
                 'machine_id': machine_id,
                 'machine_name': machine.name,
@@ -198,141 +225,276 @@ class MaintenanceStatistics:
                 'uptime_hours': round(uptime_hours, 1),
                 'uptime_percentage': round(uptime_percentage, 2)
             })
-        
+
         return uptime_stats
-    
+
     @staticmethod
-    def get_mtbf_mttr(machine_id=None, start_date=None, end_date=None):
-        """Calculate Mean Time Between Failures (MTBF) and Mean Time To Repair (MTTR)"""
-        # Query failures
-        failures_query = db.session.query(
-            MaintenanceLog.machine_id,
-            MaintenanceLog.timestamp,
-            WorkOrder.downtime_hours
-        ).join(
-            Failure, Failure.maintenance_log_id == MaintenanceLog.id
-        ).join(
-            WorkOrder, WorkOrder.id == MaintenanceLog.work_order_id
-        ).filter(
-            WorkOrder.status == 'completed'
+    def get_mtbf_mttr(machine_id=None, start_date=None, end_date=None, level='machine', trend_window_days=None):
+        """
+        Calculate Mean Time Between Failures (MTBF) and Mean Time To Repair (MTTR)
+
+        Per machine it is read from the rollups. Subsystem and component level
+        figures and rolling MTBF trends come from MTBFEngine, see mtbf_engine.py.
+        """
+        if level != 'machine' or trend_window_days:
+            return MTBFEngine.analyse(level, machine_id=machine_id, start_date=start_date, end_date=end_date,
+                                      trend_window_days=trend_window_days)
+
+        # Failures on completed work orders, per machine
+        query = db.session.query(
+            ReliabilityDaily.machine_id,
+            func.sum(ReliabilityDaily.repaired_failure_count).label('failure_count'),
+            func.min(ReliabilityDaily.first_failure_at).label('first_failure_at'),
+            func.max(ReliabilityDaily.last_failure_at).label('last_failure_at'),
+            func.sum(ReliabilityDaily.repair_count).label('repair_count'),
+            func.sum(ReliabilityDaily.repair_hours).label('repair_hours')
+        ).group_by(
+            ReliabilityDaily.machine_id
+        ).having(
+            func.sum(ReliabilityDaily.repaired_failure_count) >= 2  # Need at least 2 failures to calculate MTBF
         ).order_by(
-            MaintenanceLog.machine_id,
-            MaintenanceLog.timestamp
+            ReliabilityDaily.machine_id
         )
-        
+
         if machine_id:
-            failures_query = failures_query.filter(MaintenanceLog.machine_id == machine_id)
-            
-        if start_date:
-            failures_query = failures_query.filter(MaintenanceLog.timestamp >= start_date)
-            
-        if end_date:
-            failures_query = failures_query.filter(MaintenanceLog.timestamp <= end_date)
-            
-        failures = failures_query.all()
-        
-        # Group failures by machine
-        failures_by_machine = {}
-        for failure in failures:
-            machine_id, timestamp, downtime = failure
-            
-            if machine_id not in failures_by_machine:
-                failures_by_machine[machine_id] = []
-                
-            failures_by_machine[machine_id].append({
-                'timestamp': timestamp,
-                'downtime': downtime if downtime else 0
-            })
-        
+            query = query.filter(ReliabilityDaily.machine_id == machine_id)
+
+        query = _in_days(query, start_date, end_date)
+
+        results = query.all()
+        entities = EntityLookup(machine_ids=[result.machine_id for result in results])
+
         # Calculate MTBF and MTTR for each machine
         mtbf_mttr_stats = []
-        for machine_id, machine_failures in failures_by_machine.items():
-            machine = Machine.query.get(machine_id)
-            
-            if len(machine_failures) < 2:
-                continue  # Need at least 2 failures to calculate MTBF
-                
-            # Calculate time between failures
-            time_between_failures = []
-            for i in range(1, len(machine_failures)):
-                prev_failure = machine_failures[i-1]
-                curr_failure = machine_failures[i]
-                
-                hours_between = (curr_failure['timestamp'] - prev_failure['timestamp']).total_seconds() / 3600
-                time_between_failures.append(hours_between)
-            
-            # Calculate MTBF
-            mtbf = sum(time_between_failures) / len(time_between_failures) if time_between_failures else 0
-            
-            # Calculate MTTR
-            repair_times = [failure['downtime'] for failure in machine_failures if failure['downtime']]
-            mttr = sum(repair_times) / len(repair_times) if repair_times else 0
-            
+        for result in results:
+            machine = entities.machine(result.machine_id)
+
+            # The gaps between consecutive failures add up to the time from the first to the last
+            hours_between = (result.last_failure_at - result.first_failure_at).total_seconds() / 3600
+            mtbf = hours_between / (result.failure_count - 1)
+
+            # Only repairs that recorded downtime count
+            mttr = result.repair_hours / result.repair_count if result.repair_count else 0
+
             mtbf_mttr_stats.append({
-                'machine_id': machine_id,
+                'machine_id': result.machine_id,
                 'machine_name': machine.name,
-                'failure_count': len(machine_failures),
+                'failure_count': result.failure_count,
                 'mtbf_hours': round(mtbf, 2),
                 'mttr_hours': round(mttr, 2)
             })
-        
+
         return mtbf_mttr_stats
-    
+
     @staticmethod
     def generate_work_order_statistics(machine_id=None, start_date=None, end_date=None):
         """Generate statistics about work orders"""
-        # Query work orders
+        # Work orders created in the range, per machine
         query = db.session.query(
-            WorkOrder.machine_id,
-            WorkOrder.type,
-            WorkOrder.status,
-            func.count(WorkOrder.id).label('count')
+            ReliabilityDaily.machine_id,
+            func.sum(ReliabilityDaily.work_orders_total).label('total'),
+            func.sum(ReliabilityDaily.work_orders_preventive).label('preventive'),
+            func.sum(ReliabilityDaily.work_orders_predictive).label('predictive'),
+            func.sum(ReliabilityDaily.work_orders_corrective).label('corrective'),
+            func.sum(ReliabilityDaily.work_orders_open).label('open'),
+            func.sum(ReliabilityDaily.work_orders_in_progress).label('in_progress'),
+            func.sum(ReliabilityDaily.work_orders_completed).label('completed')
         ).group_by(
-            WorkOrder.machine_id,
-            WorkOrder.type,
-            WorkOrder.status
+            ReliabilityDaily.machine_id
+        ).having(
+            func.sum(ReliabilityDaily.work_orders_total) > 0
+        ).order_by(
+            ReliabilityDaily.machine_id
         )
-        
+
         if machine_id:
-            query = query.filter(WorkOrder.machine_id == machine_id)
-            
-        if start_date:
-            query = query.filter(WorkOrder.created_at >= start_date)
-            
-        if end_date:
-            query = query.filter(WorkOrder.created_at <= end_date)
-            
+            query = query.filter(ReliabilityDaily.machine_id == machine_id)
+
+        query = _in_days(query, start_date, end_date)
+
         results = query.all()
-        
+        entities = EntityLookup(machine_ids=[result.machine_id for result in results])
+
         # Organize results by machine
-        stats_by_machine = {}
+        stats_by_machine = []
         for result in results:
-            machine_id, wo_type, status, count = result
-            
-            if machine_id not in stats_by_machine:
-                stats_by_machine[machine_id] = {
-                    'machine_id': machine_id,
-                    'machine_name': Machine.query.get(machine_id).name,
-                    'total_work_orders': 0,
-                    'by_type': {
-                        'preventive': 0,
-                        'predictive': 0,
-                        'corrective': 0
-                    },
-                    'by_status': {
-                        'open': 0,
-                        'in_progress': 0,
-                        'completed': 0
-                    }
+            stats_by_machine.append({
+                'machine_id': result.machine_id,
+                'machine_name': entities.machine(result.machine_id).name,
+                'total_work_orders': result.total,
+                'by_type': {
+                    'preventive': result.preventive,
+                    'predictive': result.predictive,
+                    'corrective': result.corrective
+                },
+                'by_status': {
+                    'open': result.open,
+                    'in_progress': result.in_progress,
+                    'completed': result.completed
                 }
-            
-            # Update counts
-            stats_by_machine[machine_id]['total_work_orders'] += count
-            
-            if wo_type in stats_by_machine[machine_id]['by_type']:
-                stats_by_machine[machine_id]['by_type'][wo_type] += count
-            
-            if status in stats_by_machine[machine_id]['by_status']:
-                stats_by_machine[machine_id]['by_status'][status] += count
-        
-        return list(stats_by_machine.values())
\ No newline at end of file
+            })
+
+        return stats_by_machine
+
+    @staticmethod
+    def get_timeseries(level='machine', granularity='week', metrics=None, machine_id=None, subsystem_id=None,
+                       component_id=None, start_date=None, end_date=None):
+        """
+        Failures, downtime, work orders and operating hours per entity and period
+
+        Every bucket of every entity comes from one grouped query on the daily
+        rollups, with the hour counter deltas merged in by a UNION ALL.
+
+        Args:
+            level: Group by 'machine', 'subsystem' or 'component'
+            granularity: 'day', 'week' (from Monday) or 'month'
+            metrics: Subset of TIMESERIES_METRICS, all that apply when None. Operating
+                hours are only recorded per machine.
+
+        Returns:
+            Dict with the bucket start dates and one series per entity, with a point
+            for every bucket
+        """
+        if level not in TIMESERIES_LEVELS:
+            raise ValueError(f"Unknown level '{level}', expected one of {', '.join(TIMESERIES_LEVELS)}")
+        if granularity not in TIMESERIES_BUCKETS:
+            raise ValueError(f"Unknown granularity '{granularity}', expected one of {', '.join(TIMESERIES_BUCKETS)}")
+
+        hours_apply = level == 'machine' and not subsystem_id and not component_id
+        if metrics is None:
+            metrics = [metric for metric in TIMESERIES_METRICS if metric != 'hours' or hours_apply]
+        unknown = set(metrics) - set(TIMESERIES_METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        if 'hours' in metrics and not hours_apply:
+            raise ValueError("Operating hours are only recorded per machine")
+
+        R = ReliabilityDaily
+        sums = ['failures', 'minor', 'major', 'critical', 'downtime_hours', 'work_orders', 'open', 'in_progress',
+                'completed', 'preventive', 'predictive', 'corrective', 'operating_hours']
+        entity_column = {'machine': R.machine_id, 'subsystem': R.subsystem_id, 'component': R.component_id}[level]
+        rollups = select(
+            TIMESERIES_BUCKETS[granularity](R.day).label('bucket'),
+            entity_column.label('entity_id'),
+            R.failure_count.label('failures'),
+            R.failures_minor.label('minor'),
+            R.failures_major.label('major'),
+            R.failures_critical.label('critical'),
+            R.downtime_hours.label('downtime_hours'),
+            R.work_orders_total.label('work_orders'),
+            R.work_orders_open.label('open'),
+            R.work_orders_in_progress.label('in_progress'),
+            R.work_orders_completed.label('completed'),
+            R.work_orders_preventive.label('preventive'),
+            R.work_orders_predictive.label('predictive'),
+            R.work_orders_corrective.label('corrective'),
+            literal(0.0).label('operating_hours')
+        ).where(entity_column.isnot(None))
+
+        if machine_id:
+            rollups = rollups.where(R.machine_id == machine_id)
+        if subsystem_id:
+            rollups = rollups.where(R.subsystem_id == subsystem_id)
+        if component_id:
+            rollups = rollups.where(R.component_id == component_id)
+        if start_date:
+            rollups = rollups.where(R.day >= day_of(start_date))
+        if end_date:
+            rollups = rollups.where(R.day <= day_of(end_date))
+        source = rollups
+
+        if 'hours' in metrics:
+            H = MachineHoursDaily
+            hours = select(
+                TIMESERIES_BUCKETS[granularity](H.day).label('bucket'),
+                H.machine_id.label('entity_id'),
+                *(literal(0).label(name) for name in sums[:-1]),
+                H.hours.label('operating_hours')
+            )
+            if machine_id:
+                hours = hours.where(H.machine_id == machine_id)
+            if start_date:
+                hours = hours.where(H.day >= day_of(start_date))
+            if end_date:
+                hours = hours.where(H.day <= day_of(end_date))
+            source = union_all(rollups, hours)
+
+        source = source.subquery()
+        rows = db.session.execute(
+            select(
+                source.c.bucket,
+                source.c.entity_id,
+                *(func.sum(source.c[name]).label(name) for name in sums)
+            ).group_by(
+                source.c.bucket, source.c.entity_id
+            ).order_by(
+                source.c.entity_id, source.c.bucket
+            )
+        ).all()
+
+        # A point for every bucket of the range, so the series line up without gaps
+        days = [datetime.fromisoformat(row.bucket).date() for row in rows]
+        first = day_of(start_date) if start_date else min(days, default=None)
+        last = day_of(end_date) if end_date else max(days, default=None)
+        buckets = _bucket_range(first, last, granularity) if first and last else []
+
+        def empty_point():
+            return {name: 0 for name in sums}
+
+        values = {}
+        for row in rows:
+            values.setdefault(row.entity_id, {})[row.bucket] = {name: getattr(row, name) or 0 for name in sums}
+
+        entities = EntityLookup.for_level(level, list(values))
+        series = []
+        for entity_id, by_bucket in values.items():
+            entity = entities.entity(level, entity_id)
+            machine = entities.machine_of(level, entity_id)
+            points = []
+            for bucket in buckets:
+                totals = by_bucket.get(bucket) or empty_point()
+                point = {'bucket': bucket}
+                if 'failures' in metrics:
+                    point['failures'] = totals['failures']
+                    point['failures_by_severity'] = {
+                        'minor': totals['minor'],
+                        'major': totals['major'],
+                        'critical': totals['critical']
+                    }
+                if 'downtime' in metrics:
+                    point['downtime_hours'] = round(totals['downtime_hours'], 2)
+                if 'work_orders' in metrics:
+                    point['work_orders'] = {
+                        'total': totals['work_orders'],
+                        'by_status': {
+                            'open': totals['open'],
+                            'in_progress': totals['in_progress'],
+                            'completed': totals['completed']
+                        },
+                        'by_type': {
+                            'preventive': totals['preventive'],
+                            'predictive': totals['predictive'],
+                            'corrective': totals['corrective']
+                        }
+                    }
+                if 'hours' in metrics:
+                    point['operating_hours'] = round(totals['operating_hours'], 2)
+                points.append(point)
+
+            series.append({
+                'level': level,
+                'id': entity_id,
+                'name': entity.name if entity else None,
+                'technical_id': entity.technical_id if entity else None,
+                'machine_id': machine.id if machine else None,
+                'machine_name': machine.name if machine else None,
+                'points': points
+            })
+
+        return {
+            'level': level,
+            'granularity': granularity,
+            'metrics': list(metrics),
+            'buckets': buckets,
+            'series': series
+        }
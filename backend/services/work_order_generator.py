@@ -1,97 +1,248 @@
 """
 Work order generation service
 """
-from backend.models.machine import Machine, Component
+from backend.models.machine import Machine, Subsystem, Component
 from backend.models.work_order import WorkOrder
-from backend.models.rcm import RCMUnit, RCMFunction ,RCMFunctionalFailure, RCMMaintenance , RCMFailureEffect
+from backend.models.rcm import RCMUnit, RCMFunction ,RCMFunctionalFailure, RCMFailureMode, RCMMaintenance , RCMFailureEffect
 from backend.database import db
+from backend.services.query_counter import track_queries
+from backend.services import search_index
+from backend.services.due_state import DueStateService
+from backend.services.reliability_rollup import ReliabilityRollupService
+from sqlalchemy import and_, insert, or_, select
+from functools import wraps
 import logging
 from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
 
+# Statuses in which a generated order still counts as pending, per source
+OPEN_STATUSES = {
+    'hour_counter': ('open',),
+    'calendar': ('open',),
+    'rcm': ('open', 'in_progress')
+}
+
+# Orders for an RCM action come from the RCM generators and from the hour counter
+# engine, a pending order from either one covers the action
+RCM_ACTION_SOURCES = ('rcm', 'hour_counter')
+
+def _reported_run(fn):
+    """Log the number of orders created, queries issued and time taken by a generator run"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with track_queries() as stats:
+            created = fn(*args, **kwargs)
+        WorkOrderGenerator.last_run_stats[fn.__name__] = {'created': len(created), **stats.as_dict()}
+        logger.info(f"{fn.__name__}: {len(created)} work orders created, "
+                    f"{stats.queries} queries in {stats.duration_ms:.1f} ms")
+        return created
+    return wrapper
+
 class WorkOrderGenerator:
+    # Stats of the most recent run of each generator, see _reported_run
+    last_run_stats = {}
+
+    @staticmethod
+    def _open_order_keys(*sources, machine_id=None):
+        """
+        Keys of the pending orders from the given generation sources, fetched in one query
+
+        A key is (machine_id, component_id, rcm_maintenance_id), so a run can check
+        for an existing order with a set lookup instead of a query per candidate.
+        RCM orders from before rcm_maintenance_id was stored are keyed on their title.
+        """
+        query = db.session.query(
+            WorkOrder.machine_id,
+            WorkOrder.component_id,
+            WorkOrder.rcm_maintenance_id,
+            WorkOrder.title,
+            WorkOrder.generation_source
+        ).filter(
+            or_(*(and_(WorkOrder.generation_source == source, WorkOrder.status.in_(OPEN_STATUSES[source]))
+                  for source in sources))
+        )
+        if machine_id is not None:
+            query = query.filter(WorkOrder.machine_id == machine_id)
+
+        keys = set()
+        for row in query.all():
+            if row.generation_source == 'rcm' and row.rcm_maintenance_id is None:
+                keys.add((row.machine_id, 'title', row.title))
+            else:
+                keys.add((row.machine_id, row.component_id, row.rcm_maintenance_id))
+        return keys
+
+    @staticmethod
+    def _rcm_actions_for_machine(machine_id, hour_based_only=False):
+        """(maintenance, mode, functional failure, function, unit) rows for a machine, in one query"""
+        query = db.session.query(
+            RCMMaintenance,
+            RCMFailureMode,
+            RCMFunctionalFailure,
+            RCMFunction,
+            RCMUnit
+        ).join(
+            RCMFailureMode, RCMMaintenance.failure_mode_id == RCMFailureMode.id
+        ).join(
+            RCMFunctionalFailure, RCMFailureMode.functional_failure_id == RCMFunctionalFailure.id
+        ).join(
+            RCMFunction, RCMFunctionalFailure.function_id == RCMFunction.id
+        ).join(
+            RCMUnit, RCMFunction.unit_id == RCMUnit.id
+        ).filter(
+            RCMUnit.equipment_id == machine_id
+        )
+        if hour_based_only:
+            query = query.filter(RCMMaintenance.interval_hours > 0)
+        return query.all()
+    
+    @staticmethod
+    def _resolve_unit_targets(units, connection=None):
+        """
+        Map unit technical IDs to (subsystem_id, component_id), one IN query per level
+
+        "1077.01" is a subsystem and "1077.01.001" a component, other IDs map to the machine.
+        Pass a connection to use it from inside a flush, where the session can't be queried.
+        """
+        executor = connection if connection is not None else db.session
+        subsystem_tids = set()
+        component_tids = set()
+        for unit in units:
+            if not unit.technical_id:
+                continue
+            parts = unit.technical_id.split('.')
+            if len(parts) == 2:
+                subsystem_tids.add(unit.technical_id)
+            elif len(parts) == 3:
+                component_tids.add(unit.technical_id)
+        
+        targets = {}
+        if subsystem_tids:
+            rows = executor.execute(
+                select(Subsystem.id, Subsystem.technical_id).where(Subsystem.technical_id.in_(subsystem_tids))
+            ).all()
+            for row in rows:
+                targets[row.technical_id] = (row.id, None)
+        if component_tids:
+            rows = executor.execute(
+                select(Component.id, Component.subsystem_id, Component.technical_id)
+                .where(Component.technical_id.in_(component_tids))
+            ).all()
+            for row in rows:
+                targets[row.technical_id] = (row.subsystem_id, row.id)
+        return targets
+    
+    @staticmethod
+    def _work_order_type(maintenance_type):
+        """Work order type for an RCM maintenance type"""
+        if maintenance_type:
+            if 'predict' in maintenance_type.lower():
+                return 'predictive'
+            if 'correct' in maintenance_type.lower():
+                return 'corrective'
+        return 'preventive'
+    
     @staticmethod
+    def _insert_orders(rows):
+        """Insert the new orders (dicts of column values) with one multi-row INSERT, returns the WorkOrders"""
+        if not rows:
+            return []
+        
+        # Row order is not needed, which lets SQLite return the ids from a single statement
+        work_orders = db.session.scalars(insert(WorkOrder).returning(WorkOrder), rows).all()
+        
+        # A bulk insert skips the flush events that keep the search index and the rollups in sync
+        search_index.index_new_work_orders(db.session.connection(), work_orders)
+        ReliabilityRollupService.refresh(db.session.connection(), ReliabilityRollupService.work_order_keys(work_orders))
+        
+        ids = [wo.id for wo in work_orders]
+        db.session.commit()
+        
+        # Reload the expired orders in one query rather than one refresh per order
+        return WorkOrder.query.filter(WorkOrder.id.in_(ids)).order_by(WorkOrder.id).all()
+
+    @staticmethod
+    @_reported_run
     def generate_hour_based_orders():
-        """Generate work orders based on machine hour counters"""
+        """
+        Generate work orders based on machine hour counters
+
+        Readings sent through PUT /api/machines/<id>/hours are handled as they arrive
+        by HourThresholdEngine, this sweep only remains for counters set by other means.
+        """
         machines = Machine.query.all()
+        open_keys = WorkOrderGenerator._open_order_keys('hour_counter')
         work_orders_created = []
         
         for machine in machines:
             # Example threshold: create maintenance work order every 100 hours
             if machine.hour_counter and machine.hour_counter % 100 < 5:  # Within 5 hours of threshold
-                # Check if there's already an open work order for this machine based on hour counter
-                existing_order = WorkOrder.query.filter_by(
-                    machine_id=machine.id,
-                    status='open',
-                    generation_source='hour_counter'
-                ).first()
+                # Skip if there's already an open work order for this machine based on hour counter
+                key = (machine.id, None, None)
+                if key in open_keys:
+                    continue
+                open_keys.add(key)
                 
-                if not existing_order:
-                    work_order = WorkOrder(
-                        title=f"Regular maintenance for {machine.name} - {machine.hour_counter} hours",
-                        description=f"Perform regular maintenance after {machine.hour_counter} hours of operation.",
-                        due_date=datetime.now(timezone.utc) + timedelta(days=3),
-                        status='open',
-                        priority='normal',
-                        type='preventive',
-                        frequency= 'periodic',  # Added for mobile_app tabs
-                        category='regular_maintenance',
-                        machine_id=machine.id,
-                        generation_source='hour_counter',
-                        reason=f"Machine has reached {machine.hour_counter} operating hours"
-                    )
-                    
-                    db.session.add(work_order)
-                    work_orders_created.append(work_order)
-        
-        if work_orders_created:
-            db.session.commit()
+                work_orders_created.append(dict(
+                    title=f"Regular maintenance for {machine.name} - {machine.hour_counter} hours",
+                    description=f"Perform regular maintenance after {machine.hour_counter} hours of operation.",
+                    due_date=datetime.now(timezone.utc) + timedelta(days=3),
+                    status='open',
+                    priority='normal',
+                    type='preventive',
+                    frequency= 'periodic',  # Added for mobile_app tabs
+                    category='regular_maintenance',
+                    machine_id=machine.id,
+                    generation_source='hour_counter',
+                    reason=f"Machine has reached {machine.hour_counter} operating hours"
+                ))
         
-        return work_orders_created
+        return WorkOrderGenerator._insert_orders(work_orders_created)
     
     @staticmethod
+    @_reported_run
     def generate_calendar_based_orders():
         """Generate work orders based on calendar periods"""
         machines = Machine.query.all()
+        open_keys = WorkOrderGenerator._open_order_keys('calendar')
         work_orders_created = []
         
         current_date = datetime.now(timezone.utc)
         
         for machine in machines:
+            # Skip if there's already an open calendar-based work order
+            key = (machine.id, None, None)
+            if key in open_keys:
+                continue
+            
             # Example: monthly maintenance check
             if machine.last_maintenance:
-                days_since_maintenance = (current_date - machine.last_maintenance).days
+                # SQLite gives the stored UTC time back without tzinfo
+                last_maintenance = machine.last_maintenance
+                if last_maintenance.tzinfo is None:
+                    last_maintenance = last_maintenance.replace(tzinfo=timezone.utc)
+                days_since_maintenance = (current_date - last_maintenance).days
                 
                 # If more than 30 days since last maintenance
                 if days_since_maintenance >= 30:
-                    # Check if there's already an open calendar-based work order
-                    existing_order = WorkOrder.query.filter_by(
-                        machine_id=machine.id,
+                    work_orders_created.append(dict(
+                        title=f"Monthly maintenance for {machine.name}",
+                        description=f"Perform monthly maintenance check. Last maintenance: {machine.last_maintenance.strftime('%Y-%m-%d')}",
+                        due_date=current_date + timedelta(days=7),
                         status='open',
-                        generation_source='calendar'
-                    ).first()
-                    
-                    if not existing_order:
-                        work_order = WorkOrder(
-                            title=f"Monthly maintenance for {machine.name}",
-                            description=f"Perform monthly maintenance check. Last maintenance: {machine.last_maintenance.strftime('%Y-%m-%d')}",
-                            due_date=current_date + timedelta(days=7),
-                            status='open',
-                            priority='normal',
-                            type='preventive',
-                            frequency= 'periodic',  # Added for mobile_app tabs
-                            category='regular_inspection',
-                            machine_id=machine.id,
-                            generation_source='calendar',
-                            reason="Monthly maintenance schedule"
-                        )
-                        
-                        db.session.add(work_order)
-                        work_orders_created.append(work_order)
+                        priority='normal',
+                        type='preventive',
+                        frequency= 'periodic',  # Added for mobile_app tabs
+                        category='regular_inspection',
+                        machine_id=machine.id,
+                        generation_source='calendar',
+                        reason="Monthly maintenance schedule"
+                    ))
+                    open_keys.add(key)
             else:
                 # If no maintenance record exists, create initial inspection
-                work_order = WorkOrder(
+                work_orders_created.append(dict(
                     title=f"Initial inspection for {machine.name}",
                     description="Perform initial inspection and maintenance check.",
                     due_date=current_date + timedelta(days=3),
@@ -103,15 +254,63 @@ class WorkOrderGenerator:
                     machine_id=machine.id,
                     generation_source='calendar',
                     reason="No maintenance record exists"
-                )
-                
-                db.session.add(work_order)
-                work_orders_created.append(work_order)
+                ))
+                open_keys.add(key)
         
-        if work_orders_created:
-            db.session.commit()
+        return WorkOrderGenerator._insert_orders(work_orders_created)
+    
+    @staticmethod
+    @_reported_run
+    def generate_due_orders(horizon_days=7, maintenance_ids=None):
+        """
+        Generate orders for RCM actions that fall due, read from the maintenance due state
+
+        Args:
+            horizon_days: Create orders for actions due by date within this many days
+            maintenance_ids: Instead of the horizon, create orders for these actions if none is open
+        """
+        current_date = datetime.now(timezone.utc)
+        due_before = current_date + timedelta(days=horizon_days) if maintenance_ids is None else None
+        due = DueStateService.due_query(due_before=due_before, maintenance_ids=maintenance_ids).all()
         
-        return work_orders_created
+        open_keys = WorkOrderGenerator._open_order_keys(*RCM_ACTION_SOURCES)
+        work_orders_created = []
+        
+        for state, maint, machine in due:
+            key = (state.machine_id, state.component_id, maint.id)
+            if key in open_keys:
+                continue
+            open_keys.add(key)
+            
+            if state.next_due_at:
+                due_date = max(state.next_due_at.replace(tzinfo=timezone.utc), current_date)
+            elif maint.interval_hours:
+                # Estimate when the hours will be reached from the machine's expected usage
+                hours_per_day = (machine.expected_annual_usage or 8 * 365) / 365
+                hours_left = max((state.next_due_hours or 0) - (machine.hour_counter or 0), 0)
+                due_date = current_date + timedelta(days=hours_left / hours_per_day)
+            else:
+                due_date = current_date + timedelta(days=30)
+            
+            work_orders_created.append(dict(
+                title=f"{maint.title or 'Maintenance'} - {machine.name}",
+                description=f"{maint.description or maint.title}\n\nBased on RCM analysis for {machine.name}.",
+                due_date=due_date,
+                status='open',
+                priority='normal',
+                type=WorkOrderGenerator._work_order_type(maint.maintenance_type),
+                frequency='periodic',
+                category='rcm_maintenance',
+                machine_id=state.machine_id,
+                subsystem_id=state.subsystem_id,
+                component_id=state.component_id,
+                reason=f"Generated from RCM maintenance action. Maintenance ID: {maint.id}",
+                generation_source='rcm',
+                rcm_maintenance_id=maint.id,
+                tool_requirements=''
+            ))
+        
+        return WorkOrderGenerator._insert_orders(work_orders_created)
     
     @staticmethod
     def generate_from_deviation(machine_id, component_id, deviation_description, severity):
@@ -211,16 +410,10 @@ class WorkOrderGenerator:
         
         return work_orders_created
 
-    # In backend/services/work_order_generator.py, update the generate_from_rcm method:
-
     @staticmethod
+    @_reported_run
     def generate_from_rcm(equipment_id):
         """Generate work orders based on RCM analysis"""
-        from backend.models.machine import Machine, Subsystem, Component
-        from backend.models.work_order import WorkOrder
-        from backend.models.rcm import RCMMaintenance, RCMFailureMode, RCMFunctionalFailure, RCMFunction, RCMUnit
-        from datetime import datetime, timedelta, timezone
-        
         # Verify equipment exists
         machine = Machine.query.get(equipment_id)
         if not machine:
@@ -231,53 +424,21 @@ class WorkOrderGenerator:
         created_work_orders = []
         
         # Get all maintenance actions for this equipment through the RCM hierarchy
-        maintenance_actions = db.session.query(
-            RCMMaintenance,
-            RCMFailureMode,
-            RCMFunctionalFailure,
-            RCMFunction,
-            RCMUnit
-        ).join(
-            RCMFailureMode, RCMMaintenance.failure_mode_id == RCMFailureMode.id
-        ).join(
-            RCMFunctionalFailure, RCMFailureMode.functional_failure_id == RCMFunctionalFailure.id
-        ).join(
-            RCMFunction, RCMFunctionalFailure.function_id == RCMFunction.id
-        ).join(
-            RCMUnit, RCMFunction.unit_id == RCMUnit.id
-        ).filter(
-            RCMUnit.equipment_id == equipment_id
-        ).all()
+        maintenance_actions = WorkOrderGenerator._rcm_actions_for_machine(equipment_id)
         
         logger.info(f"Found {len(maintenance_actions)} maintenance actions for equipment {equipment_id}")
         
+        # Resolve every unit technical_id to its subsystem or component up front
+        targets = WorkOrderGenerator._resolve_unit_targets(unit for _, _, _, _, unit in maintenance_actions)
+        
+        open_keys = WorkOrderGenerator._open_order_keys(*RCM_ACTION_SOURCES, machine_id=equipment_id)
+        
         for maint, mode, failure, function, unit in maintenance_actions:
             try:
-            # Determine subsystem based on unit technical_id
-                subsystem_id = None
-                component_id = None
+                # Subsystem/component the unit's technical_id points at
+                subsystem_id, component_id = targets.get(unit.technical_id, (None, None))
                 
-                # Parse the unit technical_id to determine hierarchy level
-                if unit.technical_id:
-                    parts = unit.technical_id.split('.')
-                    if len(parts) == 2:  # This is a subsystem (e.g., "1077.01")
-                        # Find the subsystem with this technical_id
-                        subsystem = Subsystem.query.filter_by(technical_id=unit.technical_id).first()
-                        if subsystem:
-                            subsystem_id = subsystem.id
-                    elif len(parts) == 3:  # This is a component (e.g., "1077.01.001")
-                        # Find the component with this technical_id
-                        component = Component.query.filter_by(technical_id=unit.technical_id).first()
-                        if component:
-                            component_id = component.id
-                            subsystem_id = component.subsystem_id
-                # Determine work order type based on maintenance type
-                work_order_type = 'preventive'
-                if maint.maintenance_type:
-                    if 'predict' in maint.maintenance_type.lower():
-                        work_order_type = 'predictive'
-                    elif 'correct' in maint.maintenance_type.lower():
-                        work_order_type = 'corrective'
+                work_order_type = WorkOrderGenerator._work_order_type(maint.maintenance_type)
                 
                 # Determine due date based on intervals
                 due_date = datetime.now(timezone.utc) + timedelta(days=7)  # Default to a week
@@ -300,15 +461,11 @@ class WorkOrderGenerator:
                 description += f"Failure Mode: {mode.name}\n"
                 description += f"Action: {maint.description or maint.title}\n"
                 
-                # Check if a similar work order already exists and is still open
-                existing_order = WorkOrder.query.filter(
-                    WorkOrder.machine_id == equipment_id,
-                    WorkOrder.title == title,
-                    WorkOrder.status.in_(['open', 'in_progress']),
-                    WorkOrder.generation_source == 'rcm'
-                ).first()
+                # Check if an order for this action already exists and is still open
+                key = (equipment_id, component_id, maint.id)
+                legacy_key = (equipment_id, 'title', title)
                 
-                if not existing_order:
+                if key not in open_keys and legacy_key not in open_keys:
                     # Determine priority based on interval
                     priority = 'normal'
                     if maint.interval_days and maint.interval_days <= 7:
@@ -317,7 +474,7 @@ class WorkOrderGenerator:
                         priority = 'critical'
                     
                     # Create the work order
-                    work_order = WorkOrder(
+                    work_order = dict(
                         title=title,
                         description=description,
                         due_date=due_date,
@@ -331,11 +488,12 @@ class WorkOrderGenerator:
                         component_id=component_id, 
                         reason=f"RCM maintenance for: {mode.name}",
                         generation_source='rcm',
+                        rcm_maintenance_id=maint.id,
                         tool_requirements=''
                     )
                     
-                    db.session.add(work_order)
                     created_work_orders.append(work_order)
+                    open_keys.add(key)
                     
                     logger.info(f"Created work order: {title} (subsystem_id: {subsystem_id}, component_id: {component_id})")
                 else:
@@ -345,13 +503,10 @@ class WorkOrderGenerator:
                 logger.error(f"Error creating work order for maintenance action {maint.id}: {str(e)}")
                 continue
         
-        if created_work_orders:
-            db.session.commit()
-            logger.info(f"Successfully created {len(created_work_orders)} work orders")
-        else:
+        if not created_work_orders:
             logger.info("No new work orders created")
         
-        return created_work_orders
+        return WorkOrderGenerator._insert_orders(created_work_orders)
     """"
     @staticmethod
     def generate_from_rcm_analysis(machine_id, component_id, failure_mode, recommended_action, priority='normal'):
@@ -0,0 +1,175 @@
+"""
+Streaming Excel reader shared by the importers
+"""
+# pd.read_excel loads the whole sheet, and the importers used to call it two or
+# three times per upload (once to list sheets, once to find the header row, once
+# more to read the data). WorkbookReader opens the file a single time in
+# openpyxl's read-only mode, finds the sheet and header row from the first rows,
+# and hands out the rest as DataFrame chunks, so memory stays flat however long
+# the sheet is. Legacy .xls files, which openpyxl can't read, are loaded once
+# with pandas and served through the same interface.
+#
+# Batch imports parse several sheets at once with map_sheets. Parsing is pure
+# Python in openpyxl, so the sheets go to a process pool rather than threads.
+# The pool forks, spawned workers would re-run the server's startup on import;
+# where fork isn't available the sheets are parsed in threads instead.
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
+import pandas as pd
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# Rows parsed into each DataFrame handed to the importer
+DEFAULT_CHUNK_SIZE = 5000
+
+# Rows searched for the header row
+HEADER_SCAN_ROWS = 10
+
+def _column_names(header):
+    """Column names like pd.read_excel gives them: stripped, 'Unnamed: n' for blanks, '.1' for repeats"""
+    names = []
+    seen = {}
+    for index, value in enumerate(header):
+        name = str(value).strip() if value is not None and str(value).strip() != '' else f"Unnamed: {index}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+class SheetStream:
+    """The data rows of one sheet below its header row, read in chunks"""
+
+    def __init__(self, sheet_name, header_row, columns, rows):
+        self.sheet_name = sheet_name
+        self.header_row = header_row
+        self.columns = columns
+        self._rows = rows
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield DataFrames of up to chunk_size rows, skipping rows with no value at all"""
+        width = len(self.columns)
+        while True:
+            batch = [
+                tuple(row[:width]) + (None,) * (width - len(row))
+                for row in islice(self._rows, chunk_size)
+            ]
+            if not batch:
+                return
+            batch = [row for row in batch if any(value is not None and value != '' for value in row)]
+            if batch:
+                yield pd.DataFrame(batch, columns=self.columns)
+
+    def read_all(self):
+        """The whole sheet as one DataFrame, for small sheets"""
+        frames = list(self.chunks())
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.columns)
+
+class WorkbookReader:
+    """An Excel file opened once, read sheet by sheet as streams of rows"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._workbook = None
+        self._legacy = None
+        if str(file_path).lower().endswith('.xls'):
+            self._legacy = pd.ExcelFile(file_path)
+            self.sheet_names = self._legacy.sheet_names
+        else:
+            from openpyxl import load_workbook
+            self._workbook = load_workbook(file_path, read_only=True, data_only=True)
+            self.sheet_names = self._workbook.sheetnames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._legacy is not None:
+            self._legacy.close()
+            self._legacy = None
+
+    def find_sheet(self, keywords, preferred=()):
+        """
+        Name of the sheet to import
+
+        The first of preferred that exists, else the first sheet whose name contains
+        one of the keywords (case insensitive), else the first sheet.
+        """
+        for name in preferred:
+            if name in self.sheet_names:
+                return name
+        for name in self.sheet_names:
+            if any(keyword in name.lower() for keyword in keywords):
+                return name
+        return self.sheet_names[0] if self.sheet_names else None
+
+    def find_sheets(self, keywords):
+        """Names of all sheets whose name contains one of the keywords, the first sheet if none does"""
+        matching = [name for name in self.sheet_names if any(keyword in name.lower() for keyword in keywords)]
+        return matching or self.sheet_names[:1]
+
+    def _iter_rows(self, sheet_name):
+        if self._legacy is not None:
+            df = self._legacy.parse(sheet_name, header=None)
+            return (tuple(None if pd.isna(value) else value for value in row)
+                    for row in df.itertuples(index=False, name=None))
+        return self._workbook[sheet_name].iter_rows(values_only=True)
+
+    def open_sheet(self, sheet_name, header_keywords=(), default_header_row=0):
+        """
+        Stream a sheet, the header being the first of its first rows that contains
+        one of header_keywords (case insensitive), default_header_row if none does
+        """
+        rows = self._iter_rows(sheet_name)
+        head = list(islice(rows, HEADER_SCAN_ROWS))
+
+        header_row = None
+        for index, row in enumerate(head):
+            values = [str(value).lower() for value in row if value is not None]
+            if any(keyword in value for keyword in header_keywords for value in values):
+                header_row = index
+                break
+        if header_row is None:
+            if header_keywords:
+                logger.warning(f"Could not find header row in '{sheet_name}', defaulting to row {default_header_row}")
+            header_row = default_header_row
+
+        header = head[header_row] if header_row < len(head) else ()
+        columns = _column_names(header)
+        logger.info(f"Sheet '{sheet_name}': header on row {header_row}, columns {columns}")
+
+        return SheetStream(sheet_name, header_row, columns, chain(head[header_row + 1:], rows))
+
+def map_sheets(fn, tasks, processes=None):
+    """
+    Call fn(*task) for every task in parallel, returns the results in task order
+
+    fn must be a module level function and its arguments and result picklable.
+    processes defaults to the IMPORT_PARSE_PROCESSES setting.
+    """
+    tasks = list(tasks)
+    if processes is None:
+        configured = current_app.config.get('IMPORT_PARSE_PROCESSES') if has_app_context() else None
+        processes = configured or os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    if processes <= 1:
+        return [fn(*task) for task in tasks]
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'))
+    else:
+        executor = ThreadPoolExecutor(max_workers=processes)
+    with executor:
+        return list(executor.map(fn, *zip(*tasks)))
@@ -0,0 +1,62 @@
+// frontend/web_app/src/services/importJobs.js
+// Excel and RCM imports run as background jobs on the server. The upload answers
+// 202 with a job id, these helpers poll the job until it has finished.
+const API_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:5000/api';
+
+const POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Fetch the current state of an import job
+export const fetchImportJob = async (jobId) => {
+  const token = localStorage.getItem('token');
+  const response = await fetch(`${API_URL}/imports/${jobId}`, {
+    headers: { 'Authorization': `Bearer ${token}` }
+  });
+
+  if (!response.ok) {
+    let errorMessage = `Could not read import job: ${response.status} ${response.statusText}`;
+    try {
+      const errorData = await response.json();
+      errorMessage = errorData.message || errorMessage;
+    } catch (e) {
+      // Keep the status text
+    }
+    throw new Error(errorMessage);
+  }
+
+  const data = await response.json();
+  return data.job;
+};
+
+// Poll a job until it completes, resolves with the importer's result
+// onProgress(job) is called after every poll with rows_parsed / objects_created
+export const waitForImportJob = async (jobId, onProgress = null) => {
+  for (;;) {
+    const job = await fetchImportJob(jobId);
+    if (onProgress) {
+      onProgress(job);
+    }
+
+    if (job.status === 'completed') {
+      const result = job.result || {};
+      // Same shape the upload endpoints returned before they ran in the background
+      return {
+        ...result,
+        message: job.message,
+        imported: result.imported || result.stats || {},
+        job
+      };
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.message || 'Import failed');
+    }
+
+    await sleep(POLL_INTERVAL_MS);
+  }
+};
+
+export default {
+  fetchImportJob,
+  waitForImportJob
+};
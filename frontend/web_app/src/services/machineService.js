@@ -1,5 +1,6 @@
 // frontend/web_app/src/services/machineService.js
 import axios from 'axios';
+import { waitForImportJob } from './importJobs';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:5000/api';
 
@@ -208,10 +209,11 @@ export const uploadComponentStructure = async (formData) => {
       }
     });
     
-    return response.data;
+    // The import runs in the background, wait for it to finish
+    return await waitForImportJob(response.data.job_id);
   } catch (error) {
     console.error('Error uploading component structure:', error);
-    throw new Error(error.response?.data?.message || 'Failed to upload component structure');
+    throw new Error(error.response?.data?.message || error.message || 'Failed to upload component structure');
   }
 };
 
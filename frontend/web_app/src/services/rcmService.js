@@ -1,5 +1,6 @@
 // frontend/web_app/src/services/rcmService.js - FIXED VERSION
 import axios from 'axios';
+import { waitForImportJob } from './importJobs';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:5000/api';
 
@@ -143,8 +144,12 @@ export const uploadRCMExcel = async (formData) => {
     }
     
     const data = await response.json();
-    console.log('Upload successful:', data);
-    return data;
+    console.log('Upload accepted, import job:', data.job_id);
+    
+    // The import runs in the background, wait for it to finish
+    const result = await waitForImportJob(data.job_id);
+    console.log('Import finished:', result);
+    return result;
   } catch (error) {
     console.error('Error uploading RCM Excel:', error);
     throw error; // Re-throw the error to be handled by the caller
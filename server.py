@@ -68,6 +68,15 @@ if __name__ == '__main__':
             db.session.commit()
             
             print("Test users created successfully!")
+        
+        # Imports still queued or running when the server last stopped will never finish
+        from backend.services.import_jobs import import_jobs
+        interrupted = import_jobs.fail_interrupted()
+        if interrupted:
+            print(f"Marked {interrupted} interrupted import jobs as failed")
+        removed = import_jobs.collect_upload_files()
+        if removed:
+            print(f"Removed {removed} uploaded import files no job needs anymore")
     
     # Only run the app once, with all configurations here
     app.run(